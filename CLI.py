@@ -1,6 +1,9 @@
 import requests
 import sys
 import os
+import base64
+import json
+import time
 from typing import List
 from textwrap import wrap
 from tabulate import tabulate
@@ -8,6 +11,13 @@ import click
 
 BASE_URL = "http://localhost:8000"
 MAX_COL_WIDTH = 10
+# number of expenses requested per page from the list endpoints
+PAGE_SIZE = 100
+# list and detail responses kept with their ETag, sent back in If-None-Match so an unchanged list is not downloaded again
+RESPONSE_CACHE_FILE = "response_cache.json"
+RESPONSE_CACHE_ENTRIES = 200
+# the access token is renewed with the refresh token when it expires within this many seconds
+REFRESH_MARGIN_SECONDS = 60
 # input params
 class UserLogin:
     def __init__(self, username:str, password:str):
@@ -41,22 +51,70 @@ def save_token_to_file(token):
     except Exception as e:
         print(f"Failed to save token to file: {e}")
         
+def save_refresh_token_to_file(token):
+    """
+    Saves the refresh token to a local file named 'refresh_token.txt'.
+    """
+    try:
+        with open("refresh_token.txt", "w") as f:
+            f.write(token)
+    except Exception as e:
+        print(f"Failed to save refresh token to file: {e}")
+
+def token_expires_at(token):
+    """
+    the exp claim of a token, read without verifying it (the server does that), None when it can not be read
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+    except (IndexError, ValueError):
+        return None
+
+def refresh_auth_token():
+    """
+    trades the saved refresh token for a new access token and refresh token, returns the access token or None
+    """
+    if not os.path.exists('refresh_token.txt'):
+        return None
+    with open('refresh_token.txt', 'r') as file:
+        refresh_token = file.readline()
+    try:
+        response = requests.post(BASE_URL + '/token/refresh', json={"refresh_token": refresh_token})
+    except requests.exceptions.ConnectionError:
+        return None
+    if response.status_code != 200:
+        # the session ended or was logged out, the user has to log in again
+        if response.status_code == 401:
+            os.remove('refresh_token.txt')
+        return None
+    response_data = response.json()
+    with open("bearer_token.txt", "w") as f:
+        f.write(response_data["access_token"])
+    save_refresh_token_to_file(response_data["refresh_token"])
+    return response_data["access_token"]
+
 def get_auth_token():
     if os.path.exists('bearer_token.txt'):
         with open('bearer_token.txt', 'r') as file:
             token = file.readline()
-            return token
+        # an access token that is about to expire is renewed first, so the user does not have to log in again
+        exp = token_expires_at(token)
+        if exp is not None and exp - time.time() < REFRESH_MARGIN_SECONDS:
+            token = refresh_auth_token() or token
+        return token
     else:
         print("Token file does not exist!")
         raise FileNotFoundError
     
-def logout_user():
+def logout_user(everywhere=False):
     """
     Method to log out a user
-    this goes to the method post/logout
+    this goes to the method post/logout (or post/logout/all to end every session of the user)
     additionally this will delete the token saved locally and black list it
     """
-    url = BASE_URL + '/logout/'
+    url = BASE_URL + ('/logout/all' if everywhere else '/logout/')
     try:
         token = get_auth_token()
     except FileNotFoundError:
@@ -78,6 +136,12 @@ def logout_user():
                 print(f"Deleted token file: {file_path}")
             else:
                 print(f"Attempted to delete token file, but it was not found: {file_path}")
+            # the refresh token was revoked along with the session
+            if os.path.exists('refresh_token.txt'):
+                os.remove('refresh_token.txt')
+            # the cached responses belong to the user that logged out
+            if os.path.exists(RESPONSE_CACHE_FILE):
+                os.remove(RESPONSE_CACHE_FILE)
     
         else:
             print(f"\nFailed to logout with status code:{response.status_code}")
@@ -115,6 +179,8 @@ def login_user(user: UserLogin):
             if token:
                 print("Received auth token from server, saving this access locally...")
                 save_token_to_file(token)
+            if response_data.get("refresh_token"):
+                save_refresh_token_to_file(response_data["refresh_token"])
 
         else:
             print(f"\nLogin failed with status code: {response.status_code}")
@@ -129,7 +195,73 @@ def login_user(user: UserLogin):
         # Catch any other potential errors.
         print(f"\nAn unexpected error occurred: {e}")
 
-def get_my_expenses(eid: None|ExpenseId = None) :
+def load_response_cache():
+    if os.path.exists(RESPONSE_CACHE_FILE):
+        try:
+            with open(RESPONSE_CACHE_FILE, "r") as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+def save_response_cache(cache):
+    # only the most recently stored responses are kept (dicts keep insertion order)
+    while len(cache) > RESPONSE_CACHE_ENTRIES:
+        del cache[next(iter(cache))]
+    try:
+        with open(RESPONSE_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Failed to save the response cache: {e}")
+
+def conditional_get(url, headers, params=None):
+    """
+    GET that sends the ETag of the cached copy of this url, on 304 Not Modified the cached body is used
+    returns the response, the json body (None if the request failed) and the X-Next-Cursor of the response
+    """
+    cache = load_response_cache()
+    key = requests.Request("GET", url, params=params).prepare().url
+    cached = cache.get(key)
+    request_headers = dict(headers)
+    if cached:
+        request_headers["If-None-Match"] = cached["etag"]
+    
+    response = requests.get(url, headers=request_headers, params=params)
+    if response.status_code == 304 and cached:
+        return response, cached["body"], cached.get("next_cursor")
+    if response.status_code != 200:
+        return response, None, None
+    
+    body = response.json()
+    next_cursor = response.headers.get("X-Next-Cursor")
+    etag = response.headers.get("ETag")
+    if etag:
+        cache.pop(key, None)
+        cache[key] = {"etag": etag, "body": body, "next_cursor": next_cursor}
+        save_response_cache(cache)
+    return response, body, next_cursor
+
+def get_all_pages(url, headers, filters=None):
+    """
+    Fetches every page of a paginated list endpoint by following the X-Next-Cursor header.
+    filters are extra query parameters (status, sort, ...) that are sent with every page
+    returns the last response along with all the items, items is None if a page could not be fetched
+    """
+    items = []
+    params = dict(filters or {})
+    params["limit"] = PAGE_SIZE
+    while True:
+        response, page, next_cursor = conditional_get(url, headers, params)
+        if page is None:
+            return response, None
+        
+        items.extend(page)
+        
+        if not next_cursor:
+            return response, items
+        params["cursor"] = next_cursor
+
+def get_my_expenses(eid: None|ExpenseId = None, filters: None|dict = None) :
     try:
         token = get_auth_token()
     except FileNotFoundError:
@@ -144,13 +276,16 @@ def get_my_expenses(eid: None|ExpenseId = None) :
     
     try:
         print("Attempting to get the expense(s) you created...")
-        response = requests.get(url, headers=headers)
+        if eid != None:
+            response, response_data, _ = conditional_get(url, headers)
+        else:
+            # the list is paginated, so we keep following the cursor until the last page
+            response, response_data = get_all_pages(url, headers, filters)
         
-        if response.status_code == 200:
+        # 304 means our cached copy is still current
+        if response_data is not None:
             # print("\nSuccessfully got expenses!")
             
-            response_data = response.json()
-            
             return response_data
             # pretty_print_expense(response_data)
     
@@ -273,7 +408,7 @@ def delete_expense(eid: ExpenseId):
         # Catch any other potential errors.
         print(f"\nAn unexpected error occurred: {e}")
 
-def get_my_approvals(eid: None | ExpenseId=None):
+def get_my_approvals(eid: None | ExpenseId=None, filters: None | dict = None):
     try:
         token = get_auth_token()
     except FileNotFoundError:
@@ -287,14 +422,16 @@ def get_my_approvals(eid: None | ExpenseId=None):
     headers = {"Authorization": f"Bearer {token}"}
     
     try:
-
-        response = requests.get(url, headers=headers)
+        if eid != None:
+            response, response_data, _ = conditional_get(url, headers)
+        else:
+            # the list is paginated, so we keep following the cursor until the last page
+            response, response_data = get_all_pages(url, headers, filters)
         
-        if response.status_code == 200:
+        # 304 means our cached copy is still current
+        if response_data is not None:
             print("\nSuccessfully got your Approvals!")
             
-            response_data = response.json()
-            
             return response_data
     
         else:
@@ -430,19 +567,36 @@ def login(username, password):
     login_user(user)
 
 @cli.command()
-def logout():
+@click.option('--all', 'everywhere', is_flag=True, help='Log out of every session, on every device.')
+def logout(everywhere):
     """Allows you to log out of the EMS"""
-    logout_user()
+    logout_user(everywhere)
+
+def list_filters(status, sort):
+    """
+    builds the query parameters for the list endpoints from the command options, the server does the filtering
+    """
+    filters = {}
+    if status:
+        filters["status"] = list(status)
+    if sort:
+        filters["sort"] = sort
+    return filters
+
+STATUS_CHOICES = click.Choice(["draft", "submitted", "accepted", "rejected"])
+SORT_CHOICES = click.Choice(["-created_at", "created_at", "-amount", "amount"])
 
 # command to get my expenses
 @cli.command()
 @click.option('--expense_id', '-e', type=str, help='Optional: View a specific expense by ID.')
-def myexpenses(expense_id):
+@click.option('--status', '-s', type=STATUS_CHOICES, multiple=True, help='Optional: Only list expenses in this state, can be repeated.')
+@click.option('--sort', type=SORT_CHOICES, help='Optional: Sort key, prefix with - for descending (default -created_at).')
+def myexpenses(expense_id, status, sort):
     """List your created expenses."""
     if expense_id:
         expense_id = ExpenseId(expense_id)
         pretty_print_expense(get_my_expenses(expense_id))
-    else: pretty_print_expense(get_my_expenses())
+    else: pretty_print_expense(get_my_expenses(filters=list_filters(status, sort)))
 
 @cli.command()
 @click.option('--title', '-t', type=str, required = True, help='title of the expense you need to create.' )
@@ -477,12 +631,14 @@ def deletexpense(expense_id):
 
 @cli.command()
 @click.option('--expense_id', '-e', type=str, help='Optional: View a specific approval request by ID.')
-def myapprovals(expense_id):
+@click.option('--status', '-s', type=STATUS_CHOICES, multiple=True, help='Optional: Only list expenses in this state, can be repeated.')
+@click.option('--sort', type=SORT_CHOICES, help='Optional: Sort key, prefix with - for descending (default -created_at).')
+def myapprovals(expense_id, status, sort):
     """Lists expenses awaiting your approval."""
     if expense_id:
         expense_id = ExpenseId(expense_id)
         pretty_print_expense(get_my_approvals(expense_id))
-    else: pretty_print_expense(get_my_approvals())
+    else: pretty_print_expense(get_my_approvals(filters=list_filters(status, sort)))
     
 # Approve expense command
 @cli.command()
@@ -9,6 +9,13 @@ class UserLogin(BaseModel):
     """
     username: str
     password: str
+
+
+class TokenRefresh(BaseModel):
+    """
+    Schema for the refresh request body.
+    """
+    refresh_token: str
     
 class ExpenseOut(BaseModel):
     """
@@ -0,0 +1,106 @@
+"""
+a circuit breaker for calls to a service that can get slow or go away (redis in the auth path).
+every call gets a time budget. after failure_threshold failed or too slow calls in a row the breaker opens and calls fail
+straight away for reset_timeout seconds, instead of every request waiting for the service's worst case.
+after that one trial call is let through: if it succeeds the breaker closes again, if not it stays open for another reset_timeout.
+"""
+import asyncio
+import time
+
+from . import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    raised instead of making a call while the breaker is open
+    """
+
+
+class CircuitBreaker:
+    """
+    wraps async calls, the state and the call latencies are reported to metrics under name
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 call_timeout: float = 0.25, slow_call_threshold: float | None = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        # a call that succeeds but takes longer than this counts as a failure, by default only timeouts do
+        self.slow_call_threshold = slow_call_threshold
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        metrics.set_gauge(f"{name}_circuit_state", CLOSED)
+
+    def allow(self) -> bool:
+        """
+        whether a call may go through now
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._trial_running:
+            # only one trial call at a time, the other callers keep failing fast until it is back
+            self._trial_running = True
+            return True
+        return False
+
+    async def call(self, fn, *args, **kwargs):
+        """
+        awaits fn(*args, **kwargs) within the time budget, raises CircuitOpenError without calling fn while the breaker is open
+        """
+        if not self.allow():
+            metrics.increment(f"{self.name}_circuit_rejected")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        trial = self.state == HALF_OPEN
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), self.call_timeout)
+        except asyncio.TimeoutError:
+            metrics.increment(f"{self.name}_call_timeouts")
+            self._record(start, failed=True)
+            raise
+        except Exception:
+            metrics.increment(f"{self.name}_call_failures")
+            self._record(start, failed=True)
+            raise
+        except BaseException:
+            # cancelled (the client went away) says nothing about the service. a closed breaker does not count it,
+            # but a trial that did not finish counts as failed, otherwise the breaker would wait for it forever
+            if trial:
+                self._record(start, failed=True)
+            raise
+        elapsed = time.monotonic() - start
+        slow = self.slow_call_threshold is not None and elapsed > self.slow_call_threshold
+        if slow:
+            metrics.increment(f"{self.name}_slow_calls")
+        self._record(start, failed=slow)
+        return result
+
+    def _record(self, start: float, failed: bool):
+        metrics.observe(f"{self.name}_call_ms", (time.monotonic() - start) * 1000)
+        self._trial_running = False
+        if not failed:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                metrics.increment(f"{self.name}_circuit_opened")
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_gauge(f"{self.name}_circuit_state", state)
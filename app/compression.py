@@ -0,0 +1,171 @@
+"""
+compression of response bodies, negotiated with the Accept-Encoding header of the request.
+expense lists are long and repetitive (the same descriptions, field names and ids over and over) and shrink several times,
+which matters most for the offices on slow links.
+gzip is always available, zstd and brotli are used when the zstandard or brotli package is installed and the client accepts them.
+
+ - a body below COMPRESSION_MIN_SIZE is sent as is, compressing it costs more time than sending the few bytes saved
+ - a body from COMPRESSION_THREADPOOL_SIZE on is compressed in the thread pool, so the event loop keeps serving other requests
+ - a body that does not get smaller, a streamed body and one that is already encoded are sent as is
+the bytes before and after and the CPU time spent are recorded per route on /metrics,
+to see for which routes compression pays off.
+"""
+import gzip
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# levels that compress well without taking long, the highest levels cost a lot more CPU for a few percent
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# content types that are already compressed or are streamed
+SKIPPED_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "text/event-stream")
+
+
+def _gzip(body: bytes) -> bytes:
+    # mtime 0, so the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_QUALITY)
+
+
+def _zstd(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+# encoding -> compress function, in the order the server prefers them when the client likes them equally
+ENCODINGS = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = _zstd
+if brotli is not None:
+    ENCODINGS["br"] = _brotli
+ENCODINGS["gzip"] = _gzip
+
+
+def choose_encoding(accept_encoding: str, available=ENCODINGS):
+    """
+    the encoding to use for an Accept-Encoding header, e.g. "gzip, br;q=0.9", None when the body is sent as is
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best = None
+    best_weight = 0.0
+    for name in available:
+        weight = weights.get(name, weights.get("*", 0.0))
+        # a later encoding only wins with a higher weight, so ties go to the server's preference
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compress(encoding: str, body: bytes):
+    """
+    the compressed body and the CPU milliseconds it took, measured on the thread that did the work
+    """
+    start = time.thread_time()
+    compressed = ENCODINGS[encoding](body)
+    return compressed, (time.thread_time() - start) * 1000
+
+
+class CompressionMiddleware:
+    """
+    asgi middleware that compresses the body of a response sent in one piece, which is how the endpoints here send them
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, threadpool_size: int = 65536):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                # held back until the body shows whether it gets compressed, the headers depend on it
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            passthrough = True
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            route = scope.get("route")
+            route = route.path if route is not None else scope["path"]
+
+            if (message.get("more_body", False) or "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(SKIPPED_CONTENT_TYPES)):
+                await send(start_message)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) < self.minimum_size:
+                metrics.increment("compression_skipped_small")
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= self.threadpool_size:
+                compressed, cpu_ms = await run_in_threadpool(compress, encoding, body)
+            else:
+                compressed, cpu_ms = compress(encoding, body)
+
+            metrics.observe(f"compression_cpu_ms:{route}", cpu_ms)
+            metrics.increment(f"compression_bytes_in:{route}", len(body))
+            if len(compressed) >= len(body):
+                metrics.increment(f"compression_bytes_out:{route}", len(body))
+                await send(start_message)
+                await send(message)
+                return
+
+            metrics.increment(f"compression_bytes_out:{route}", len(compressed))
+            metrics.increment(f"compressed_responses:{encoding}")
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,82 @@
+"""
+conditional GETs for the expense read endpoints.
+every response carries an ETag, a client that sends it back in If-None-Match gets an empty 304 Not Modified
+when nothing changed, instead of the whole list again.
+
+a list's ETag comes from a version counter per list (the expenses a user created, or has to approve) in the
+list_version table. every write to an expense bumps the counters of its creator and its approver in the same
+transaction, so the version is read with one primary key lookup before the list query runs, and a 304 skips the query
+and the serialization altogether. the ETag also covers the path and query string, since each page and filter of the
+same list is its own response.
+a single expense's ETag is a hash of the (usually cached) expense itself.
+"""
+import hashlib
+import json
+
+from fastapi import Request, Response
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import metrics, queries
+from .model import ListVersion
+
+CREATOR = "creator"
+APPROVER = "approver"
+
+
+def list_key(scope: str, user_id: str) -> str:
+    return f"{scope}:{user_id}"
+
+
+async def get_list_version(db: AsyncSession, scope: str, user_id: str) -> int:
+    """
+    the current version of a list, 0 when nothing was written to it yet
+    """
+    version = (await db.scalars(queries.LIST_VERSION_BY_KEY, {"key": list_key(scope, user_id)})).first()
+    return version or 0
+
+
+async def bump_list_versions(db: AsyncSession, expense):
+    """
+    bumps the lists an expense is on, in the transaction of the write (the caller commits)
+    """
+    # sqlite and postgres share the upsert syntax, the first bump of a list creates its row
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    for key in (list_key(CREATOR, expense.creator_id), list_key(APPROVER, expense.approver_id)):
+        stmt = insert(ListVersion).values(key=key, version=1)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[ListVersion.key],
+            set_={"version": ListVersion.version + 1}
+        ))
+
+
+def _tag(request: Request, *parts) -> str:
+    # weak, the same content may be sent with a different encoding or field order
+    digest = hashlib.sha1(f"{request.url.path}?{request.url.query}".encode())
+    for part in parts:
+        digest.update(b"\0" + str(part).encode())
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def list_etag(request: Request, scope: str, user_id: str, version: int) -> str:
+    return _tag(request, scope, user_id, version)
+
+
+def expense_etag(request: Request, expense: dict) -> str:
+    return _tag(request, json.dumps(expense, sort_keys=True))
+
+
+def not_modified(request: Request, etag: str):
+    """
+    an empty 304 response when the client's If-None-Match has the etag, None when the full response has to be sent
+    """
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    # weak comparison, so W/"x" and "x" match
+    sent = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if "*" in sent or etag.removeprefix("W/") in sent:
+        metrics.increment("not_modified_responses")
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
@@ -1,16 +1,87 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from .model import Base, User, Expense, StatusEnum
+from .migrations import run_migrations
+from .id_allocator import HiLoAllocator
+from .db_retry import is_locked_error
+from .passwords import hash_password
+from . import metrics
+from .config import (
+    DB_URL, ASYNC_DB_URL, DB_ECHO, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE,
+    EXPENSE_ID_BLOCK_SIZE
+)
 from datetime import datetime, timedelta, timezone
 
 
-# setting up DB connection string, this defines the path of SQL server that we have access to
-# the URL specicifies the use of sqlite db
-DB_URL = "sqlite:///./mydatabase.db"
+# the DB connection string comes from config.py (DB_URL environment variable), by default a sqlite file next to the app
+
+
+def engine_options(url) -> dict:
+    """
+    keyword arguments for create_engine, the pool settings only apply to dbs that use a real connection pool
+    """
+    url = make_url(url)
+    options = {"echo": DB_ECHO}
+    
+    # in-memory sqlite lives inside a single connection, so there is no pool to size
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+# async drivers used for the async engine when ASYNC_DB_URL is not set
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def async_url_for(url) -> str:
+    """
+    turns a sync DB URL into the same URL with an async driver, e.g. sqlite:///./mydatabase.db -> sqlite+aiosqlite:///./mydatabase.db
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for '{backend}', please set ASYNC_DB_URL")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def configure_engine(engine):
+    """
+    registers the connection hooks on an engine: sqlite pragmas on every new connection and counting of "database is locked" errors
+    """
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # busy_timeout goes first so the journal mode switch itself waits on a locked db instead of failing
+            cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA cache_size={int(SQLITE_CACHE_SIZE)}")
+            cursor.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+            cursor.close()
+    
+    @event.listens_for(engine, "handle_error")
+    def count_locked_errors(context):
+        if is_locked_error(context.sqlalchemy_exception):
+            metrics.increment("db_locked_errors")
+
 
 # creating an SQL alchemy engine
 # the engine is what actually allows to communicate b/w python and SQL db
-engine = create_engine(DB_URL, echo=False)
+engine = create_engine(DB_URL, **engine_options(DB_URL))
+configure_engine(engine)
 
 # creating a session generator
 # this method would allow us to start sessions, the benefit of starting sessions is that if an error occures mid execution, we can always rollback.
@@ -18,6 +89,19 @@ SessionLocal = sessionmaker(autoflush=False, autocommit = False, bind=engine)
 # when autocomit is set to False, it prevents the action to acually change a db, only session.commit() will retain the changes done during execution
 # autoflush prevents the pending changes that need to be commited into the logs
 
+# the async engine talks to the same db, it is used by the async endpoints so a request does not hold a worker thread while it waits on the db
+ASYNC_DB_URL = ASYNC_DB_URL or async_url_for(DB_URL)
+async_engine = create_async_engine(ASYNC_DB_URL, **engine_options(ASYNC_DB_URL))
+# the hooks are registered on the sync engine that the async engine wraps
+configure_engine(async_engine.sync_engine)
+
+# expire_on_commit is off because reading an expired attribute would need a db round trip, which is not allowed outside of an await
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# hands out expense ids in blocks reserved from the id_sequence table, see id_allocator.py
+expense_id_allocator = HiLoAllocator(engine, sequence="expense", prefix="EID", id_column=Expense.expense_id,
+                                     block_size=EXPENSE_ID_BLOCK_SIZE, async_engine=async_engine)
+
 
 # initializing the db, this allows us to work with predefined tables using the sql connection
 def init_db():
@@ -27,6 +111,8 @@ def init_db():
     # the below line checks if tables exists that follow schema specified in model.py
     # else this creates blank tables that follow the schema defined in model.py, if it is not already exists
     Base.metadata.create_all(bind=engine)
+    # create_all never changes tables that already exist, the migrations bring an existing db up to the current schema
+    run_migrations(engine)
     
 def get_db():
     """
@@ -38,6 +124,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """
+    async version of get_db, yields an AsyncSession that is closed once the calling method has executed.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def add_dummy_users():
     """
     allows to add dummy users to the db
@@ -51,11 +144,12 @@ def add_dummy_users():
             return
 
         print("Adding dummy users...")
+        # every dummy user has the password "password", stored hashed (each with its own salt) like a real one
         users_to_add = [
-            User(user_id="UID01", username="patson", name="Patson", password="password", department_id=1, is_approver=True),
-            User(user_id="UID02", username="jane_doe", name="Jane Doe", password="password", department_id=2, is_approver=False),
-            User(user_id="UID03", username="john_smith", name="John Smith", password="password", department_id=1, is_approver=False),
-            User(user_id="UID04", username="adam_sandler", name="Adam Sandler", password="password", department_id=2, is_approver=True)
+            User(user_id="UID01", username="patson", name="Patson", password=hash_password("password"), department_id=1, is_approver=True),
+            User(user_id="UID02", username="jane_doe", name="Jane Doe", password=hash_password("password"), department_id=2, is_approver=False),
+            User(user_id="UID03", username="john_smith", name="John Smith", password=hash_password("password"), department_id=1, is_approver=False),
+            User(user_id="UID04", username="adam_sandler", name="Adam Sandler", password=hash_password("password"), department_id=2, is_approver=True)
         ]
         
         db.add_all(users_to_add)
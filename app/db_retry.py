@@ -0,0 +1,52 @@
+"""
+retrying short writes that fail with sqlite's "database is locked".
+with busy_timeout set this only happens when a writer held the lock for longer than the timeout,
+every occurrence and every retry is counted in metrics so lock contention shows up on GET /metrics
+"""
+import asyncio
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from . import metrics
+from .config import DB_LOCKED_RETRIES, DB_LOCKED_RETRY_BACKOFF_MS
+
+
+def is_locked_error(exc: BaseException) -> bool:
+    """
+    True when the error is sqlite's "database is locked" (or "database table is locked")
+    """
+    return isinstance(exc, OperationalError) and "is locked" in str(exc.orig)
+
+
+def retry_on_locked(fn, retries: int = DB_LOCKED_RETRIES, backoff_ms: int = DB_LOCKED_RETRY_BACKOFF_MS):
+    """
+    calls fn() and calls it again when it fails with "database is locked", waiting a little longer before each try.
+    fn has to be a complete unit of work (its own transaction) so running it again is safe
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except OperationalError as e:
+            if not is_locked_error(e) or attempt >= retries:
+                raise
+            attempt += 1
+            metrics.increment("db_locked_retries")
+            time.sleep(backoff_ms * attempt / 1000)
+
+
+async def retry_on_locked_async(fn, retries: int = DB_LOCKED_RETRIES, backoff_ms: int = DB_LOCKED_RETRY_BACKOFF_MS):
+    """
+    same as retry_on_locked for a coroutine function, the wait between tries does not block the event loop
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except OperationalError as e:
+            if not is_locked_error(e) or attempt >= retries:
+                raise
+            attempt += 1
+            metrics.increment("db_locked_retries")
+            await asyncio.sleep(backoff_ms * attempt / 1000)
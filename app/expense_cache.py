@@ -0,0 +1,306 @@
+"""
+a read cache of single expenses for the detail endpoints, keyed by expense_id.
+an expense changes a handful of times in its life (created, submitted, approved or rejected, deleted) but its detail
+is polled much more often, so repeated views are answered from the cache instead of the db.
+
+two tiers:
+ - an LRU in the worker, a dictionary lookup
+ - redis, shared by every worker, so a view on one worker fills the cache of all of them
+every write in main.py updates the entry in both tiers (write-through) or drops it (delete), and publishes the
+expense_id on a pub/sub channel so the other workers drop their local copy. while this worker is not subscribed
+(starting, or the connection to redis was lost) it can miss those messages, so its local tier is not used until it is
+subscribed again. when redis can not answer the cache steps aside and the endpoints read the db.
+a read that missed takes generation() before it reads the db, and fill() leaves the local tier alone when the expense
+was written (here or by another worker) since then, so a row read just before a write never replaces what the write stored.
+a deleted expense is not just dropped from redis, its key is set to a tombstone for tombstone_ttl seconds: the fill of a
+row read before the delete is only stored where there is no key, so it can not bring the expense back for every worker.
+an entry holds every field of the expense and the endpoint checks the creator or approver itself, so one entry serves both.
+"""
+import asyncio
+import enum
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from redis.exceptions import RedisError
+
+from . import metrics
+from .circuit_breaker import CircuitBreaker
+from .projection import EXPENSE_FIELDS
+from .redis_clients import REDIS_FAILURES, LoopClients, redis_breaker
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "expense:"
+
+# the value of the key of a deleted expense, an entry is a json object so it can never be this
+TOMBSTONE = "deleted"
+
+
+def expense_entry(expense) -> dict:
+    """
+    the cached form of an expense (an Expense or a selected row with every field): json types only,
+    so it is stored in redis as is and the response is the same whichever tier it came from
+    """
+    entry = {}
+    for name in EXPENSE_FIELDS:
+        value = getattr(expense, name)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, enum.Enum):
+            value = value.value
+        entry[name] = value
+    return entry
+
+
+class LocalTier:
+    """
+    bounded LRU of expense_id -> entry, an entry is dropped after max_age seconds even without an invalidation
+    """
+
+    def __init__(self, max_size: int, max_age: float):
+        self.max_size = max_size
+        self.max_age = max_age
+        # expense_id -> (entry, expires_at), the least recently used entry is first
+        self._entries = OrderedDict()
+
+    def get(self, expense_id: str):
+        cached = self._entries.get(expense_id)
+        if cached is None:
+            return None
+        entry, expires_at = cached
+        if time.monotonic() >= expires_at:
+            del self._entries[expense_id]
+            return None
+        self._entries.move_to_end(expense_id)
+        return entry
+
+    def put(self, expense_id: str, entry: dict):
+        if self.max_size <= 0:
+            return
+        self._entries[expense_id] = (entry, time.monotonic() + self.max_age)
+        self._entries.move_to_end(expense_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, expense_id: str):
+        self._entries.pop(expense_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ExpenseCache:
+    """
+    the local tier alone (redis_url None, for a single worker) or in front of redis
+    """
+
+    def __init__(self, local_size: int, local_max_age: float, redis_url: str | None = None, ttl: int = 300,
+                 channel: str = "expense_cache", pool_size: int = 10, timeout: float = 0.25,
+                 breaker: CircuitBreaker | None = None, reconnect_delay: float = 1.0, tombstone_ttl: int = 60):
+        self.local = LocalTier(local_size, local_max_age)
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.breaker = breaker or CircuitBreaker("expense_cache_redis", call_timeout=timeout)
+        self._clients = LoopClients(redis_url, pool_size, timeout) if redis_url else None
+        # messages carry the id of the worker that sent them, a worker skips its own
+        self._origin = uuid.uuid4().hex
+        self._subscribed = asyncio.Event()
+        self._listener = None
+        # counts the writes seen by this worker. expense_id -> the count at its last write, bounded like the local tier,
+        # an expense dropped from it may have been written as late as _forgotten_writes
+        self._writes = 0
+        self._last_writes = OrderedDict()
+        self._forgotten_writes = 0
+
+    @property
+    def local_usable(self) -> bool:
+        # without redis there is nobody to miss a message from
+        return self._clients is None or self._subscribed.is_set()
+
+    async def start(self):
+        """
+        starts the task that listens for invalidations of the other workers
+        """
+        if self._clients is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._subscribed.clear()
+        if self._clients is not None:
+            await self._clients.close()
+
+    def generation(self) -> int:
+        """
+        taken before reading an expense from the db, and handed to fill() with the row that was read
+        """
+        return self._writes
+
+    def _written(self, expense_id: str):
+        self._writes += 1
+        self._last_writes[expense_id] = self._writes
+        self._last_writes.move_to_end(expense_id)
+        while len(self._last_writes) > max(self.local.max_size, 1):
+            _, count = self._last_writes.popitem(last=False)
+            self._forgotten_writes = max(self._forgotten_writes, count)
+
+    def _written_since(self, expense_id: str, generation: int) -> bool:
+        return self._last_writes.get(expense_id, self._forgotten_writes) > generation
+
+    def _forget_all_writes(self):
+        # anything may have been written, every read that is running counts as out of date
+        self._writes += 1
+        self._forgotten_writes = self._writes
+        self._last_writes.clear()
+
+    async def get(self, expense_id: str):
+        """
+        the cached entry of the expense, None when neither tier has it
+        """
+        generation = self.generation()
+        if self.local_usable:
+            entry = self.local.get(expense_id)
+            if entry is not None:
+                metrics.increment("expense_cache_local_hits")
+                return entry
+
+        if self._clients is not None:
+            try:
+                raw = await self.breaker.call(self._clients.get().get, KEY_PREFIX + expense_id)
+            except REDIS_FAILURES:
+                metrics.increment("expense_cache_errors")
+                raw = None
+            if raw is not None and (raw.decode() if isinstance(raw, bytes) else raw) == TOMBSTONE:
+                # deleted, the endpoint reads the db and finds nothing
+                raw = None
+            if raw is not None:
+                entry = json.loads(raw)
+                # a write made while redis was answering is newer than this entry
+                if self.local_usable and not self._written_since(expense_id, generation):
+                    self.local.put(expense_id, entry)
+                metrics.increment("expense_cache_redis_hits")
+                return entry
+
+        metrics.increment("expense_cache_misses")
+        return None
+
+    async def fill(self, expense_id: str, entry: dict, generation: int):
+        """
+        caches an expense read from the db after a miss, generation is what generation() returned before the read
+        """
+        if self.local_usable and not self._written_since(expense_id, generation):
+            self.local.put(expense_id, entry)
+        if self._clients is not None:
+            try:
+                # nx, so a fill with a row read just before a write does not overwrite what that write stored,
+                # or the tombstone of a delete
+                await self.breaker.call(self._clients.get().set, KEY_PREFIX + expense_id, json.dumps(entry),
+                                        ex=self.ttl, nx=True)
+            except REDIS_FAILURES:
+                metrics.increment("expense_cache_errors")
+
+    async def put(self, expense_id: str, entry: dict):
+        """
+        stores the expense as it is after a write and tells the other workers
+        """
+        self._written(expense_id)
+        self.local.put(expense_id, entry)
+        await self._write(expense_id, entry)
+
+    async def invalidate(self, expense_id: str):
+        """
+        drops the expense from every tier and every worker, after it was deleted
+        """
+        self._written(expense_id)
+        self.local.pop(expense_id)
+        await self._write(expense_id, None)
+
+    async def _write(self, expense_id: str, entry: dict | None):
+        if self._clients is None:
+            return
+        try:
+            await self.breaker.call(self._write_through, expense_id, entry)
+        except REDIS_FAILURES as e:
+            # the db write already happened, the redis entry is left to its ttl
+            metrics.increment("expense_cache_errors")
+            logger.warning("expense cache could not update %s in redis: %s", expense_id, e)
+
+    async def _write_through(self, expense_id: str, entry: dict | None):
+        # the new value (or the delete) and the message go out in one round trip
+        pipe = self._clients.get().pipeline(transaction=False)
+        if entry is None:
+            pipe.set(KEY_PREFIX + expense_id, TOMBSTONE, ex=self.tombstone_ttl)
+        else:
+            pipe.set(KEY_PREFIX + expense_id, json.dumps(entry), ex=self.ttl)
+        pipe.publish(self.channel, f"{self._origin} {expense_id}")
+        await pipe.execute()
+
+    def _apply(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        origin, _, expense_id = data.partition(" ")
+        if origin != self._origin and expense_id:
+            self._written(expense_id)
+            self.local.pop(expense_id)
+            metrics.increment("expense_cache_invalidations")
+
+    async def _listen(self):
+        client = self._clients.get()
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # whatever was cached before may have been changed while nothing was listening
+                self._forget_all_writes()
+                self.local.clear()
+                self._subscribed.set()
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._apply(message["data"])
+                    metrics.set_gauge("expense_cache_local_size", len(self.local))
+            except Exception as e:
+                self._subscribed.clear()
+                metrics.increment("expense_cache_listener_errors")
+                logger.warning("expense cache lost redis, retrying in %ss: %s", self.reconnect_delay, e)
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except (RedisError, OSError):
+                    pass
+
+
+def create_expense_cache(backend: str):
+    """
+    builds the cache for the EXPENSE_CACHE_BACKEND setting, None when it is off
+    """
+    from .config import (REDIS_URL, REDIS_POOL_SIZE, REDIS_TIMEOUT_MS, EXPENSE_CACHE_SIZE, EXPENSE_CACHE_LOCAL_SECONDS,
+                         EXPENSE_CACHE_TTL_SECONDS, EXPENSE_CACHE_TOMBSTONE_SECONDS, EXPENSE_CACHE_CHANNEL)
+
+    if backend == "REDIS":
+        breaker = redis_breaker("expense_cache_redis")
+        return ExpenseCache(EXPENSE_CACHE_SIZE, EXPENSE_CACHE_LOCAL_SECONDS, redis_url=REDIS_URL,
+                            ttl=EXPENSE_CACHE_TTL_SECONDS, channel=EXPENSE_CACHE_CHANNEL, pool_size=REDIS_POOL_SIZE,
+                            timeout=REDIS_TIMEOUT_MS / 1000, breaker=breaker,
+                            tombstone_ttl=EXPENSE_CACHE_TOMBSTONE_SECONDS)
+    if backend == "MEMORY":
+        return ExpenseCache(EXPENSE_CACHE_SIZE, EXPENSE_CACHE_LOCAL_SECONDS)
+    if backend == "OFF":
+        return None
+    raise ValueError(f"Unknown expense cache backend {backend!r}")
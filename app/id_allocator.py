@@ -0,0 +1,175 @@
+"""
+hi-lo id allocation.
+counting rows to build the next id costs a full COUNT(*) per insert and hands out the same id twice when two inserts race or a row was deleted.
+instead every worker reserves a block of numbers from the id_sequence table with a single UPDATE, and then hands them out from memory,
+so an insert only goes to the db for a new block once every block_size ids and two workers can never get the same number.
+"""
+import asyncio
+import os
+import threading
+import weakref
+
+from sqlalchemy import Integer, cast, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .db_retry import retry_on_locked, retry_on_locked_async
+from .model import IdSequence
+
+
+class HiLoAllocator:
+    """
+    hands out ids like EID00000042 for one named sequence.
+    numbers are unique across threads, processes and restarts but not gap free, a block that is not used up is simply skipped.
+    """
+
+    def __init__(self, engine, sequence: str, prefix: str, id_column, width: int = 8, block_size: int = 100, async_engine=None):
+        self.engine = engine
+        # used by next_id_async so that reserving a block does not block the event loop
+        self.async_engine = async_engine
+        self.sequence = sequence
+        self.prefix = prefix
+        # the id column of the table the ids are for, used once to seed the sequence from the ids already in use
+        self.id_column = id_column
+        # fixed width so the ids of the allocator sort by number. that is not creation order: each worker hands out its own
+        # block, so a worker on a later block can create an expense before one on an earlier block does. the shorter ids
+        # made before the allocator (EID01 .. EID99) sort after them as strings ("EID00000006" < "EID05"). order by created_at
+        self.width = width
+        self.block_size = block_size
+
+        self._lock = threading.Lock()
+        # one refill lock per event loop, an asyncio.Lock can only be used from the loop it was first awaited on
+        self._refill_locks = weakref.WeakKeyDictionary()
+        self._next = 0
+        self._limit = 0
+        self._pid = os.getpid()
+
+    def next_id(self) -> str:
+        """
+        returns the next free id, only touches the db when the current block is used up
+        """
+        with self._lock:
+            value = self._take()
+            if value is None:
+                self._next, self._limit = retry_on_locked(self._reserve_block)
+                value = self._take()
+
+        return self._format(value)
+
+    async def next_id_async(self) -> str:
+        """
+        async version of next_id, a new block is reserved through the async engine
+        """
+        while True:
+            with self._lock:
+                value = self._take()
+            if value is not None:
+                return self._format(value)
+
+            # only one request per loop goes to the db for a new block, the others wait for it instead of all reserving their own
+            async with self._refill_lock():
+                with self._lock:
+                    if self._next < self._limit:
+                        continue
+                block = await retry_on_locked_async(self._reserve_block_async)
+                # the thread lock is not held across the await, if a sync caller refilled meanwhile the numbers of one block are skipped, never reused
+                with self._lock:
+                    if self._next >= self._limit:
+                        self._next, self._limit = block
+
+    def _refill_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._refill_locks.get(loop)
+        if lock is None:
+            lock = self._refill_locks[loop] = asyncio.Lock()
+        return lock
+
+    def _take(self):
+        """
+        takes the next number of the current block, None when the block is used up. the caller holds self._lock
+        """
+        # a forked worker must not keep handing out numbers from its parent's block
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._next = self._limit = 0
+
+        if self._next >= self._limit:
+            return None
+        value = self._next
+        self._next += 1
+        return value
+
+    def _format(self, value: int) -> str:
+        return f"{self.prefix}{value:0{self.width}d}"
+
+    def _reserve_block(self):
+        """
+        moves the sequence forward by block_size and returns the reserved range as (first, end)
+        """
+        while True:
+            with self.engine.begin() as conn:
+                block = self._take_block(conn)
+            if block is not None:
+                return block
+
+            try:
+                with self.engine.begin() as conn:
+                    return self._seed_block(conn)
+            except IntegrityError:
+                # another worker seeded the sequence at the same time, go back and take a block from it
+                continue
+
+    async def _reserve_block_async(self):
+        """
+        same as _reserve_block through the async engine
+        """
+        while True:
+            async with self.async_engine.begin() as conn:
+                block = await conn.run_sync(self._take_block)
+            if block is not None:
+                return block
+
+            try:
+                async with self.async_engine.begin() as conn:
+                    return await conn.run_sync(self._seed_block)
+            except IntegrityError:
+                continue
+
+    def _take_block(self, conn):
+        """
+        reserves the next block of an existing sequence, None when the sequence has no row yet
+        """
+        # the UPDATE takes the write lock on the row, so no other worker can read the same value until we commit
+        result = conn.execute(
+            update(IdSequence)
+            .where(IdSequence.name == self.sequence)
+            .values(next_value=IdSequence.next_value + self.block_size)
+        )
+        if result.rowcount != 1:
+            return None
+        end = conn.execute(
+            select(IdSequence.next_value).where(IdSequence.name == self.sequence)
+        ).scalar_one()
+        return end - self.block_size, end
+
+    def _seed_block(self, conn):
+        """
+        first use of this sequence, creates its row starting after the highest id that already exists and reserves the first block
+        """
+        first = self._highest_used(conn) + 1
+        conn.execute(
+            IdSequence.__table__.insert().values(
+                name=self.sequence,
+                next_value=first + self.block_size
+            )
+        )
+        return first, first + self.block_size
+
+    def _highest_used(self, conn) -> int:
+        """
+        highest number already used by an id with our prefix, 0 when there is none
+        """
+        suffix = func.substr(self.id_column, len(self.prefix) + 1)
+        highest = conn.execute(
+            select(func.max(cast(suffix, Integer))).where(self.id_column.like(f"{self.prefix}%"))
+        ).scalar()
+        return highest or 0
@@ -1,47 +1,102 @@
 # this import is for the time, we could specify expiry of the token
 from datetime import datetime, timedelta, timezone
+import time
 
 # jose is JSON, object signing and encryption 
-from jose import jwt, JWTError
+from jose import JWTError
 
 from fastapi.security import HTTPBearer
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 
 import uuid
-import redis
 
 from dotenv import load_dotenv
 import os
 
-
-redis_client = redis.Redis(host='redis', port=6379, db=0)
+from .config import (TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_AGE_SECONDS, REVOCATION_BACKEND, ACCESS_TOKEN_EXPIRY_MINUTES,
+                     REFRESH_TOKEN_EXPIRY_DAYS, REFRESH_SESSION_MAX_DAYS)
+from . import metrics
+from .token_cache import TokenCache
+from .keyring import load_keyring
+from .revocation import create_revocation_store, RevocationUnavailable
 
 load_dotenv()
 
 SECRET_KEY = os.environ.get("SECRET_KEY")
 
-ALGORITHM = "HS256"
-TOKEN_EXPIRY_TIME_MINUTES = 30
+# the signing keys, SECRET_KEY plus the ones in JWT_KEYRING_FILE, parsed once per worker (see keyring.py)
+keyring = load_keyring(secret_key=SECRET_KEY)
+
+TOKEN_EXPIRY_TIME_MINUTES = ACCESS_TOKEN_EXPIRY_MINUTES
+
+# the typ claim of refresh tokens, access tokens have none
+REFRESH_TOKEN_TYPE = "refresh"
+
+# request state key of (token, claims) for a token whose signature the rate limit middleware already checked
+VERIFIED_TOKEN_STATE = "verified_token"
 
 bearer_scheme = HTTPBearer()
 
-def create_jwt_token(data: dict):
+# tokens that already passed the checks in get_current_user, so a repeat caller is a dictionary lookup
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_AGE_SECONDS)
+
+# where logged out tokens are kept (redis, sqlite or memory, see revocation.py),
+# a revocation seen by this worker also drops the token from its cache. it is started and closed with the app
+revocation_store = create_revocation_store(REVOCATION_BACKEND, on_revoke=token_cache.revoke,
+                                           on_epoch=token_cache.revoke_issued_before)
+
+def create_jwt_token(data: dict, expires_in: timedelta | None = None, jti: str | None = None):
     """
-    this program expects data stored as a dict and will encode it using JOSE to produce a JWT token valid for 60 mins
+    this program expects data stored as a dict and will encode it using JOSE to produce a JWT token valid for expires_in
+    (TOKEN_EXPIRY_TIME_MINUTES by default). the token id is a new uuid unless jti is given
     """
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=TOKEN_EXPIRY_TIME_MINUTES)
+    issued_at = datetime.now(timezone.utc)
+    expire = issued_at + (expires_in or timedelta(minutes=TOKEN_EXPIRY_TIME_MINUTES))
     to_encode.update({"exp":expire})
     
+    # when the token was issued, with sub second precision so a login right after "log out everywhere" is not caught by it
+    to_encode.update({"iat": issued_at.timestamp()})
+    
     # adding an identifier for the token
-    jti = str(uuid.uuid4())
-    to_encode.update({"jti": jti})
+    to_encode.update({"jti": jti or str(uuid.uuid4())})
     
-    jwt_token = jwt.encode(to_encode, SECRET_KEY ,algorithm=ALGORITHM)
+    # signed with the active key of the key ring, its kid goes in the header
+    jwt_token = keyring.sign(to_encode)
     
     return jwt_token
 
+def refresh_expires_in(auth_time: float) -> timedelta:
+    """
+    the lifetime of a refresh token issued now in a session that started at auth_time
+    """
+    # sliding: every refresh token is good for REFRESH_TOKEN_EXPIRY_DAYS, but never past the end of the session
+    session_end = datetime.fromtimestamp(auth_time + REFRESH_SESSION_MAX_DAYS * 86400, timezone.utc)
+    return min(timedelta(days=REFRESH_TOKEN_EXPIRY_DAYS), session_end - datetime.now(timezone.utc))
+
+def issue_tokens(identity: dict, family: str | None = None, auth_time: float | None = None,
+                 refresh_jti: str | None = None):
+    """
+    an access token and a refresh token for the identity claims (sub, uid, ...).
+    both carry the family id of the session (fam), revoking it revokes every token of the session.
+    a login starts a new family, a refresh continues the one of the refresh token it spent
+    and passes the jti it recorded as the session's next refresh token
+    """
+    # a uuid like the jtis, so the redis mirror loads revoked families along with the revoked tokens
+    family = family or str(uuid.uuid4())
+    auth_time = auth_time or time.time()
+
+    access_token = create_jwt_token({**identity, "fam": family})
+
+    refresh_token = create_jwt_token(
+        {**identity, "typ": REFRESH_TOKEN_TYPE, "fam": family, "auth_time": auth_time},
+        expires_in=refresh_expires_in(auth_time),
+        jti=refresh_jti
+    )
+
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
 # def get_current_user(token: str):
 #     """
 #     this is a method that takes in a jwt token and verifies if it is a valid token, if the token is valid it will return the username of the user
@@ -59,18 +114,77 @@ def create_jwt_token(data: dict):
 
 
 
-def get_current_user(token_bearer: str = Depends(bearer_scheme)):
+async def is_revoked(jti: str) -> bool:
     """
-    A dependency that validates a JWT token and returns the username.
+    asks the revocation store about a jti, a store that can not answer (and fails closed) turns into a 503
+    """
+    try:
+        return await revocation_store.is_revoked(jti)
+    except RevocationUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is not available right now, please try again"
+        )
+
+
+async def any_revoked(ids) -> bool:
+    """
+    whether any of the token and family ids is revoked, ids that are None (a token without a family) are skipped
+    """
+    try:
+        return bool(await revocation_store.revoked_among([i for i in ids if i is not None]))
+    except RevocationUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is not available right now, please try again"
+        )
+
+
+async def issued_before_epoch(payload: dict) -> bool:
+    """
+    whether the token was issued before its user (or everyone) was logged out everywhere
+    """
+    try:
+        not_before = await revocation_store.not_before(payload["sub"])
+    except RevocationUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is not available right now, please try again"
+        )
+    # tokens from before the iat claim count as issued at 0
+    return payload.get("iat", 0) < not_before
+
+
+async def get_current_claims(request: Request, token_bearer: str = Depends(bearer_scheme)):
+    """
+    A dependency that validates a JWT token and returns its claims.
     It expects the token to be in the "Authorization: Bearer <token>" header.
     """
+    # a token seen before is not decoded or looked up in redis again until its cache entry expires or it is logged out
+    cached = token_cache.get(token_bearer.credentials)
+    if cached is not None:
+        return cached
+
     try:
         # The .credentials attribute of bearer_scheme contains the token string.
-        payload = jwt.decode(token_bearer.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        # the rate limit middleware may have checked the signature of this request's token already
+        verified = getattr(request.state, VERIFIED_TOKEN_STATE, None)
+        if verified is not None and verified[0] == token_bearer.credentials:
+            payload = verified[1]
+        else:
+            payload = keyring.decode(token_bearer.credentials)
         username: str | None = payload.get("sub")
+
+        # a refresh token is only good for /token/refresh
+        if payload.get("typ") == REFRESH_TOKEN_TYPE:
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid token, a refresh token can not be used to authenticate"
+            )
         
+        # the token itself and its session, both looked up at once
         jti = payload.get('jti')
-        if jti is None or redis_client.exists(jti):
+        if jti is None or await any_revoked([jti, payload.get("fam")]):
             raise HTTPException(
                 status_code=401,
                 detail="Invalid token or token blacklisted"
@@ -81,7 +195,17 @@ def get_current_user(token_bearer: str = Depends(bearer_scheme)):
                 status_code=401,
                 detail="Invalid token payload"
             )
-        return username
+
+        if await issued_before_epoch(payload):
+            raise HTTPException(
+                status_code=401,
+                detail="Invalid token or token blacklisted"
+            )
+
+        # jose already checked exp, without one the token is not cached
+        if payload.get("exp") is not None:
+            token_cache.put(token_bearer.credentials, payload)
+        return payload
     
     except JWTError as e:
         raise HTTPException(
@@ -89,17 +213,24 @@ def get_current_user(token_bearer: str = Depends(bearer_scheme)):
             detail=f"Invalid token, please re-authenticate: {e}"
         )
 
-def logout_current_user(token_bearer: str = Depends(bearer_scheme)):
+async def get_current_user(claims: dict = Depends(get_current_claims)):
+    """
+    A dependency that validates a JWT token and returns the username.
+    It expects the token to be in the "Authorization: Bearer <token>" header.
+    """
+    return claims["sub"]
+
+async def logout_current_user(token_bearer: str = Depends(bearer_scheme)):
     """
     A dependency that logs out a JWT token and returns the username.
     It expects the token to be in the "Authorization: Bearer <token>" header.
     """
     try:
         # The .credentials attribute of bearer_scheme contains the token string.
-        payload = jwt.decode(token_bearer.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = keyring.decode(token_bearer.credentials)
         
         jti = payload.get('jti')
-        if jti is None or redis_client.exists(jti):
+        if jti is None or await is_revoked(jti):
             raise HTTPException(
                 status_code=401,
                 detail="Invalid token or user is already logged out!"
@@ -119,14 +250,20 @@ def logout_current_user(token_bearer: str = Depends(bearer_scheme)):
                 status_code=401,
                 detail="Invalid token payload"
             )
-        # when active user wishes to logout, we add the "jti" to redis along with TTL specified in payload as exp
-        exp_datetime = datetime.fromtimestamp(exp, tz=timezone.utc)
-        time_to_expire = exp_datetime - datetime.now(timezone.utc)
-
-        # Ensure a positive time to expire to avoid issues
-        if time_to_expire.total_seconds() > 0:
-            # Blacklist the JTI with the remaining expiration time
-            redis_client.setex(jti, int(time_to_expire.total_seconds()), "blacklisted")
+        # when active user wishes to logout, we add the "jti" to the revocation store until the exp of the token,
+        # with redis it is also published so every worker adds it to its mirror and drops the token from its cache.
+        # the family goes with it, so the refresh token of the session can not bring it back
+        revoked = [(jti, exp)]
+        family = payload.get("fam")
+        if family is not None:
+            revoked.append((family, time.time() + REFRESH_SESSION_MAX_DAYS * 86400))
+        try:
+            await revocation_store.revoke_many(revoked)
+        except RevocationUnavailable:
+            raise HTTPException(
+                status_code=503,
+                detail="Logout is not available right now, please try again"
+            )
         
         return username
     # when the JWT is invalid, there is no need to logout.
@@ -134,4 +271,74 @@ def logout_current_user(token_bearer: str = Depends(bearer_scheme)):
         raise HTTPException(
             status_code=401,
             detail=f"Invalid token, your authorization is invalid, please re-authenticate: {e}"
-        )
\ No newline at end of file
+        )
+
+async def logout_all_sessions(claims: dict = Depends(get_current_claims)):
+    """
+    A dependency that logs the user of a JWT token out of every session and returns the username.
+    every token issued to them until now is refused from here on, with a single write to the revocation store
+    """
+    username = claims["sub"]
+    try:
+        await revocation_store.set_epoch(username, time.time())
+    except RevocationUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Logout is not available right now, please try again"
+        )
+    return username
+
+async def refresh_session(refresh_token: str):
+    """
+    spends a refresh token and returns a new access token and refresh token for the same session.
+    only the claims in the refresh token are used, the user table is not read.
+    every refresh token works once: when a spent one comes back it was copied, so the whole session is revoked,
+    which logs out both whoever stole it and the real user (who has to log in again)
+    """
+    try:
+        payload = keyring.decode(refresh_token)
+    except JWTError as e:
+        raise HTTPException(
+            status_code=401,
+            detail=f"Invalid refresh token, please re-authenticate: {e}"
+        )
+
+    jti = payload.get("jti")
+    family = payload.get("fam")
+    if payload.get("typ") != REFRESH_TOKEN_TYPE or jti is None or family is None or payload.get("sub") is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid refresh token"
+        )
+
+    if await any_revoked([family]) or await issued_before_epoch(payload):
+        raise HTTPException(
+            status_code=401,
+            detail="Session expired or logged out, please re-authenticate"
+        )
+
+    auth_time = payload.get("auth_time", time.time())
+    # the session's record of its current refresh token moves on to the one handed out now
+    next_jti = str(uuid.uuid4())
+    try:
+        spent_now = await revocation_store.rotate_refresh(family, jti, next_jti,
+                                                          time.time() + refresh_expires_in(auth_time).total_seconds())
+        if not spent_now:
+            # the family is revoked until the latest time any token of the session could still be valid
+            await revocation_store.revoke(family, auth_time + REFRESH_SESSION_MAX_DAYS * 86400)
+    except RevocationUnavailable:
+        raise HTTPException(
+            status_code=503,
+            detail="Refreshing is not available right now, please try again"
+        )
+
+    if not spent_now:
+        metrics.increment("refresh_token_reuse")
+        raise HTTPException(
+            status_code=401,
+            detail="Refresh token was already used, the session has been logged out, please re-authenticate"
+        )
+
+    metrics.increment("token_refreshes")
+    identity = {key: value for key, value in payload.items() if key not in ("exp", "iat", "jti", "typ", "fam", "auth_time")}
+    return issue_tokens(identity, family=family, auth_time=auth_time, refresh_jti=next_jti)
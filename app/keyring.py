@@ -0,0 +1,145 @@
+"""
+the keys tokens are signed and verified with.
+every token names its key in the kid header, so a new key can be brought in for signing while tokens signed with the
+previous one keep verifying until they expire, instead of one SECRET_KEY whose rotation logs everybody out.
+besides HS256 (shared secret) keys can be RS256 or ES256: those sign with a private key and verify with the public one,
+which is published at /.well-known/jwks.json so other services can verify our tokens themselves.
+the keys are parsed once per worker into jose key objects, not on every sign or verify.
+
+the ring is read from the json file in JWT_KEYRING_FILE:
+    {
+        "active": "2025-10",
+        "keys": [
+            {"kid": "2025-10", "alg": "RS256", "private_key_file": "keys/2025-10.pem"},
+            {"kid": "2025-04", "alg": "HS256", "secret": "..."},
+            {"kid": "partner", "alg": "ES256", "public_key_file": "keys/partner.pub.pem"}
+        ]
+    }
+a key with only a public key can verify but not sign. key material can be given inline (secret, private_key, public_key)
+or as a path (secret_file, private_key_file, public_key_file), relative paths are relative to the file.
+SECRET_KEY, when set, is always in the ring as the HS256 key "default", which also verifies tokens without a kid
+(issued before the key ring). without a keyring file it is the signing key.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+
+from .config import JWT_KEYRING_FILE
+
+# algorithms a key can have. python-jose does not implement EdDSA, ES256 is the compact asymmetric option
+ALGORITHMS = ("HS256", "RS256", "ES256")
+SYMMETRIC_ALGORITHMS = ("HS256",)
+
+DEFAULT_KID = "default"
+
+
+@dataclass
+class SigningKey:
+    """
+    one key of the ring with its parsed jose key objects
+    """
+    kid: str
+    alg: str
+    # used to sign, None for a key that only verifies
+    signing_key: Key | None
+    verifying_key: Key
+    # the public JWK, None for a shared secret which is never published
+    public_jwk: dict | None = field(default=None)
+
+
+def load_key(kid: str, alg: str, secret=None, private_key=None, public_key=None) -> SigningKey:
+    """
+    parses the key material once into jose key objects
+    """
+    if alg not in ALGORITHMS:
+        raise ValueError(f"Key {kid!r} has unsupported algorithm {alg!r}, choose from {', '.join(ALGORITHMS)}")
+
+    if alg in SYMMETRIC_ALGORITHMS:
+        if not secret:
+            raise ValueError(f"Key {kid!r} needs a secret")
+        key = jwk.construct(secret, alg)
+        return SigningKey(kid=kid, alg=alg, signing_key=key, verifying_key=key)
+
+    if private_key:
+        signing_key = jwk.construct(private_key, alg)
+        verifying_key = signing_key.public_key()
+    elif public_key:
+        signing_key = None
+        verifying_key = jwk.construct(public_key, alg)
+    else:
+        raise ValueError(f"Key {kid!r} needs a private_key or a public_key")
+
+    public_jwk = {**verifying_key.to_dict(), "kid": kid, "alg": alg, "use": "sig"}
+    return SigningKey(kid=kid, alg=alg, signing_key=signing_key, verifying_key=verifying_key, public_jwk=public_jwk)
+
+
+class KeyRing:
+    """
+    the keys by kid and the one new tokens are signed with
+    """
+
+    def __init__(self, keys, active: str | None):
+        self.keys = {key.kid: key for key in keys}
+        if active is not None and (active not in self.keys or self.keys[active].signing_key is None):
+            raise ValueError(f"The active key {active!r} is not in the key ring or can not sign")
+        self.active = active
+        # the published document does not change while the worker runs, so it is built once
+        self.jwks = {"keys": [key.public_jwk for key in self.keys.values() if key.public_jwk is not None]}
+
+    def sign(self, claims: dict) -> str:
+        if self.active is None:
+            raise RuntimeError("No signing key configured, set SECRET_KEY or JWT_KEYRING_FILE")
+        key = self.keys[self.active]
+        return jwt.encode(claims, key.signing_key, algorithm=key.alg, headers={"kid": key.kid})
+
+    def decode(self, token: str) -> dict:
+        """
+        verifies the token with the key named in its kid header and returns the claims, raises JWTError when it is not valid
+        """
+        kid = jwt.get_unverified_header(token).get("kid", DEFAULT_KID)
+        key = self.keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown signing key {kid!r}")
+        # only the algorithm of that key is accepted, so a token can not pick a weaker one
+        return jwt.decode(token, key.verifying_key, algorithms=[key.alg])
+
+
+def _material(entry: dict, name: str, base_dir: str):
+    # a key given inline or as a path to a file next to the keyring file
+    if entry.get(name):
+        return entry[name]
+    path = entry.get(f"{name}_file")
+    if path:
+        with open(os.path.join(base_dir, path)) as f:
+            return f.read().strip() if name == "secret" else f.read()
+    return None
+
+
+def load_keyring(path: str = JWT_KEYRING_FILE, secret_key: str | None = None) -> KeyRing:
+    """
+    builds the ring from the keyring file (when given) and SECRET_KEY
+    """
+    keys = []
+    active = None
+    if secret_key:
+        keys.append(load_key(DEFAULT_KID, "HS256", secret=secret_key))
+        active = DEFAULT_KID
+
+    if path:
+        with open(path) as f:
+            document = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(path))
+        for entry in document["keys"]:
+            keys.append(load_key(
+                entry["kid"],
+                entry["alg"],
+                secret=_material(entry, "secret", base_dir),
+                private_key=_material(entry, "private_key", base_dir),
+                public_key=_material(entry, "public_key", base_dir)
+            ))
+        active = document.get("active", active)
+
+    return KeyRing(keys, active)
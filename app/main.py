@@ -1,23 +1,70 @@
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Security, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 # allows to define security based on JWT token
 from fastapi.security import HTTPBearer
 
 # models for inputs from postFunctions
-from .baseModels import UserLogin, ExpenseOut, ExpenseCreate, ExpenseRejection
+from .baseModels import UserLogin, TokenRefresh, ExpenseOut, ExpenseCreate, ExpenseRejection
 
-# allowing to get db session using get db
-from .database import get_db
-from sqlalchemy.orm import Session
+# allowing to get db session using get db, the expense endpoints use the async session from get_async_db
+from .database import get_async_db, init_db, expense_id_allocator, AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete
 
-# getting the table of User
-from .model import User, Expense, StatusEnum
+# getting the table of Expense
+from .model import Expense, StatusEnum
+
+# statements for the per request lookups, built once with bind parameters
+from . import queries
+
+# password hashing, done in a process pool
+from .passwords import password_hasher, PasswordHasherBusy, DUMMY_HASH
+
+# per worker counters exposed on /metrics
+from . import metrics
+
+# token buckets per ip (login) and per user (everything else)
+from .rate_limit import RateLimitMiddleware, Limit, create_rate_limiter
+from .config import (RATE_LIMIT_BACKEND, RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_LOGIN_BURST, RATE_LIMIT_PER_SECOND,
+                     RATE_LIMIT_BURST, USER_MAX_CONCURRENT_REQUESTS)
+
+# gzip (zstd, brotli when installed) for the large responses
+from .compression import CompressionMiddleware
+from .config import COMPRESSION_MIN_SIZE, COMPRESSION_THREADPOOL_SIZE
 
 # created utils for security using jwt
-from .jwt_utils import create_jwt_token, get_current_user, logout_current_user
+from .jwt_utils import issue_tokens, refresh_session, logout_current_user, logout_all_sessions, revocation_store, keyring
+
+# the caller's identity from the claims of their token, so the endpoints do not look the user up
+from .principal import Principal, get_current_principal, identity_claims
+
+# keyset pagination for the list endpoints
+from .pagination import paginate_expenses, parse_sort, ExpenseSort, DEFAULT_SORT, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+
+# full-text search over title and description
+from .search import search_expenses
+
+# ?fields= support for the read endpoints
+from .projection import expense_fields, expense_columns
+
+# rows to json with orjson, without validating them again through the response model
+from .serialization import dump_rows, rows_response
+
+# read cache of single expenses, updated by every write below
+from .expense_cache import create_expense_cache, expense_entry
+from .config import EXPENSE_CACHE_BACKEND
+
+# ETags and 304 Not Modified for the read endpoints, from a version per list bumped by every write
+from .conditional import (CREATOR, APPROVER, get_list_version, bump_list_versions, list_etag, expense_etag,
+                          not_modified)
+
+# identical reads running at the same time share one query
+from .single_flight import SingleFlight
 
 # for a list of items
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timezone
+from contextlib import asynccontextmanager
 
  
 
@@ -31,35 +78,110 @@ security_scheme = {
 }
 
 
-app = FastAPI(title="Expense Submission Tool", security= security_scheme)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    runs once when the server starts, makes sure the tables exist and the schema migrations are applied,
+    and starts the store of revoked tokens
+    """
+    init_db()
+    await revocation_store.start()
+    if expense_cache is not None:
+        await expense_cache.start()
+    yield
+    await revocation_store.close()
+    if expense_cache is not None:
+        await expense_cache.close()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    password_hasher.shutdown()
+
+
+rate_limiter = create_rate_limiter(RATE_LIMIT_BACKEND)
+expense_cache = create_expense_cache(EXPENSE_CACHE_BACKEND)
+expense_reads = SingleFlight("expense_reads")
+
+# orjson encodes the responses of every route, much faster than the json module
+app = FastAPI(title="Expense Submission Tool", security= security_scheme, lifespan=lifespan,
+              default_response_class=ORJSONResponse)
+
+# a client over its rate gets a 429 before its request takes up a worker
+if rate_limiter is not None:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        login_limit=Limit(RATE_LIMIT_LOGIN_PER_MINUTE / 60, RATE_LIMIT_LOGIN_BURST),
+        user_limit=Limit(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST),
+        max_concurrent=USER_MAX_CONCURRENT_REQUESTS
+    )
+
+# added last so it is the outermost middleware and every response passes through it, 429s included
+if COMPRESSION_MIN_SIZE > 0:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        threadpool_size=COMPRESSION_THREADPOOL_SIZE
+    )
 
 @app.get('/')
 def root():
     return {"message": "welcome to expense submission tool"}
 
+@app.get('/metrics')
+def read_metrics():
+    """
+    returns the counters and gauges of the worker that handled this request
+    """
+    return metrics.snapshot()
+
+@app.get('/.well-known/jwks.json')
+def read_jwks(response: Response):
+    """
+    the public keys tokens are verified with, so other services can check our tokens without calling us.
+    only RS256/ES256 keys are listed, shared HS256 secrets are never published
+    """
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return keyring.jwks
+
 @app.post('/login/')
-def login(user: UserLogin, db: Session = Depends(get_db)):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """
     This is the login feature expects username and password.
-    on success this method returns a JWT valid for 30 mins
+    on success this method returns an access token (valid for ACCESS_TOKEN_EXPIRY_MINUTES) and a refresh token to renew it with
     """
     
     # query the db to check if specified user exists
-    db_user = db.query(User).filter(
-        User.username == user.username,
-        User.password == user.password
-    ).first()
+    db_user = (await db.scalars(queries.USER_BY_USERNAME, {"username": user.username})).first()
+    
+    # the password check runs in the hashing processes, an unknown user is checked against a dummy hash to take as long
+    try:
+        matches, needs_rehash = await password_hasher.verify(user.password, db_user.password if db_user else DUMMY_HASH)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many logins right now, please try again",
+            headers={"Retry-After": "1"}
+        )
     
     # edit isUser function for db implementation
-    if db_user:
+    if db_user and matches:
+        if needs_rehash:
+            # a plaintext password or one hashed with older parameters is stored again with the current ones
+            try:
+                db_user.password = await password_hasher.hash(user.password)
+                await db.commit()
+            except PasswordHasherBusy:
+                # the login still succeeds, the password is rehashed on a later login
+                pass
+
+        # the identity of the user goes into the token, so later requests do not have to look it up
         data = {
-            "sub": user.username
+            "sub": user.username,
+            **identity_claims(db_user)
         }
-        token = create_jwt_token(data)
-        
         # curent_user = get_current_user(token)
         
-        return {"access_token": token, "token_type": "bearer"} 
+        return issue_tokens(data)
     
     else:
         raise HTTPException(
@@ -67,6 +189,14 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
             detail="Incorrect username or password"
         )         
 
+@app.post('/token/refresh')
+async def refresh_token(body: TokenRefresh):
+    """
+    trades a refresh token for a new access token and refresh token, without the password and without reading the user table.
+    the refresh token sent works only once
+    """
+    return await refresh_session(body.refresh_token)
+
 @app.post(
     "/logout/",
     dependencies=[Security(HTTPBearer())],
@@ -74,17 +204,18 @@ def login(user: UserLogin, db: Session = Depends(get_db)):
 def logout(current_user: str = Depends(logout_current_user)):
     return {"message":f"Successfully logged {current_user} out!"}
 
-def get_valid_user(db: Session, username: str):
-    db_user = db.query(User).filter(User.username == username).first()
-    
-    if not db_user:
-        raise HTTPException(
-            status_code=404,
-            detail="User not found"
-        )
-    return db_user
-def get_valid_expense(db: Session, expense_id: str):
-    db_expense = db.query(Expense).filter(Expense.expense_id == expense_id).first()
+@app.post(
+    "/logout/all",
+    dependencies=[Security(HTTPBearer())],
+)
+def logout_everywhere(current_user: str = Depends(logout_all_sessions)):
+    """
+    logs the user out of every session, every token issued to them so far stops working
+    """
+    return {"message":f"Successfully logged {current_user} out of every session!"}
+
+async def get_valid_expense(db: AsyncSession, expense_id: str):
+    db_expense = (await db.scalars(queries.EXPENSE_BY_ID, {"expense_id": expense_id})).first()
     
     if not db_expense:
         raise HTTPException(
@@ -93,9 +224,9 @@ def get_valid_expense(db: Session, expense_id: str):
         )
     return db_expense
 
-def get_valid_user_expense(db: Session, expense_id: str, user_db: User):
-    db_expense = db.query(Expense).filter(Expense.expense_id == expense_id,
-                                          Expense.creator_id == user_db.user_id).first()
+async def get_valid_user_expense(db: AsyncSession, expense_id: str, principal: Principal):
+    db_expense = (await db.scalars(queries.EXPENSE_BY_ID_AND_CREATOR,
+                                   {"expense_id": expense_id, "user_id": principal.user_id})).first()
     
     if not db_expense:
         raise HTTPException(
@@ -104,9 +235,9 @@ def get_valid_user_expense(db: Session, expense_id: str, user_db: User):
         )
     return db_expense
 
-def get_valid_approver_expense(db: Session, expense_id: str, user_db: User):
-    db_expense = db.query(Expense).filter(Expense.expense_id == expense_id,
-                                          Expense.approver_id == user_db.user_id).first()
+async def get_valid_approver_expense(db: AsyncSession, expense_id: str, principal: Principal):
+    db_expense = (await db.scalars(queries.EXPENSE_BY_ID_AND_APPROVER,
+                                   {"expense_id": expense_id, "user_id": principal.user_id})).first()
     
     if not db_expense:
         raise HTTPException(
@@ -115,53 +246,209 @@ def get_valid_approver_expense(db: Session, expense_id: str, user_db: User):
         )
     return db_expense
 
+async def get_cached_expense(expense_id: str):
+    """
+    an expense from the read cache, or read from the db on a miss and cached. None when there is no such expense.
+    the caller checks whether the principal may see it
+    """
+    if expense_cache is not None:
+        entry = await expense_cache.get(expense_id)
+        if entry is not None:
+            return entry
+
+    async def load():
+        # taken before the read, a write that lands while the row is read wins over the row
+        generation = expense_cache.generation() if expense_cache is not None else 0
+        # a session of its own, the read is shared by requests that each have theirs
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(queries.EXPENSE_ROW_BY_ID, {"expense_id": expense_id})).first()
+        if row is None:
+            return None
+        entry = expense_entry(row)
+        if expense_cache is not None:
+            await expense_cache.fill(expense_id, entry, generation)
+        return entry
+
+    # a burst of misses on the same expense reads it once
+    return await expense_reads.run(("expense", expense_id), load)
+
+async def cache_expense(expense):
+    """
+    writes an expense through to the read cache after it was created or changed
+    """
+    # a read of the expense that is still running started before this write
+    expense_reads.forget(("expense", expense.expense_id))
+    if expense_cache is not None:
+        await expense_cache.put(expense.expense_id, expense_entry(expense))
+
+async def read_expense_page(key, stmt, limit: int, cursor: Optional[str], sort: str, fields: Optional[list]):
+    """
+    runs the query of a list page and serializes it, identical requests running at the same time share one run.
+    the key has to contain the list version, so a request made after a write does not share a run started before it.
+    returns the body and the headers of the response
+    """
+    async def load():
+        async with AsyncSessionLocal() as db:
+            expenses, next_cursor = await paginate_expenses(db, stmt, limit, cursor, sort)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        return dump_rows(expenses, fields), headers
+
+    return await expense_reads.run(key, load)
+
+async def expense_list_response(request: Request, db: AsyncSession, role: str, user_id: str, limit: int,
+                                cursor: Optional[str], sort: str, filters: list, fields: Optional[list]):
+    """
+    a page of the expenses user_id created (role CREATOR) or has to approve (role APPROVER), with its ETag,
+    or a 304 when the client's copy of the list is still current
+    """
+    # a client whose copy is still current gets a 304 before the list is queried
+    version = await get_list_version(db, role, user_id)
+    # the page is read on a session of its own (it may be shared with other requests), so this one ends its transaction
+    # and gives its connection back to the pool first, a request never holds two connections
+    await db.commit()
+    etag = list_etag(request, role, user_id, version)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    
+    # only the needed columns are selected, the sort key and expense_id are always read because the cursor is built from them
+    columns = expense_columns(fields, parse_sort(sort)[0], "expense_id")
+    owner = Expense.creator_id if role == CREATOR else Expense.approver_id
+    stmt = select(*columns).where(owner == user_id, *filters)
+    body, headers = await read_expense_page((role, user_id, version, request.url.query), stmt, limit, cursor, sort, fields)
+    
+    return Response(content=body, media_type="application/json", headers={**headers, "ETag": etag})
+
+async def run_transition(db: AsyncSession, stmt):
+    """
+    runs a guarded UPDATE/DELETE ... RETURNING and commits it, one round trip to the db.
+    returns the returned expense (or None when the guard matched nothing)
+    """
+    # the RETURNING row is all we need, so the session does not try to sync objects it may have loaded
+    result = await db.scalars(stmt.execution_options(synchronize_session=False))
+    returned = result.first()
+    if returned is not None:
+        # the lists the expense is on change in the same transaction
+        await bump_list_versions(db, returned)
+    await db.commit()
+    return returned
+
+def as_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    the timestamps are stored as naive UTC, so a timezone aware filter value is converted before it is compared
+    """
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def expense_list_filters(status: Optional[List[StatusEnum]] = Query(None, description="only expenses in these states, can be repeated"),
+                         created_from: Optional[datetime] = None,
+                         created_to: Optional[datetime] = None,
+                         approved_from: Optional[datetime] = None,
+                         approved_to: Optional[datetime] = None,
+                         min_amount: Optional[float] = None,
+                         max_amount: Optional[float] = None):
+    """
+    query parameters shared by the list endpoints, they are turned into where clauses on the expense table
+    so the db only reads the matching rows (status is part of the approver index). the ranges are inclusive
+    """
+    conditions = []
+    if status:
+        conditions.append(Expense.status.in_(status))
+    if created_from is not None:
+        conditions.append(Expense.created_at >= as_utc_naive(created_from))
+    if created_to is not None:
+        conditions.append(Expense.created_at <= as_utc_naive(created_to))
+    if approved_from is not None:
+        conditions.append(Expense.approved_at >= as_utc_naive(approved_from))
+    if approved_to is not None:
+        conditions.append(Expense.approved_at <= as_utc_naive(approved_to))
+    if min_amount is not None:
+        conditions.append(Expense.amount >= min_amount)
+    if max_amount is not None:
+        conditions.append(Expense.amount <= max_amount)
+    return conditions
+
 # @app.get("/expenses/me", response_model=List[ExpenseOut])
 @app.get("/expenses/me", response_model=List[ExpenseOut], dependencies=[Security(HTTPBearer())])
-def read_my_expenses(current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
+async def read_my_expenses(request: Request,
+                           limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                           cursor: Optional[str] = None,
+                           sort: ExpenseSort = DEFAULT_SORT,
+                           filters: list = Depends(expense_list_filters),
+                           fields: Optional[list] = Depends(expense_fields),
+                           principal: Principal = Depends(get_current_principal), 
+                           db: AsyncSession = Depends(get_async_db)):
     """
-    this is a function that allows a user to view all expenses created by them. It expects a security bearer token to validate whom the user is
+    this is a function that allows a user to view the expenses created by them, sorted by the sort parameter (newest first by default) and narrowed by the filter parameters. It expects a security bearer token to validate whom the user is.
+    results are paginated, when there are more expenses the cursor for the next page is returned in the X-Next-Cursor header.
+    with fields=a,b,c only those fields of each expense are returned
     """
-    db_user = get_valid_user(db, current_user)
-        
-    expenses = db.query(Expense).filter(Expense.creator_id == db_user.user_id).all()
+    return await expense_list_response(request, db, CREATOR, principal.user_id, limit, cursor, sort, filters, fields)
+
+@app.get("/expenses/search", response_model=List[ExpenseOut], dependencies=[Security(HTTPBearer())])
+async def search_my_expenses(q: str = Query(..., min_length=1, max_length=200, description="words to look for in the title and description"),
+                             limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+                             fields: Optional[list] = Depends(expense_fields),
+                             principal: Principal = Depends(get_current_principal),
+                             db: AsyncSession = Depends(get_async_db)):
+    """
+    this is a function that allows a user to search the expenses they created or have to approve by words in the title or description.
+    the best matches come first, every word has to match and the last word may be the start of a word
+    """
+    # the search index is an sqlite FTS5 table, see search.py
+    if db.get_bind().dialect.name != "sqlite":
+        raise HTTPException(
+            status_code=501,
+            detail="Full-text search is only available on sqlite"
+        )
+    
+    expenses = await search_expenses(db, q, principal.user_id, limit, expense_columns(fields))
     
-    return expenses
+    return rows_response(expenses, fields)
 
 @app.get("/expenses/me/{expense_id}", response_model=ExpenseOut, dependencies=[Security(HTTPBearer())])
-def get_my_expense_by_id(expense_id: str, current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_my_expense_by_id(expense_id: str,
+                               request: Request,
+                               fields: Optional[list] = Depends(expense_fields),
+                               principal: Principal = Depends(get_current_principal)):
     """
     this is a function that allows a user to view all expenses created by them. It expects a security bearer token to validate whom the user is and then this is followed by a lookup of the specific expense_id stated in the get request
     """
-    db_user = get_valid_user(db, current_user)
-        
-    expense = db.query(Expense).filter(Expense.creator_id == db_user.user_id, Expense.expense_id == expense_id).first()
+    # a repeated view is served from the cache, the creator is checked on the cached expense
+    expense = await get_cached_expense(expense_id)
     
-    if not expense:
+    if expense is None or expense["creator_id"] != principal.user_id:
         raise HTTPException(
             status_code=404,
             detail="Expense not found or you are not the creator"
         )
-    return expense
+    
+    etag = expense_etag(request, expense)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    
+    return rows_response(expense, fields, {"ETag": etag})
 
 @app.post('/expenses', 
           response_model=ExpenseOut, 
           dependencies=[Security(HTTPBearer())]
           )
-def create_my_expense(expense: ExpenseCreate, 
-                   current_user: str = Depends(get_current_user), 
-                   db: Session = Depends(get_db)):
+async def create_my_expense(expense: ExpenseCreate, 
+                            principal: Principal = Depends(get_current_principal), 
+                            db: AsyncSession = Depends(get_async_db)):
     """
     this is a method that allows to create a new expense, it expects the user to have title, description and amount in the post message
     """
-    db_user = get_valid_user(db, current_user)
-    
     # New expense entry for the DB
     
-    expense_id = f"EID{db.query(Expense).count() +1 :02d}"
+    # ids come from a block reserved by this worker, so no COUNT(*) per insert and no collisions between concurrent creates
+    expense_id = await expense_id_allocator.next_id_async()
     # print(f"expense id: {expense_id}")
     
     # getting the approver who belongs to the same department as the user
-    approver = db.query(User).filter(User.department_id == db_user.department_id, User.is_approver==True).first()
+    approver = (await db.scalars(queries.APPROVER_OF_DEPARTMENT, {"department_id": principal.department_id})).first()
     
     # print(f"approver id{approver.user_id}")
     
@@ -169,165 +456,200 @@ def create_my_expense(expense: ExpenseCreate,
         title = expense.title,
         description = expense.description,
         amount = expense.amount,
-        creator_id = db_user.user_id,
+        creator_id = principal.user_id,
         created_at = datetime.now(timezone.utc),
         expense_id = expense_id,
         approver_id = approver.user_id
     )
     
     db.add(new_expense)
-    db.commit()
-    db.refresh(new_expense)
+    await bump_list_versions(db, new_expense)
+    await db.commit()
+    await db.refresh(new_expense)
+    await cache_expense(new_expense)
     
     return new_expense
 
 @app.post('/expenses/submit/{expense_id}',
           response_model=ExpenseOut, 
           dependencies=[Security(HTTPBearer())])
-def submit_my_expense(expense_id: str, 
-                      current_user: str = Depends(get_current_user),
-                      db: Session = Depends(get_db)):
+async def submit_my_expense(expense_id: str, 
+                            principal: Principal = Depends(get_current_principal),
+                            db: AsyncSession = Depends(get_async_db)):
     """
     Method that allows me to submit an expense that is currently in a draft
     """
-    db_user = get_valid_user(db, current_user)
-    # check if the expense exists:
-    db_expense = get_valid_user_expense(db, expense_id, db_user)
+    # the status check and the change are one guarded UPDATE, so the expense cannot change between checking and writing
+    db_expense = await run_transition(
+        db,
+        update(Expense)
+        .where(Expense.expense_id == expense_id,
+               Expense.creator_id == principal.user_id,
+               Expense.status == StatusEnum.draft)
+        .values(status=StatusEnum.submitted)
+        .returning(Expense)
+    )
     
-    if db_expense.status != StatusEnum.draft:
+    if db_expense is None:
+        # nothing was updated, find out why to return the right error
+        await get_valid_user_expense(db, expense_id, principal)
         raise HTTPException(
             status_code=404,
             detail="Only draft expenses can be submitted!"
         )
     
-    db_expense.status = StatusEnum.submitted
-    
-    # commiting the change on the db
-    db.commit()
-    db.refresh(db_expense)
-    
+    await cache_expense(db_expense)
     return db_expense
     
 
 @app.delete('/expenses/delete/{expense_id}', 
           dependencies=[Security(HTTPBearer())])
-def delete_my_expense(expense_id: str, 
-                      current_user: str = Depends(get_current_user),
-                      db: Session = Depends(get_db)):
+async def delete_my_expense(expense_id: str, 
+                            principal: Principal = Depends(get_current_principal),
+                            db: AsyncSession = Depends(get_async_db)):
     """
     Method that allows user to delete an expense that is currently in a draft or submitted state
     """
-    db_user = get_valid_user(db, current_user)
-    # check if the expense exists:
-    db_expense = get_valid_user_expense(db, expense_id, db_user)
+    # delete method, only matches an expense of this user that is still in draft or submitted
+    deleted = await run_transition(
+        db,
+        delete(Expense)
+        .where(Expense.expense_id == expense_id,
+               Expense.creator_id == principal.user_id,
+               Expense.status.in_([StatusEnum.draft, StatusEnum.submitted]))
+        .returning(Expense)
+    )
     
-    if not (db_expense.status == StatusEnum.draft or db_expense.status == StatusEnum.submitted):
+    if deleted is None:
+        # check if the expense exists:
+        await get_valid_user_expense(db, expense_id, principal)
         raise HTTPException(
             status_code=404,
             detail="Only draft and submitted expenses can be deleted! You cant delete an approved/rejected expense"
         )
     
-    # delete method
-    db.delete(db_expense)
-    # commiting the change on the db
-    db.commit()
+    expense_reads.forget(("expense", deleted.expense_id))
+    if expense_cache is not None:
+        await expense_cache.invalidate(deleted.expense_id)
     
-    return {"message": f"the expense entry with the EID {db_expense.expense_id} has been deleted!"}
+    return {"message": f"the expense entry with the EID {deleted.expense_id} has been deleted!"}
 
 
 @app.get("/expenses/approvals/me", response_model=List[ExpenseOut], dependencies=[Security(HTTPBearer())])
-def read_my_approvals(current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
+async def read_my_approvals(request: Request,
+                            limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            cursor: Optional[str] = None,
+                            sort: ExpenseSort = DEFAULT_SORT,
+                            filters: list = Depends(expense_list_filters),
+                            fields: Optional[list] = Depends(expense_fields),
+                            principal: Principal = Depends(get_current_principal), 
+                            db: AsyncSession = Depends(get_async_db)):
     """
-    this is a function that allows a user to view all expenses that have to be approved by them. It expects a security bearer token to validate whom the user is
+    this is a function that allows a user to view the expenses that have to be approved by them, sorted by the sort parameter (newest first by default) and narrowed by the filter parameters. It expects a security bearer token to validate whom the user is.
+    results are paginated, when there are more expenses the cursor for the next page is returned in the X-Next-Cursor header.
+    with fields=a,b,c only those fields of each expense are returned
     """
-    db_user = get_valid_user(db, current_user)
-    if not db_user.is_approver:
+    if not principal.is_approver:
         raise HTTPException(
             status_code=404,
             detail="User is not an approver!"
         )
         
-    expenses = db.query(Expense).filter(Expense.approver_id == db_user.user_id).all()
-    
-    return expenses
+    return await expense_list_response(request, db, APPROVER, principal.user_id, limit, cursor, sort, filters, fields)
 
 @app.get("/expenses/approvals/me/{expense_id}", response_model=ExpenseOut, dependencies=[Security(HTTPBearer())])
-def get_my_approvals_by_id(expense_id: str, current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_my_approvals_by_id(expense_id: str,
+                                 request: Request,
+                                 fields: Optional[list] = Depends(expense_fields),
+                                 principal: Principal = Depends(get_current_principal)):
     """
     this is a function that allows a user to view all expenses that have to be approved by them. It expects a security bearer token to validate whom the user is and then this is followed by a lookup of the specific expense_id stated in the get request
     """
-    db_user = get_valid_user(db, current_user)
-    
-    if not db_user.is_approver:
+    if not principal.is_approver:
         raise HTTPException(
             status_code=404,
             detail="User is not an approver!"
         )
         
-    expense = db.query(Expense).filter(Expense.approver_id == db_user.user_id, Expense.expense_id == expense_id).first()
+    # a repeated view is served from the cache, the approver is checked on the cached expense
+    expense = await get_cached_expense(expense_id)
     
-    if not expense:
+    if expense is None or expense["approver_id"] != principal.user_id:
         raise HTTPException(
             status_code=404,
             detail="Expense not found or you are not the approver"
         )
-    return expense
+    
+    etag = expense_etag(request, expense)
+    unchanged = not_modified(request, etag)
+    if unchanged is not None:
+        return unchanged
+    
+    return rows_response(expense, fields, {"ETag": etag})
 
 @app.post('/expenses/approve/{expense_id}',
           response_model=ExpenseOut, 
           dependencies=[Security(HTTPBearer())])
-def approve_an_expense(expense_id: str, 
-                      current_user: str = Depends(get_current_user),
-                      db: Session = Depends(get_db)):
+async def approve_an_expense(expense_id: str, 
+                             principal: Principal = Depends(get_current_principal),
+                             db: AsyncSession = Depends(get_async_db)):
     """
     Method that allows an approver to approve an expense that is currently in submitted state
     """
-    db_user = get_valid_user(db, current_user)
-    
-    # check if the expense exists:
-    db_expense = get_valid_approver_expense(db, expense_id, db_user)
+    # only one of two approvers acting at the same time can match status == submitted, the other gets the error below
+    db_expense = await run_transition(
+        db,
+        update(Expense)
+        .where(Expense.expense_id == expense_id,
+               Expense.approver_id == principal.user_id,
+               Expense.status == StatusEnum.submitted)
+        .values(status=StatusEnum.accepted,
+                approved_at=datetime.now(timezone.utc))
+        .returning(Expense)
+    )
     
-    if not (db_expense.status == StatusEnum.submitted):
+    if db_expense is None:
+        # check if the expense exists:
+        await get_valid_approver_expense(db, expense_id, principal)
         raise HTTPException(
             status_code=404,
             detail="Only submitted expenses can be approved!"
         )
     
-    db_expense.status = StatusEnum.accepted
-    db_expense.approved_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(db_expense)
-    
+    await cache_expense(db_expense)
     return db_expense
     
     
 @app.post('/expenses/reject/{expense_id}',
           response_model=ExpenseOut, 
           dependencies=[Security(HTTPBearer())])
-def reject_an_expense(expense_id: str,
-                      rejection_reason: ExpenseRejection, 
-                      current_user: str = Depends(get_current_user),
-                      db: Session = Depends(get_db)):
+async def reject_an_expense(expense_id: str,
+                            rejection_reason: ExpenseRejection, 
+                            principal: Principal = Depends(get_current_principal),
+                            db: AsyncSession = Depends(get_async_db)):
     """
     Method that allows an approver to reject an expense that is currently in submitted state
     """
-    db_user = get_valid_user(db, current_user)
-    
-    # check if the expense exists:
-    db_expense = get_valid_approver_expense(db, expense_id, db_user)
+    # updating values, guarded on the expense still being submitted
+    db_expense = await run_transition(
+        db,
+        update(Expense)
+        .where(Expense.expense_id == expense_id,
+               Expense.approver_id == principal.user_id,
+               Expense.status == StatusEnum.submitted)
+        .values(rejection_reason=rejection_reason.rejection_reason,
+                status=StatusEnum.rejected,
+                rejected_at=datetime.now(timezone.utc))
+        .returning(Expense)
+    )
     
-    if not (db_expense.status == StatusEnum.submitted):
+    if db_expense is None:
+        # check if the expense exists:
+        await get_valid_approver_expense(db, expense_id, principal)
         raise HTTPException(
             status_code=404,
             detail="Only submitted expenses can be rejected!"
         )
     
-    # updating values
-    db_expense.rejection_reason = rejection_reason.rejection_reason
-    db_expense.status = StatusEnum.rejected
-    db_expense.rejected_at = datetime.now(timezone.utc)
-    
-    db.commit()
-    db.refresh(db_expense)
-    
+    await cache_expense(db_expense)
     return db_expense
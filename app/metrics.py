@@ -0,0 +1,56 @@
+"""
+in-process metrics, counters only go up, gauges hold the last value that was set and timings summarise observed durations.
+every worker keeps its own numbers, they are exposed as json on GET /metrics
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+
+
+def increment(name: str, value: int = 1):
+    """
+    adds value to the counter called name, the counter is created at 0 on first use
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value):
+    """
+    sets the gauge called name to value
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """
+    records one observation (e.g. a duration in ms) in the timing called name, as count, total and max
+    """
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+        timing["count"] += 1
+        timing["sum"] += value
+        timing["max"] = max(timing["max"], value)
+
+
+def get_counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    """
+    returns a copy of all the metrics of this worker
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {name: dict(timing) for name, timing in _timings.items()},
+        }
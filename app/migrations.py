@@ -0,0 +1,146 @@
+"""
+versioned schema migrations.
+Base.metadata.create_all only creates tables that are missing, it never changes a table that already exists.
+so every change to an existing table (new index, new column, new trigger...) is added here as a numbered migration,
+which lets a live mydatabase.db be brought up to date without rebuilding it.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, select, text
+
+from .model import Expense, IdSequence, ListVersion, RefreshSession, RevokedToken, SchemaMigration, TokenEpoch, User
+from .search import create_search_index, rebuild_search_index
+from .passwords import hash_password, is_hashed
+
+# list of (version, description, function) the functions take an open connection and apply one change
+MIGRATIONS = []
+
+
+def migration(version: int, description: str):
+    """
+    decorator that registers a function as the migration with the given version number
+    """
+    def register(fn):
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+# migrations have to be safe to run on a db that create_all has just built from the current models,
+# so anything they create is created with checkfirst / IF NOT EXISTS
+
+
+@migration(1, "secondary indexes on expense for the list endpoints")
+def _add_expense_list_indexes(conn):
+    for index in Expense.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+@migration(2, "id_sequence table for the expense id allocator")
+def _add_id_sequence(conn):
+    # the sequence rows are seeded by the allocator itself from the highest id already in use
+    IdSequence.__table__.create(conn, checkfirst=True)
+
+
+@migration(3, "creator/status index for the status filter on the list endpoints")
+def _add_expense_creator_status_index(conn):
+    for index in Expense.__table__.indexes:
+        if index.name == "ix_expense_creator_status_created":
+            index.create(conn, checkfirst=True)
+
+
+@migration(4, "full-text search index on expense title and description")
+def _add_expense_search_index(conn):
+    # FTS5 is an sqlite feature, on other dbs the search endpoint is not available
+    if conn.dialect.name == "sqlite":
+        create_search_index(conn)
+
+
+@migration(5, "revoked_token table for the sqlite revocation store")
+def _add_revoked_token(conn):
+    RevokedToken.__table__.create(conn, checkfirst=True)
+
+
+@migration(6, "claims_version column on user for the identity claims in tokens")
+def _add_user_claims_version(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns(User.__tablename__)}
+    if "claims_version" not in columns:
+        # "user" is a reserved word on some dbs, so the table name is quoted by the dialect
+        table_name = conn.dialect.identifier_preparer.quote(User.__tablename__)
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN claims_version INTEGER NOT NULL DEFAULT 0"))
+
+
+@migration(7, "token_epoch table for logging a user out everywhere")
+def _add_token_epoch(conn):
+    TokenEpoch.__table__.create(conn, checkfirst=True)
+
+
+@migration(8, "hash the passwords that are still stored in plaintext")
+def _hash_plaintext_passwords(conn):
+    users = User.__table__
+    for user_id, password in conn.execute(select(users.c.user_id, users.c.password)).all():
+        if password is not None and not is_hashed(password):
+            conn.execute(users.update().where(users.c.user_id == user_id).values(password=hash_password(password)))
+
+
+@migration(9, "list_version table for the ETags of the list endpoints")
+def _add_list_version(conn):
+    # lists without a row are at version 0, the first write to one of their expenses creates it
+    ListVersion.__table__.create(conn, checkfirst=True)
+
+
+@migration(10, "refresh_session table for the sqlite revocation store")
+def _add_refresh_session(conn):
+    # the spent refresh tokens already in revoked_token are left to expire there
+    RefreshSession.__table__.create(conn, checkfirst=True)
+
+
+@migration(11, "creator and approver ids in the full-text search index")
+def _add_owners_to_search_index(conn):
+    if conn.dialect.name != "sqlite":
+        return
+    # a db created after this change already has them, migration 4 built the index from the current DDL
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(expense_fts)")}
+    if "creator_id" not in columns:
+        rebuild_search_index(conn)
+
+
+def run_migrations(engine):
+    """
+    applies every migration that has not been applied yet, in version order.
+    each migration runs in its own transaction together with the row that records it, so a failure leaves the db at the last good version.
+    returns the list of versions that were applied
+    """
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(SchemaMigration.version)).scalars())
+
+    newly_applied = []
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                SchemaMigration.__table__.insert().values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.now(timezone.utc)
+                )
+            )
+        newly_applied.append(version)
+    return newly_applied
+
+
+if __name__ == "__main__":
+    # allows to upgrade an existing db in place: python -m app.migrations
+    from .database import engine
+
+    versions = run_migrations(engine)
+    if versions:
+        print(f"Applied migrations: {', '.join(str(v) for v in versions)}")
+    else:
+        print("Database schema is already up to date.")
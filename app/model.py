@@ -1,5 +1,5 @@
 # importing required data types and a way to define the columns of the table
-from sqlalchemy import Column, String, Integer, String, Boolean, Float, ForeignKey, Enum, DateTime
+from sqlalchemy import Column, String, Integer, String, Boolean, Float, ForeignKey, Enum, DateTime, Index
 # the declarative base allows us to define the table structure as a python class when it actually could convert to a SQL table schema
 from sqlalchemy.orm import declarative_base
 
@@ -36,6 +36,9 @@ class User(Base):
     password = Column(String)
     department_id = Column(Integer)
     is_approver = Column(Boolean)
+    # bumped whenever the role or department of the user changes, tokens carry the version they were issued with
+    # so a token issued before the change is refused, see principal.py
+    claims_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # the repr is a function we can define within a class so that when we call print(user) where user is an instance of User, this below item will get 
     # it is known as a representation function 
@@ -52,6 +55,15 @@ class Expense(Base):
     
     __tablename__ = "expense"
     
+    # secondary indexes for the list endpoints, every list filters on the creator or the approver and pages on (created_at, expense_id)
+    # adding or changing an index here also needs a migration in migrations.py, create_all does not touch existing tables
+    __table_args__ = (
+        Index("ix_expense_creator_created", "creator_id", "created_at", "expense_id"),
+        Index("ix_expense_creator_status_created", "creator_id", "status", "created_at"),
+        Index("ix_expense_approver_created", "approver_id", "created_at", "expense_id"),
+        Index("ix_expense_approver_status_created", "approver_id", "status", "created_at"),
+    )
+    
     expense_id = Column(String, primary_key=True)
     title = Column(String)
     description = Column(String)
@@ -76,3 +88,96 @@ class Expense(Base):
         Provides a string representation for debugging and logging.
         """
         return f"<Expense(expense_id='{self.expense_id}', title='{self.title}', amount='{self.amount}', status='{self.status}')>"
+
+
+class IdSequence(Base):
+    """
+    Holds the next free number of a named id sequence, see id_allocator.py
+    workers reserve whole blocks of numbers from here instead of counting rows
+    """
+    
+    __tablename__ = "id_sequence"
+    
+    name = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)
+    
+    def __repr__(self):
+        return f"<IdSequence(name='{self.name}', next_value={self.next_value})>"
+
+class SchemaMigration(Base):
+    """
+    Keeps track of which numbered migrations from migrations.py have been applied to this db
+    """
+    
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version}, description='{self.description}')>"
+
+class RevokedToken(Base):
+    """
+    Token ids (jti) revoked by logout, used by the sqlite revocation store in revocation.py
+    a row is only needed until the token would have expired anyway
+    """
+    
+    __tablename__ = "revoked_token"
+    
+    jti = Column(String, primary_key=True)
+    # unix timestamp of the token's exp
+    expires_at = Column(Float, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<RevokedToken(jti='{self.jti}', expires_at={self.expires_at})>"
+
+class TokenEpoch(Base):
+    """
+    Per user "tokens issued before not_before are invalid" records, used by the sqlite revocation store in revocation.py
+    one row per user, however often they log out everywhere
+    """
+    
+    __tablename__ = "token_epoch"
+    
+    # the username the tokens were issued to, or * for every user
+    subject = Column(String, primary_key=True)
+    # unix timestamp, tokens with an older iat are refused
+    not_before = Column(Float, nullable=False)
+    
+    def __repr__(self):
+        return f"<TokenEpoch(subject='{self.subject}', not_before={self.not_before})>"
+
+class RefreshSession(Base):
+    """
+    The refresh token each session (family) may use next, used by the sqlite revocation store in revocation.py
+    one row per session that refreshed at least once, replaced by every refresh
+    """
+    
+    __tablename__ = "refresh_session"
+    
+    # the fam claim of the session's tokens
+    family = Column(String, primary_key=True)
+    # jti of the refresh token the last refresh handed out
+    current_jti = Column(String, nullable=False)
+    # unix timestamp of that token's exp, the row is not needed after it
+    expires_at = Column(Float, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<RefreshSession(family='{self.family}', current_jti='{self.current_jti}')>"
+
+class ListVersion(Base):
+    """
+    A counter per expense list (the expenses a user created, or has to approve), bumped by every write to one of its expenses
+    the list endpoints build their ETag from it, see conditional.py
+    """
+    
+    __tablename__ = "list_version"
+    
+    # "creator:<user_id>" or "approver:<user_id>"
+    key = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
+    
+    def __repr__(self):
+        return f"<ListVersion(key='{self.key}', version={self.version})>"
@@ -0,0 +1,101 @@
+"""
+helpers for keyset (cursor) pagination over the expense table.
+a page is ordered on (sort column, expense_id), newest first by default, the cursor is the position of the last row of the page
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Literal
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from .model import Expense
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# the cursor for the next page is sent back as a response header so the body stays a plain list of expenses
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# sort keys accepted by the list endpoints, a leading "-" sorts descending
+ExpenseSort = Literal["-created_at", "created_at", "-amount", "amount"]
+DEFAULT_SORT = "-created_at"
+
+# the column behind each sort key and how its value is written into / read back from a cursor
+SORT_COLUMNS = {
+    "created_at": (Expense.created_at, datetime.isoformat, datetime.fromisoformat),
+    "amount": (Expense.amount, float, float),
+}
+
+
+def parse_sort(sort: str):
+    """
+    splits a sort key like "-amount" into its name and direction
+    """
+    return sort.lstrip("-"), sort.startswith("-")
+
+
+def encode_cursor(sort: str, value, expense_id: str) -> str:
+    """
+    builds an opaque cursor from the sort key and the sort values of the last row on a page
+    """
+    name, _ = parse_sort(sort)
+    _, to_json, _ = SORT_COLUMNS[name]
+    raw = json.dumps([sort, to_json(value), expense_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    """
+    turns a cursor back into the (value, expense_id) position it was built from.
+    a cursor is only valid with the sort key of the request that returned it
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, expense_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort:
+            raise ValueError("cursor was issued for a different sort")
+        name, _ = parse_sort(sort)
+        _, _, from_json = SORT_COLUMNS[name]
+        return from_json(value), str(expense_id)
+    except (ValueError, TypeError, KeyError):
+        # covers bad base64, bad json and a payload that is not a [sort, value, expense_id] triple
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid pagination cursor"
+        )
+
+
+async def paginate_expenses(db, stmt, limit: int, cursor: str | None = None, sort: str = DEFAULT_SORT):
+    """
+    applies the keyset predicate and ordering to a select() of expense columns and fetches a single page with the async session db.
+    the statement has to select the sort column and expense_id, they are needed to build the next cursor.
+    returns the rows of the page and the cursor of the next page (None on the last page)
+    """
+    name, descending = parse_sort(sort)
+    column = SORT_COLUMNS[name][0]
+
+    if cursor is not None:
+        value, expense_id = decode_cursor(cursor, sort)
+        position = tuple_(column, Expense.expense_id)
+        if descending:
+            stmt = stmt.where(position < tuple_(value, expense_id))
+        else:
+            stmt = stmt.where(position > tuple_(value, expense_id))
+
+    # expense_id breaks ties between rows with the same sort value, so the order is always stable
+    if descending:
+        stmt = stmt.order_by(column.desc(), Expense.expense_id.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), Expense.expense_id.asc())
+
+    # one extra row tells us whether there is a next page without a separate COUNT
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, name), last.expense_id)
+    return rows, next_cursor
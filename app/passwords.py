@@ -0,0 +1,135 @@
+"""
+password hashing with scrypt.
+stored passwords look like scrypt$<n>$<r>$<p>$<salt>$<hash> (salt and hash base64). a password stored by an older version
+(plaintext, or scrypt with other parameters) still verifies, and login then stores it again with the current parameters.
+
+a hash costs tens of milliseconds of CPU, so login does not hash on the event loop or in the request threads.
+the work runs in a small process pool, and when too many hashes are already waiting new logins are turned away
+(PasswordHasherBusy, a 503 for the client) instead of queueing up behind a login storm and starving the other endpoints.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import metrics
+from .config import PASSWORD_SCRYPT_N, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT
+
+SCHEME = "scrypt"
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem has to cover the 128 * n * r bytes scrypt needs, the openssl default (32 MiB) is too small for larger n
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=HASH_BYTES, maxmem=256 * n * r + 1024 * 1024)
+
+
+def hash_password(password: str, n: int = PASSWORD_SCRYPT_N) -> str:
+    """
+    hashes a password with a new random salt, in the format stored in the user table
+    """
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, n, SCRYPT_R, SCRYPT_P)
+    return f"{SCHEME}${n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored: str | None) -> bool:
+    return stored is not None and stored.startswith(f"{SCHEME}$")
+
+
+def verify_password(password: str, stored: str | None, n: int = PASSWORD_SCRYPT_N):
+    """
+    checks a password against what is stored for the user.
+    returns (matches, needs_rehash), needs_rehash is True when the stored value is not a hash with the current parameters
+    """
+    if stored is None:
+        return False, False
+
+    if not is_hashed(stored):
+        # a plaintext password from before hashing, compared in constant time
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+
+    try:
+        _, stored_n, r, p, salt, digest = stored.split("$")
+        stored_n, r, p = int(stored_n), int(r), int(p)
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+    except ValueError:
+        return False, False
+
+    matches = hmac.compare_digest(_scrypt(password, salt, stored_n, r, p), digest)
+    needs_rehash = (stored_n, r, p) != (n, SCRYPT_R, SCRYPT_P)
+    return matches, needs_rehash
+
+
+class PasswordHasherBusy(Exception):
+    """
+    raised when the hashing queue is full
+    """
+
+
+class PasswordHasher:
+    """
+    runs hash_password and verify_password in a process pool, with at most queue_limit calls waiting or running at a time
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn instead of fork, the workers only need hashlib and must not inherit the server's threads and connections
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def _run(self, name: str, fn, *args):
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                metrics.increment("password_hash_rejected")
+                raise PasswordHasherBusy("too many logins are waiting")
+            self._pending += 1
+            metrics.set_gauge("password_hash_queue_depth", self._pending)
+
+        start = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                metrics.set_gauge("password_hash_queue_depth", self._pending)
+            metrics.observe(f"password_{name}_ms", (time.monotonic() - start) * 1000)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, password: str, stored: str | None):
+        return await self._run("verify", verify_password, password, stored)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_LIMIT)
+
+
+# verified when the username does not exist, so an unknown user takes as long to refuse as a wrong password
+DUMMY_HASH = "scrypt$16384$8$1$zNGCT+EZIdyZxaq1Kv4MsA==$cKeQKOKGb+9o008btwmHyX+zP1vy/l7J8Y0mbLI2/BA="
@@ -0,0 +1,196 @@
+"""
+the identity of the caller, read from the signed claims of their token instead of the user table.
+at login the token gets the user's id (uid), department (dept), whether they approve (appr) and the claims version (cv) of the user.
+when the role or department of a user changes their claims_version has to be bumped (bump_claims_version),
+a token with an older version is refused so nobody keeps acting on a role they lost.
+change_role does both in one transaction, from the command line: python -m app.principal <username> --approver no
+the current versions are cached per worker, so most requests do not touch the user table at all.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import metrics, queries
+from .config import CLAIMS_VERSION_CACHE_SECONDS
+from .database import AsyncSessionLocal, get_async_db
+from .jwt_utils import get_current_claims
+from .model import User
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    the authenticated user of a request
+    """
+    username: str
+    user_id: str
+    department_id: int
+    is_approver: bool
+    claims_version: int = 0
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            username=user.username,
+            user_id=user.user_id,
+            department_id=user.department_id,
+            is_approver=bool(user.is_approver),
+            claims_version=user.claims_version or 0
+        )
+
+
+def identity_claims(user: User) -> dict:
+    """
+    the claims login adds to the token of user
+    """
+    return {
+        "uid": user.user_id,
+        "dept": user.department_id,
+        "appr": bool(user.is_approver),
+        "cv": user.claims_version or 0,
+    }
+
+
+class ClaimsVersionCache:
+    """
+    user_id -> claims_version read from the db, each entry is trusted for ttl seconds
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def get(self, user_id: str):
+        with self._lock:
+            entry = self._versions.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, user_id: str, version: int):
+        with self._lock:
+            self._versions[user_id] = (version, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._versions.pop(user_id, None)
+
+
+claims_versions = ClaimsVersionCache(CLAIMS_VERSION_CACHE_SECONDS)
+
+
+async def bump_claims_version(db: AsyncSession, user_id: str):
+    """
+    makes every token issued to the user so far out of date, call it after changing their role or department.
+    the change is committed by the caller together with the role change
+    """
+    await db.execute(
+        update(User).where(User.user_id == user_id).values(claims_version=User.claims_version + 1)
+    )
+    claims_versions.invalidate(user_id)
+
+
+async def change_role(db: AsyncSession, username: str, is_approver: bool | None = None,
+                      department_id: int | None = None) -> bool:
+    """
+    sets whether a user approves and/or their department and bumps their claims version in the same transaction,
+    so the tokens issued with the old role stop working. returns False when there is no such user
+    """
+    user_id = (await db.scalars(select(User.user_id).where(User.username == username))).first()
+    if user_id is None:
+        return False
+
+    values = {}
+    if is_approver is not None:
+        values["is_approver"] = is_approver
+    if department_id is not None:
+        values["department_id"] = department_id
+    if values:
+        await db.execute(update(User).where(User.user_id == user_id).values(**values))
+    await bump_claims_version(db, user_id)
+    await db.commit()
+    # again after the commit, a request in between may have cached the version that was current until now
+    claims_versions.invalidate(user_id)
+    return True
+
+
+async def get_current_principal(claims: dict = Depends(get_current_claims),
+                                db: AsyncSession = Depends(get_async_db)) -> Principal:
+    """
+    A dependency that returns the authenticated user of the request from the claims of their token.
+    It expects the token to be in the "Authorization: Bearer <token>" header.
+    """
+    user_id = claims.get("uid")
+    if user_id is None:
+        # a token issued before the identity claims were added, the user is looked up the old way
+        metrics.increment("principal_user_lookups")
+        db_user = (await db.scalars(queries.USER_BY_USERNAME, {"username": claims["sub"]})).first()
+        if not db_user:
+            raise HTTPException(
+                status_code=404,
+                detail="User not found"
+            )
+        await db.commit()
+        return Principal.from_user(db_user)
+
+    version = claims_versions.get(user_id)
+    if version is None:
+        metrics.increment("claims_version_lookups")
+        version = (await db.scalars(queries.CLAIMS_VERSION_BY_USER_ID, {"user_id": user_id})).first()
+        if version is None:
+            raise HTTPException(
+                status_code=404,
+                detail="User not found"
+            )
+        claims_versions.put(user_id, version)
+        # ends the read, so its connection is not held while the endpoint waits on reads with sessions of their own
+        await db.commit()
+
+    if version != claims.get("cv", 0):
+        raise HTTPException(
+            status_code=401,
+            detail="Your role or department has changed, please re-authenticate"
+        )
+
+    return Principal(
+        username=claims["sub"],
+        user_id=user_id,
+        department_id=claims.get("dept"),
+        is_approver=bool(claims.get("appr")),
+        claims_version=version
+    )
+
+
+if __name__ == "__main__":
+    # changes the role or department of a user, their tokens issued until now are refused:
+    # python -m app.principal <username> [--approver yes|no] [--department <id>]
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="change the role or department of a user")
+    parser.add_argument("username")
+    parser.add_argument("--approver", choices=("yes", "no"))
+    parser.add_argument("--department", type=int)
+    args = parser.parse_args()
+
+    async def main():
+        from .database import async_engine
+
+        try:
+            async with AsyncSessionLocal() as db:
+                return await change_role(db, args.username,
+                                         is_approver=None if args.approver is None else args.approver == "yes",
+                                         department_id=args.department)
+        finally:
+            # the pooled connection's thread would keep the process alive
+            await async_engine.dispose()
+
+    if asyncio.run(main()):
+        print(f"Updated {args.username}, their current tokens have to be renewed by logging in again.")
+    else:
+        print(f"There is no user {args.username}.")
@@ -0,0 +1,50 @@
+"""
+sparse fieldsets for the expense read endpoints.
+with ?fields=expense_id,status,amount only those columns are selected from the db and only those keys are sent back,
+so a summary of a long list does not load or send every description.
+"""
+from typing import Optional
+
+from fastapi import HTTPException, Query
+
+from .baseModels import ExpenseOut
+from .model import Expense
+
+# every field of ExpenseOut is a column of the expense table with the same name
+EXPENSE_FIELDS = tuple(ExpenseOut.model_fields)
+
+
+def expense_fields(fields: Optional[str] = Query(None, description="comma separated fields to return, e.g. expense_id,status,amount")):
+    """
+    dependency that parses the fields parameter, None means every field
+    """
+    if fields is None:
+        return None
+
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in EXPENSE_FIELDS]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields: {', '.join(unknown) or '(none given)'}. Choose from: {', '.join(EXPENSE_FIELDS)}"
+        )
+    # keeping the order the client asked for, without duplicates
+    return list(dict.fromkeys(requested))
+
+
+def expense_columns(fields: Optional[list], *required: str):
+    """
+    the columns to select for the requested fields, plus the ones the endpoint needs itself (like the sort key for the cursor)
+    """
+    names = EXPENSE_FIELDS if fields is None else dict.fromkeys([*fields, *required])
+    return [Expense.__table__.c[name] for name in names]
+
+
+def project(row, fields: list) -> dict:
+    """
+    the requested fields of one selected row (or of a cached expense, which is a dict)
+    """
+    if isinstance(row, dict):
+        return {name: row[name] for name in fields}
+    return {name: getattr(row, name) for name in fields}
+
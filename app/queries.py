@@ -0,0 +1,38 @@
+"""
+prebuilt statements for the lookups that run on (almost) every request.
+they are built once at import with bind parameters instead of a new query object per request,
+so SQLAlchemy skips building the statement and its cache key and goes straight to the compiled SQL in its cache.
+execute them with the values for the bind parameters, e.g. db.scalars(USER_BY_USERNAME, {"username": username})
+"""
+from sqlalchemy import bindparam, select, true
+
+from .model import Expense, ListVersion, User
+
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+
+EXPENSE_BY_ID = select(Expense).where(Expense.expense_id == bindparam("expense_id"))
+
+# every column of an expense as a plain row, without loading an Expense object
+EXPENSE_ROW_BY_ID = select(*Expense.__table__.c).where(Expense.expense_id == bindparam("expense_id"))
+
+EXPENSE_BY_ID_AND_CREATOR = select(Expense).where(
+    Expense.expense_id == bindparam("expense_id"),
+    Expense.creator_id == bindparam("user_id")
+)
+
+EXPENSE_BY_ID_AND_APPROVER = select(Expense).where(
+    Expense.expense_id == bindparam("expense_id"),
+    Expense.approver_id == bindparam("user_id")
+)
+
+# the approver of a department, used when an expense is created
+APPROVER_OF_DEPARTMENT = select(User).where(
+    User.department_id == bindparam("department_id"),
+    User.is_approver == true()
+).limit(1)
+
+# the current claims version of a user, compared with the one in their token
+CLAIMS_VERSION_BY_USER_ID = select(User.claims_version).where(User.user_id == bindparam("user_id"))
+
+# the version of an expense list, read before the list itself to answer If-None-Match
+LIST_VERSION_BY_KEY = select(ListVersion.version).where(ListVersion.key == bindparam("key"))
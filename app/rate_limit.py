@@ -0,0 +1,253 @@
+"""
+rate limiting at the edge of the app, before a request reaches an endpoint.
+every client has a token bucket: it holds up to burst tokens, refills at rate tokens a second, and each request takes one.
+a request that finds the bucket empty is answered 429 with a Retry-After header saying when a token will be there.
+login (and token refresh) is limited per client ip, since the caller is not known yet, every other route per user,
+so one runaway script only slows down its own user instead of filling the worker for everybody.
+on top of that a user can only have a few requests running at a time in a worker (USER_MAX_CONCURRENT_REQUESTS).
+
+the buckets live in RATE_LIMIT_BACKEND:
+ - redis: shared by every worker, a bucket is updated by a lua script so reading and taking a token is one atomic step.
+   when redis can not answer the worker falls back to its own buckets instead of refusing (or letting through) everyone
+ - memory: buckets of this worker only, with n workers a client gets n times the rate
+ - off: no rate limiting
+"""
+import math
+import time
+from collections import OrderedDict
+
+from jose import JWTError
+from starlette.responses import JSONResponse
+
+from . import metrics
+from .circuit_breaker import CircuitBreaker
+from .redis_clients import REDIS_FAILURES, LoopClients, redis_breaker
+
+# routes limited per client ip instead of per user
+LOGIN_PATHS = ("/login", "/login/", "/token/refresh")
+
+# bucket state is a redis hash of tokens and the time they were counted at, the clock is redis's own
+# so workers on hosts with different clocks agree. returns the seconds until a token is available (0 when one was taken)
+# as a string, redis would truncate a lua number to an integer
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class Limit:
+    """
+    a bucket size and the tokens added per second
+    """
+
+    def __init__(self, rate: float, burst: int):
+        if rate <= 0 or burst < 1:
+            raise ValueError("a rate limit needs a positive rate and a burst of at least 1")
+        self.rate = rate
+        self.burst = burst
+
+
+class MemoryRateLimiter:
+    """
+    token buckets in a dict of this worker, the least recently used ones are dropped past max_keys
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, monotonic time they were counted at)
+        self._buckets = OrderedDict()
+
+    async def acquire(self, key: str, limit: Limit) -> float:
+        """
+        takes a token from the bucket of key, returns 0 or the seconds until a token is available
+        """
+        return self.take(key, limit)
+
+    def take(self, key: str, limit: Limit) -> float:
+        # no await in here, so buckets are updated without a lock on the event loop
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - ts) * limit.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            # a full bucket of a client that went away is the same as no bucket
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def close(self):
+        pass
+
+
+class RedisRateLimiter:
+    """
+    token buckets in redis, updated by TOKEN_BUCKET_SCRIPT. calls go through a circuit breaker,
+    while redis is slow or unreachable this worker's own buckets (fallback) are used
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 0.25, breaker: CircuitBreaker | None = None,
+                 prefix: str = "rate_limit:", fallback: MemoryRateLimiter | None = None):
+        self.prefix = prefix
+        self.breaker = breaker or CircuitBreaker("rate_limit_redis", call_timeout=timeout)
+        self.fallback = fallback or MemoryRateLimiter()
+        self._clients = LoopClients(url, pool_size, timeout)
+        self._scripts = {}
+
+    def _script(self):
+        # the script object is bound to a client, it sends EVALSHA and loads the script when redis does not know it yet
+        client = self._clients.get()
+        script = self._scripts.get(id(client))
+        if script is None:
+            script = self._scripts[id(client)] = client.register_script(TOKEN_BUCKET_SCRIPT)
+        return script
+
+    async def acquire(self, key: str, limit: Limit) -> float:
+        try:
+            wait = await self.breaker.call(self._script(), keys=[self.prefix + key], args=[limit.rate, limit.burst])
+        except REDIS_FAILURES:
+            metrics.increment("rate_limit_fallbacks")
+            return self.fallback.take(key, limit)
+        return float(wait)
+
+    async def close(self):
+        self._scripts.clear()
+        await self._clients.close()
+
+
+class ConcurrencyLimiter:
+    """
+    counts the requests of each key that are running in this worker
+    """
+
+    def __init__(self, max_per_key: int):
+        self.max_per_key = max_per_key
+        self._running = {}
+
+    def acquire(self, key: str) -> bool:
+        running = self._running.get(key, 0)
+        if running >= self.max_per_key:
+            return False
+        self._running[key] = running + 1
+        return True
+
+    def release(self, key: str):
+        running = self._running.get(key, 0) - 1
+        if running > 0:
+            self._running[key] = running
+        else:
+            self._running.pop(key, None)
+
+
+def _too_many(wait: float, scope: str) -> JSONResponse:
+    metrics.increment(f"rate_limited_{scope}")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, please slow down"},
+        headers={"Retry-After": str(max(1, math.ceil(wait)))}
+    )
+
+
+class RateLimitMiddleware:
+    """
+    asgi middleware that applies the buckets and the concurrency cap before the request reaches the app.
+    the user of a request is the sub of its bearer token when the token verifies, otherwise the request counts against its ip
+    """
+
+    def __init__(self, app, limiter, login_limit: Limit, user_limit: Limit, max_concurrent: int):
+        self.app = app
+        self.limiter = limiter
+        self.login_limit = login_limit
+        self.user_limit = user_limit
+        self.concurrency = ConcurrencyLimiter(max_concurrent)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        ip = client[0] if client else "unknown"
+
+        if scope["path"] in LOGIN_PATHS:
+            wait = await self.limiter.acquire(f"ip:{ip}", self.login_limit)
+            if wait > 0:
+                await _too_many(wait, "login")(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        subject = _subject(scope)
+        key = f"user:{subject}" if subject is not None else f"ip:{ip}"
+        wait = await self.limiter.acquire(key, self.user_limit)
+        if wait > 0:
+            await _too_many(wait, "user")(scope, receive, send)
+            return
+
+        if not self.concurrency.acquire(key):
+            await _too_many(1, "concurrency")(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.concurrency.release(key)
+
+
+def _subject(scope) -> str | None:
+    """
+    the sub of the request's bearer token, None when there is none or it does not verify
+    """
+    # imported here, jwt_utils builds the revocation store and the key ring on import
+    from .jwt_utils import token_cache, keyring, VERIFIED_TOKEN_STATE
+
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            # a token used before is in the verified token cache, only a new one has its signature checked here
+            claims = token_cache.get(token)
+            if claims is None:
+                try:
+                    claims = keyring.decode(token)
+                except JWTError:
+                    return None
+                # handed to get_current_claims on the request state, so the signature is checked once per request.
+                # it is not put in token_cache, the revocation checks have not run yet
+                scope.setdefault("state", {})[VERIFIED_TOKEN_STATE] = (token, claims)
+            return claims.get("sub")
+    return None
+
+
+def create_rate_limiter(backend: str):
+    """
+    builds the bucket store for the RATE_LIMIT_BACKEND setting, None when rate limiting is off
+    """
+    from .config import REDIS_URL, REDIS_POOL_SIZE, REDIS_TIMEOUT_MS
+
+    if backend == "REDIS":
+        breaker = redis_breaker("rate_limit_redis")
+        return RedisRateLimiter(REDIS_URL, pool_size=REDIS_POOL_SIZE, timeout=REDIS_TIMEOUT_MS / 1000, breaker=breaker)
+    if backend == "MEMORY":
+        return MemoryRateLimiter()
+    if backend == "OFF":
+        return None
+    raise ValueError(f"Unknown rate limit backend {backend!r}")
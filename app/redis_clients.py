@@ -0,0 +1,61 @@
+"""
+redis.asyncio clients for the modules that talk to redis (the revocation store, the rate limiter, the expense cache).
+asyncio connections can not move between event loops: the app runs on a single loop,
+but the test client and scripts may run each call on a new one, so there is one client (and connection pool) per loop
+"""
+import asyncio
+import weakref
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# what a call through redis_breaker raises when redis did not answer: the breaker is open, the call ran out of time,
+# redis refused it or the connection failed
+REDIS_FAILURES = (CircuitOpenError, asyncio.TimeoutError, RedisError, OSError)
+
+
+def redis_breaker(name: str) -> CircuitBreaker:
+    """
+    a circuit breaker for the redis calls of one module, set up from the REDIS_* settings
+    """
+    from .config import REDIS_TIMEOUT_MS, REDIS_SLOW_CALL_MS, REDIS_BREAKER_FAILURES, REDIS_BREAKER_RESET_SECONDS
+
+    return CircuitBreaker(
+        name,
+        failure_threshold=REDIS_BREAKER_FAILURES,
+        reset_timeout=REDIS_BREAKER_RESET_SECONDS,
+        call_timeout=REDIS_TIMEOUT_MS / 1000,
+        slow_call_threshold=REDIS_SLOW_CALL_MS / 1000
+    )
+
+
+class LoopClients:
+    """
+    a redis client per event loop, each with its own pool of at most pool_size connections
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float | None = None):
+        self.url = url
+        self.pool_size = pool_size
+        # socket timeouts, so a connection that hangs is given up on instead of waiting for the os default
+        self.timeout = timeout
+        self._clients = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            pool = aioredis.ConnectionPool.from_url(self.url, max_connections=self.pool_size,
+                                                    socket_timeout=self.timeout, socket_connect_timeout=self.timeout)
+            client = aioredis.Redis(connection_pool=pool)
+            self._clients[loop] = client
+        return client
+
+    async def close(self):
+        # only the client of this loop can be closed from here, the ones of loops that are gone are just dropped
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+        self._clients.clear()
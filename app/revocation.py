@@ -0,0 +1,547 @@
+"""
+stores for revoked tokens, every authenticated request asks whether its token was revoked.
+a single token is revoked by its id (jti) on logout, and a whole session (every access and refresh token of one login) by its family id.
+refresh tokens are not revoked one by one when they are spent: a store keeps one record per session with the jti of
+the refresh token that may be used next, and every refresh replaces it (rotate_refresh). so the revoked set only grows
+with logouts, and spent refresh tokens are not sent to the mirrors of the other workers. all tokens of a user are revoked at once with an epoch:
+"tokens issued (iat) before this time are invalid", one small record per user however many sessions they had,
+and the subject * sets the epoch of every user in one write.
+the backend is picked with REVOCATION_BACKEND:
+ - redis: shared by every worker and host, through redis.asyncio with its own connection pool.
+   each worker keeps a local mirror of the revoked jtis, filled from redis on start and kept current through a pub/sub
+   channel logout publishes to, so checking a token makes no network call in the common case
+ - sqlite: a revoked_token table in the app's own database, for a single box without a redis container
+ - memory: a dict in the worker, only correct with a single worker, meant for tests and benchmarks
+all stores are async so a slow backend does not block a worker thread.
+"""
+import asyncio
+import logging
+import time
+
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import metrics
+from .circuit_breaker import CircuitBreaker
+from .model import RefreshSession, RevokedToken, TokenEpoch
+from .redis_clients import REDIS_FAILURES, LoopClients, redis_breaker
+
+logger = logging.getLogger(__name__)
+
+# jtis are uuid4 strings, this only matches those keys so other data in the same redis db is not scanned in
+JTI_KEY_PATTERN = "????????-????-????-????-????????????"
+
+# how many keys are read or written per pipeline round trip
+BATCH_SIZE = 1000
+
+# the epoch subject that applies to every user
+ALL_SUBJECTS = "*"
+
+# redis hash of subject -> epoch
+EPOCHS_KEY = "token_epochs"
+
+# redis key of a session's current refresh jti, followed by the family id
+REFRESH_KEY_PREFIX = "refresh:"
+
+
+class RevocationUnavailable(Exception):
+    """
+    raised when the store can not be reached and the revocation state of a token can not be known (or a revocation not be saved)
+    """
+
+
+class RevocationStore:
+    """
+    the interface every backend implements, exp is the unix timestamp the token expires at
+    """
+
+    def __init__(self, on_revoke=None, on_epoch=None):
+        # called with the jti of every revocation this worker learns about, e.g. to drop the token from the verified token cache
+        self.on_revoke = on_revoke
+        # same for epochs, called with the subject and the epoch
+        self.on_epoch = on_epoch
+
+    async def start(self):
+        """
+        called once when the app starts
+        """
+
+    async def close(self):
+        """
+        called once when the app stops
+        """
+
+    async def is_revoked(self, jti: str) -> bool:
+        return (await self.revoked_among([jti])) == {jti}
+
+    async def revoke(self, jti: str, exp: float):
+        await self.revoke_many([(jti, exp)])
+
+    async def revoked_among(self, jtis) -> set:
+        """
+        the jtis out of jtis that are revoked
+        """
+        raise NotImplementedError
+
+    async def rotate_refresh(self, family: str, spent_jti: str, next_jti: str, exp: float) -> bool:
+        """
+        makes next_jti (valid until exp) the refresh token of the session in place of spent_jti, in one atomic step.
+        returns False when spent_jti is not the session's current one because it was spent before,
+        so of two requests spending the same refresh token only one gets True.
+        a session without a record has not refreshed yet, its login refresh token is the current one
+        """
+        raise NotImplementedError
+
+    async def revoke_many(self, tokens):
+        """
+        revokes a list of (jti, exp) pairs
+        """
+        raise NotImplementedError
+
+    async def not_before(self, subject: str) -> float:
+        """
+        the time before which tokens issued to subject are invalid, the later of their own epoch and the one of every user (0 if neither is set)
+        """
+        epochs = await self.get_epochs([subject, ALL_SUBJECTS])
+        return max(epochs.values(), default=0)
+
+    async def get_epochs(self, subjects) -> dict:
+        """
+        subject -> epoch of the subjects that have one
+        """
+        raise NotImplementedError
+
+    async def set_epoch(self, subject: str, epoch: float):
+        """
+        invalidates every token issued to subject before epoch
+        """
+        raise NotImplementedError
+
+    def _notify(self, jti: str):
+        if self.on_revoke is not None:
+            self.on_revoke(jti)
+
+    def _notify_epoch(self, subject: str, epoch: float):
+        if self.on_epoch is not None:
+            self.on_epoch(subject, epoch)
+
+
+class MemoryRevocationStore(RevocationStore):
+    """
+    jti -> exp in a dict of this worker
+    """
+
+    def __init__(self, on_revoke=None, on_epoch=None):
+        super().__init__(on_revoke, on_epoch)
+        self._expiry = {}
+        self._epochs = {}
+        # family -> (current refresh jti, exp)
+        self._refresh = {}
+
+    async def revoked_among(self, jtis) -> set:
+        now = time.time()
+        return {jti for jti in jtis if self._expiry.get(jti, 0) > now}
+
+    async def rotate_refresh(self, family: str, spent_jti: str, next_jti: str, exp: float) -> bool:
+        now = time.time()
+        current = self._refresh.get(family)
+        if current is not None and current[1] > now and current[0] != spent_jti:
+            return False
+        # dropping the sessions that ended on the way so the dict does not grow forever
+        self._refresh = {fam: entry for fam, entry in self._refresh.items() if entry[1] > now}
+        self._refresh[family] = (next_jti, exp)
+        return True
+
+    async def revoke_many(self, tokens):
+        now = time.time()
+        # dropping the expired jtis on the way so the dict does not grow forever
+        self._expiry = {jti: exp for jti, exp in self._expiry.items() if exp > now}
+        for jti, exp in tokens:
+            self._expiry[jti] = exp
+            self._notify(jti)
+
+    async def get_epochs(self, subjects) -> dict:
+        return {subject: self._epochs[subject] for subject in subjects if subject in self._epochs}
+
+    async def set_epoch(self, subject: str, epoch: float):
+        self._epochs[subject] = epoch
+        self._notify_epoch(subject, epoch)
+
+
+class SqlRevocationStore(RevocationStore):
+    """
+    the revoked_token and token_epoch tables, reached through an async sessionmaker of the app's database.
+    epochs are read on every request that is not served from the token cache, so they are cached for epoch_cache_ttl seconds
+    """
+
+    def __init__(self, sessionmaker, on_revoke=None, on_epoch=None, epoch_cache_ttl: float = 30):
+        super().__init__(on_revoke, on_epoch)
+        self.sessionmaker = sessionmaker
+        self.epoch_cache_ttl = epoch_cache_ttl
+        # subject -> (epoch or None, cached until), None is cached too since most users never have an epoch
+        self._epochs = {}
+
+    async def revoked_among(self, jtis) -> set:
+        jtis = list(jtis)
+        async with self.sessionmaker() as db:
+            result = await db.scalars(
+                select(RevokedToken.jti).where(RevokedToken.jti.in_(jtis), RevokedToken.expires_at > time.time())
+            )
+            return set(result)
+
+    async def rotate_refresh(self, family: str, spent_jti: str, next_jti: str, exp: float) -> bool:
+        async with self.sessionmaker() as db:
+            # rows of ended sessions are not needed any more, the index on expires_at keeps this cheap
+            await db.execute(delete(RefreshSession).where(RefreshSession.expires_at <= time.time()))
+            # compare and replace in one statement, the guard matches nothing when spent_jti is not the current one
+            result = await db.execute(
+                update(RefreshSession)
+                .where(RefreshSession.family == family, RefreshSession.current_jti == spent_jti)
+                .values(current_jti=next_jti, expires_at=exp)
+            )
+            if result.rowcount != 1:
+                # the first refresh of the session creates its row, the primary key lets only one of two racing ones do it
+                db.add(RefreshSession(family=family, current_jti=next_jti, expires_at=exp))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # the session has a row with another jti, the token was spent before
+                await db.rollback()
+                return False
+        return True
+
+    async def revoke_many(self, tokens):
+        tokens = list(tokens)
+        async with self.sessionmaker() as db:
+            # rows of expired tokens are not needed any more, the index on expires_at keeps this cheap
+            await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= time.time()))
+            for jti, exp in tokens:
+                await db.merge(RevokedToken(jti=jti, expires_at=exp))
+            await db.commit()
+        for jti, _ in tokens:
+            self._notify(jti)
+
+    async def get_epochs(self, subjects) -> dict:
+        now = time.monotonic()
+        epochs = {}
+        missing = []
+        for subject in subjects:
+            cached = self._epochs.get(subject)
+            if cached is not None and cached[1] > now:
+                if cached[0] is not None:
+                    epochs[subject] = cached[0]
+            else:
+                missing.append(subject)
+
+        if missing:
+            async with self.sessionmaker() as db:
+                rows = (await db.execute(
+                    select(TokenEpoch.subject, TokenEpoch.not_before).where(TokenEpoch.subject.in_(missing))
+                )).all()
+            found = dict(rows)
+            for subject in missing:
+                self._epochs[subject] = (found.get(subject), now + self.epoch_cache_ttl)
+            epochs.update(found)
+        return epochs
+
+    async def set_epoch(self, subject: str, epoch: float):
+        async with self.sessionmaker() as db:
+            await db.merge(TokenEpoch(subject=subject, not_before=epoch))
+            await db.commit()
+        self._epochs[subject] = (epoch, time.monotonic() + self.epoch_cache_ttl)
+        self._notify_epoch(subject, epoch)
+
+
+class RedisRevocationStore(RevocationStore):
+    """
+    revoked jtis as redis keys with a TTL until their exp and epochs in one hash,
+    plus an in-memory mirror of both kept current over pub/sub
+    """
+
+    def __init__(self, url: str, channel: str, pool_size: int = 10, mirror: bool = True,
+                 on_revoke=None, on_epoch=None, reconnect_delay: float = 1.0, timeout: float = 0.25,
+                 breaker: CircuitBreaker | None = None, fail_open: bool = True):
+        super().__init__(on_revoke, on_epoch)
+        self.channel = channel
+        self.mirror = mirror
+        self.reconnect_delay = reconnect_delay
+        # lookups and revocations go through the breaker, a slow or unreachable redis fails fast instead of stalling requests
+        self.breaker = breaker or CircuitBreaker("redis", call_timeout=timeout)
+        # what a lookup does when redis can not answer: True trusts what the mirror last knew, False refuses the token
+        self.fail_open = fail_open
+        # one client (and connection pool) per event loop, see redis_clients.py
+        self._clients = LoopClients(url, pool_size, timeout)
+        # jti -> exp of the revoked tokens and subject -> epoch, only used while the mirror is in sync with redis
+        self._mirror = {}
+        self._epochs = {}
+        self._ready = asyncio.Event()
+        self._listener = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def client(self):
+        return self._clients.get()
+
+    async def start(self):
+        """
+        starts the task that loads the mirror and listens for revocations, when the mirror is turned on
+        """
+        if self.mirror and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def wait_ready(self, timeout: float | None = None) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._ready.clear()
+        await self._clients.close()
+
+    async def revoked_among(self, jtis) -> set:
+        jtis = list(jtis)
+        if self._ready.is_set():
+            now = time.time()
+            return {jti for jti in jtis if self._mirror.get(jti, 0) > now}
+
+        # without the mirror every jti is checked in redis
+        metrics.increment("revocation_mirror_fallbacks")
+        try:
+            return await self.breaker.call(self._exists_many, jtis)
+        except REDIS_FAILURES as e:
+            if not self.fail_open:
+                raise RevocationUnavailable("revoked tokens can not be checked right now") from e
+            # degraded: what the mirror last knew, a token revoked since redis went away is still accepted
+            metrics.increment("revocation_fail_open")
+            now = time.time()
+            return {jti for jti in jtis if self._mirror.get(jti, 0) > now}
+
+    async def _exists_many(self, jtis):
+        # every jti in a single round trip
+        pipe = self.client().pipeline(transaction=False)
+        for jti in jtis:
+            pipe.exists(jti)
+        return {jti for jti, exists in zip(jtis, await pipe.execute()) if exists}
+
+    async def revoke_many(self, tokens):
+        tokens = list(tokens)
+        now = time.time()
+        for start in range(0, len(tokens), BATCH_SIZE):
+            try:
+                await self.breaker.call(self._revoke_batch, tokens[start:start + BATCH_SIZE], now)
+            except REDIS_FAILURES as e:
+                # a revocation that is not saved would be undone by the next reload, whatever the policy
+                raise RevocationUnavailable("the revocation could not be saved") from e
+        # this worker does not wait for its own messages to come back
+        for jti, exp in tokens:
+            self._add(jti, exp)
+
+    async def rotate_refresh(self, family: str, spent_jti: str, next_jti: str, exp: float) -> bool:
+        try:
+            return await self.breaker.call(self._rotate_refresh, family, spent_jti, next_jti, exp)
+        except REDIS_FAILURES as e:
+            # whether the token was spent already can not be known without redis, so it is never let through
+            raise RevocationUnavailable("the refresh could not be saved") from e
+
+    async def _rotate_refresh(self, family: str, spent_jti: str, next_jti: str, exp: float) -> bool:
+        ttl = int(exp - time.time())
+        if ttl <= 0:
+            # an expired token is refused by its signature check anyway
+            return False
+        key = REFRESH_KEY_PREFIX + family
+        # the key is watched, so the replace fails when another refresh of the session changed it after the compare.
+        # nothing is published, the other workers never see refresh tokens in their mirror
+        async with self.client().pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                current = await pipe.get(key)
+                if current is not None and (current.decode() if isinstance(current, bytes) else current) != spent_jti:
+                    return False
+                pipe.multi()
+                pipe.set(key, next_jti, ex=ttl)
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def get_epochs(self, subjects) -> dict:
+        subjects = list(subjects)
+        if self._ready.is_set():
+            return {subject: self._epochs[subject] for subject in subjects if subject in self._epochs}
+
+        metrics.increment("revocation_mirror_fallbacks")
+        try:
+            values = await self.breaker.call(self.client().hmget, EPOCHS_KEY, subjects)
+        except REDIS_FAILURES as e:
+            if not self.fail_open:
+                raise RevocationUnavailable("token epochs can not be checked right now") from e
+            metrics.increment("revocation_fail_open")
+            return {subject: self._epochs[subject] for subject in subjects if subject in self._epochs}
+        return {subject: float(value) for subject, value in zip(subjects, values) if value is not None}
+
+    async def set_epoch(self, subject: str, epoch: float):
+        try:
+            await self.breaker.call(self._set_epoch, subject, epoch)
+        except REDIS_FAILURES as e:
+            raise RevocationUnavailable("the epoch could not be saved") from e
+        self._add_epoch(subject, epoch)
+
+    async def _set_epoch(self, subject: str, epoch: float):
+        pipe = self.client().pipeline(transaction=False)
+        pipe.hset(EPOCHS_KEY, subject, epoch)
+        pipe.publish(self.channel, f"epoch {subject} {epoch}")
+        await pipe.execute()
+
+    def _add_epoch(self, subject: str, epoch: float):
+        self._epochs[subject] = max(epoch, self._epochs.get(subject, 0))
+        self._notify_epoch(subject, epoch)
+
+    async def _revoke_batch(self, tokens, now: float):
+        # the keys and the messages for the other workers go out in one round trip
+        pipe = self.client().pipeline(transaction=False)
+        for jti, exp in tokens:
+            ttl = int(exp - now)
+            if ttl > 0:
+                pipe.setex(jti, ttl, "blacklisted")
+                pipe.publish(self.channel, f"{jti} {exp}")
+        await pipe.execute()
+
+    def _add(self, jti: str, exp: float):
+        self._mirror[jti] = exp
+        self._notify(jti)
+
+    async def _load(self, client):
+        """
+        reads every revoked jti from redis, their exp is worked out from the TTL of the key
+        """
+        mirror = {}
+        batch = []
+        async for key in client.scan_iter(match=JTI_KEY_PATTERN, count=BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= BATCH_SIZE:
+                await self._load_batch(client, batch, mirror)
+                batch = []
+        if batch:
+            await self._load_batch(client, batch, mirror)
+        self._mirror = mirror
+        metrics.set_gauge("revocation_mirror_size", len(mirror))
+
+        # one field per user that ever logged out everywhere, small enough to read in one go
+        epochs = await client.hgetall(EPOCHS_KEY)
+        self._epochs = {
+            (subject.decode() if isinstance(subject, bytes) else subject): float(epoch)
+            for subject, epoch in epochs.items()
+        }
+
+    async def _load_batch(self, client, keys, mirror: dict):
+        now = time.time()
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.ttl(key)
+        for key, ttl in zip(keys, await pipe.execute()):
+            # -2 means the key expired in the meantime, -1 a key without TTL which is not from logout
+            if ttl is not None and ttl > 0:
+                jti = key.decode() if isinstance(key, bytes) else key
+                mirror[jti] = now + ttl
+
+    def _apply(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        try:
+            if data.startswith("epoch "):
+                # "epoch <subject> <epoch>", the subject is a username and may contain spaces
+                subject, epoch = data[len("epoch "):].rsplit(" ", 1)
+                self._add_epoch(subject, float(epoch))
+            else:
+                jti, exp = data.split(" ", 1)
+                self._add(jti, float(exp))
+        except ValueError:
+            logger.warning("ignoring malformed revocation message %r", data)
+
+    def _prune(self):
+        now = time.time()
+        self._mirror = {jti: exp for jti, exp in self._mirror.items() if exp > now}
+        metrics.set_gauge("revocation_mirror_size", len(self._mirror))
+
+    async def _listen(self):
+        client = self.client()
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                # subscribing before loading, so a revocation made during the load is not missed
+                await pubsub.subscribe(self.channel)
+                await self._load(client)
+                self._ready.set()
+                last_prune = time.monotonic()
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        self._apply(message["data"])
+                    if time.monotonic() - last_prune > 60:
+                        self._prune()
+                        last_prune = time.monotonic()
+            except Exception as e:
+                # a lost connection or anything else that stopped the listener,
+                # revocations may be missed while disconnected, so lookups go to redis until the mirror is reloaded
+                self._ready.clear()
+                metrics.increment("revocation_mirror_errors")
+                logger.warning("revocation mirror lost redis, retrying in %ss: %s", self.reconnect_delay, e)
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except (RedisError, OSError):
+                    pass
+
+
+def create_revocation_store(backend: str, on_revoke=None, on_epoch=None) -> RevocationStore:
+    """
+    builds the store for the REVOCATION_BACKEND setting
+    """
+    from .config import (REDIS_URL, REDIS_POOL_SIZE, REDIS_TIMEOUT_MS, REVOCATION_CHANNEL, REVOCATION_MIRROR,
+                         REVOCATION_DEGRADED_POLICY, TOKEN_EPOCH_CACHE_SECONDS)
+
+    if backend == "REDIS":
+        breaker = redis_breaker("redis")
+        return RedisRevocationStore(REDIS_URL, REVOCATION_CHANNEL, pool_size=REDIS_POOL_SIZE,
+                                    mirror=REVOCATION_MIRROR, on_revoke=on_revoke, on_epoch=on_epoch,
+                                    timeout=REDIS_TIMEOUT_MS / 1000,
+                                    breaker=breaker, fail_open=REVOCATION_DEGRADED_POLICY == "FAIL_OPEN")
+    if backend == "SQLITE":
+        # imported here so the other backends do not need the database module
+        from .database import AsyncSessionLocal
+        return SqlRevocationStore(AsyncSessionLocal, on_revoke=on_revoke, on_epoch=on_epoch,
+                                  epoch_cache_ttl=TOKEN_EPOCH_CACHE_SECONDS)
+    if backend == "MEMORY":
+        return MemoryRevocationStore(on_revoke=on_revoke, on_epoch=on_epoch)
+    raise ValueError(f"Unknown revocation backend {backend!r}")
+
+
+if __name__ == "__main__":
+    # logs a user, or with no username every user, out of every session: python -m app.revocation [username]
+    import sys
+
+    from .config import REVOCATION_BACKEND
+
+    async def main(subject: str):
+        store = create_revocation_store(REVOCATION_BACKEND)
+        try:
+            await store.set_epoch(subject, time.time())
+        finally:
+            await store.close()
+
+    subject = sys.argv[1] if len(sys.argv) > 1 else ALL_SUBJECTS
+    asyncio.run(main(subject))
+    print(f"Every token issued to {'every user' if subject == ALL_SUBJECTS else subject} until now has been revoked.")
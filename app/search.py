@@ -0,0 +1,145 @@
+"""
+full-text search over the title and description of expenses, backed by an sqlite FTS5 index.
+
+the expense table has a text primary key, so its rowids are not stable (VACUUM may renumber them) and can not be used as the FTS docid.
+expense_fts_map gives every expense a stable integer docid, and the triggers below keep the map and the FTS index
+in step with every insert, update and delete on expense, whichever code path makes the change.
+the creator and approver ids are indexed too, and every search matches the caller's id in them next to the words,
+so FTS5 intersects the word lists with the caller's expenses before anything is ranked,
+instead of ranking every user's matches and filtering them afterwards.
+"""
+import re
+
+from sqlalchemy import Integer, String, column, or_, select, table, text
+
+from .model import Expense
+
+# the DDL is idempotent so the migration can run on a db that already has the index
+SEARCH_INDEX_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS expense_fts_map (
+        docid INTEGER PRIMARY KEY,
+        expense_id VARCHAR NOT NULL UNIQUE
+    )
+    """,
+    # porter stemming so "travelling" finds "travel". the words are searched in title and description only,
+    # creator_id and approver_id are there to narrow a search down to the caller's expenses
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+        title, description, creator_id, approver_id, tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expense_fts_after_insert AFTER INSERT ON expense BEGIN
+        INSERT INTO expense_fts_map (expense_id) VALUES (new.expense_id);
+        INSERT INTO expense_fts (rowid, title, description, creator_id, approver_id)
+        VALUES ((SELECT docid FROM expense_fts_map WHERE expense_id = new.expense_id),
+                new.title, new.description, new.creator_id, new.approver_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS expense_fts_after_delete AFTER DELETE ON expense BEGIN
+        DELETE FROM expense_fts WHERE rowid = (SELECT docid FROM expense_fts_map WHERE expense_id = old.expense_id);
+        DELETE FROM expense_fts_map WHERE expense_id = old.expense_id;
+    END
+    """,
+    # status changes do not touch the index, only edits of the indexed columns or the id
+    """
+    CREATE TRIGGER IF NOT EXISTS expense_fts_after_update
+    AFTER UPDATE OF expense_id, title, description, creator_id, approver_id ON expense BEGIN
+        UPDATE expense_fts_map SET expense_id = new.expense_id WHERE expense_id = old.expense_id;
+        UPDATE expense_fts SET title = new.title, description = new.description,
+                               creator_id = new.creator_id, approver_id = new.approver_id
+        WHERE rowid = (SELECT docid FROM expense_fts_map WHERE expense_id = new.expense_id);
+    END
+    """,
+]
+
+# indexes the expenses that were already there when the index was created
+BACKFILL_SQL = [
+    """
+    INSERT INTO expense_fts_map (expense_id)
+    SELECT expense_id FROM expense WHERE expense_id NOT IN (SELECT expense_id FROM expense_fts_map)
+    """,
+    """
+    INSERT INTO expense_fts (rowid, title, description, creator_id, approver_id)
+    SELECT m.docid, e.title, e.description, e.creator_id, e.approver_id
+    FROM expense_fts_map m JOIN expense e ON e.expense_id = m.expense_id
+    WHERE m.docid NOT IN (SELECT rowid FROM expense_fts)
+    """,
+]
+
+# lightweight handles on the search tables for building the query, they are created with raw DDL above and not part of the models
+expense_fts = table("expense_fts", column("rowid", Integer))
+expense_fts_map = table("expense_fts_map", column("docid", Integer), column("expense_id", String))
+
+
+def create_search_index(conn):
+    """
+    creates the FTS index and its triggers and indexes the existing expenses, sqlite only
+    """
+    for statement in SEARCH_INDEX_DDL + BACKFILL_SQL:
+        conn.exec_driver_sql(statement)
+
+
+def rebuild_search_index(conn):
+    """
+    drops the FTS index and its triggers and creates them again from SEARCH_INDEX_DDL, for a change of the indexed columns.
+    the docids in expense_fts_map are kept
+    """
+    for trigger in ("expense_fts_after_insert", "expense_fts_after_delete", "expense_fts_after_update"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS expense_fts")
+    create_search_index(conn)
+
+
+def build_match_query(q: str) -> str | None:
+    """
+    turns free text typed by a user into an FTS5 query: every word has to match and the last one may be a prefix,
+    so "office sup" finds "Office Supplies". the words are quoted so FTS5 operators in the input are taken literally.
+    returns None when there is no word to search for
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def owner_match_query(match: str, user_id: str) -> str:
+    """
+    narrows a query from build_match_query to the expenses user_id created or has to approve:
+    the words have to be in the title or description, and the user's id in creator_id or approver_id
+    """
+    # quoted like the words, a double quote inside is doubled
+    user = user_id.replace('"', '""')
+    return f'{{title description}} : ({match}) AND {{creator_id approver_id}} : "{user}"'
+
+
+async def search_expenses(db, q: str, user_id: str, limit: int, columns=None):
+    """
+    runs a ranked full-text search with the async session db over the expenses the user created or has to approve.
+    returns rows with the given expense columns (all of them by default)
+    """
+    match = build_match_query(q)
+    if match is None:
+        return []
+
+    stmt = (
+        select(*(columns or Expense.__table__.c))
+        .select_from(expense_fts)
+        .join(expense_fts_map, expense_fts_map.c.docid == expense_fts.c.rowid)
+        .join(Expense, Expense.expense_id == expense_fts_map.c.expense_id)
+        .where(
+            # only the caller's expenses are candidates, FTS5 narrows them down before ranking
+            text("expense_fts MATCH :match").bindparams(match=owner_match_query(match, user_id)),
+            # the exact check on the expense row, the ids in the index are tokenized like text
+            or_(Expense.creator_id == user_id, Expense.approver_id == user_id)
+        )
+        # bm25 with a match in the title counting twice as much as one in the description, best match first.
+        # the owner columns weigh nothing, every candidate matches there
+        .order_by(text("bm25(expense_fts, 2.0, 1.0, 0.0, 0.0)"), Expense.expense_id)
+        .limit(limit)
+    )
+    return (await db.execute(stmt)).all()
@@ -0,0 +1,40 @@
+"""
+json for the read endpoints, written straight from the selected rows.
+the rows of a column select on the expense table (and the cached expenses built from them) already hold exactly the
+fields of ExpenseOut with values of the right types, they come from our own table. validating every row again through
+the response model and then encoding it with the json module costs more than the query on a long list,
+so the rows are turned into dicts and encoded by orjson, which writes datetimes and enums itself.
+the response_model stays on the routes for the openapi docs, the write endpoints still go through it.
+"""
+from typing import Optional
+
+import orjson
+from fastapi import Response
+
+from .projection import project
+
+
+def row_dict(row, fields: Optional[list] = None) -> dict:
+    """
+    the fields of a selected row (or a cached expense, which is a dict already), every selected field when fields is None
+    """
+    if fields is not None:
+        return project(row, fields)
+    return row if isinstance(row, dict) else row._asdict()
+
+
+def dump_rows(rows, fields: Optional[list] = None) -> bytes:
+    """
+    a list of rows (or a single row) as json
+    """
+    if isinstance(rows, list):
+        return orjson.dumps([row_dict(row, fields) for row in rows])
+    return orjson.dumps(row_dict(rows, fields))
+
+
+def rows_response(rows, fields: Optional[list] = None, headers: Optional[dict] = None) -> Response:
+    """
+    a response with the rows as they are, built directly so the response model does not validate them again
+    (or fill in the fields that were not asked for)
+    """
+    return Response(content=dump_rows(rows, fields), media_type="application/json", headers=headers)
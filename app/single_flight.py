@@ -0,0 +1,63 @@
+"""
+request coalescing for identical reads.
+when many clients ask for the same thing at the same moment (every approver opening their inbox at shift start),
+only the first request (the leader) runs the query, the ones that arrive while it is running wait for it and get the same result.
+the work runs in its own task, so a leader whose client goes away does not cancel it for the others.
+a key has to contain everything the result depends on: the route, the caller and the parameters,
+plus a version of the data where there is one, so a request made after a write never gets a result read before it.
+"""
+import asyncio
+
+from . import metrics
+
+
+class SingleFlight:
+    """
+    key -> the task computing it, for the reads that are running right now in this worker
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights = {}
+        self._leaders = 0
+        self._followers = 0
+
+    async def run(self, key, fn):
+        """
+        the result of fn(), shared with every other call with the same key that is running at the same time
+        """
+        loop = asyncio.get_running_loop()
+        task = self._flights.get(key)
+        if task is not None and task.get_loop() is loop:
+            self._count(follower=True)
+        else:
+            task = loop.create_task(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self._count(follower=False)
+        # shielded, so one waiter being cancelled does not cancel the task for the others
+        return await asyncio.shield(task)
+
+    def forget(self, key):
+        """
+        makes the next call with key start a new run, for a write that makes a running read out of date
+        """
+        self._flights.pop(key, None)
+
+    def _finished(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # marks the exception as retrieved when every waiter went away before it was raised
+            task.exception()
+
+    def _count(self, follower: bool):
+        if follower:
+            self._followers += 1
+            metrics.increment(f"{self.name}_coalesced")
+        else:
+            self._leaders += 1
+            metrics.increment(f"{self.name}_executed")
+        # share of the requests that did not run their own query
+        metrics.set_gauge(f"{self.name}_coalescing_ratio",
+                          round(self._followers / (self._leaders + self._followers), 4))
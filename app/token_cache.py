@@ -0,0 +1,109 @@
+"""
+an in-process LRU cache of tokens that were already verified.
+a client reuses the same token for up to 30 minutes, so after the first request its signature check and claim parsing
+are replaced by a dictionary lookup. entries are keyed by a digest of the token so the raw tokens are not kept in memory.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    bounded LRU of digest -> decoded claims.
+    an entry is dropped at the token's exp, after max_age seconds (0 means only at exp), when it is revoked, or when the cache is full
+    """
+
+    def __init__(self, max_size: int, max_age: int = 0):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # digest -> (claims, expires_at), the least recently used entry is first
+        self._entries = OrderedDict()
+        # jti -> digest, so a revoked jti can be found without the token
+        self._by_jti = {}
+
+    def get(self, token: str):
+        """
+        the cached claims of the token, or None when it is not cached or the entry has expired
+        """
+        if self.max_size <= 0:
+            return None
+        digest = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                claims, expires_at = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(digest)
+                    metrics.increment("token_cache_hits")
+                    return claims
+                self._remove(digest)
+        metrics.increment("token_cache_misses")
+        return None
+
+    def put(self, token: str, claims: dict):
+        """
+        caches the verified claims of token until its exp
+        """
+        if self.max_size <= 0:
+            return
+        expires_at = claims["exp"]
+        if self.max_age > 0:
+            expires_at = min(expires_at, time.time() + self.max_age)
+        digest = token_digest(token)
+        with self._lock:
+            self._remove(digest)
+            self._entries[digest] = (claims, expires_at)
+            self._by_jti[claims["jti"]] = digest
+            # evicting the least recently used entries once the cache is full
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def revoke(self, jti: str):
+        """
+        drops the entry of the token with this jti, it has to be verified again (and found revoked) on its next use.
+        a revoked id can also be a session family (fam claim), then every token of that session is dropped
+        """
+        with self._lock:
+            digest = self._by_jti.get(jti)
+            if digest is not None:
+                self._remove(digest)
+                return
+            stale = [digest for digest, (claims, _) in self._entries.items() if claims.get("fam") == jti]
+            for digest in stale:
+                self._remove(digest)
+
+    def revoke_issued_before(self, subject: str, epoch: float):
+        """
+        drops the entries of tokens issued to subject (every subject for "*") before epoch
+        """
+        with self._lock:
+            stale = [
+                digest for digest, (claims, _) in self._entries.items()
+                if subject in ("*", claims.get("sub")) and claims.get("iat", 0) < epoch
+            ]
+            for digest in stale:
+                self._remove(digest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_jti.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, digest: str):
+        # the caller holds the lock
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self._by_jti.pop(entry[0]["jti"], None)
@@ -0,0 +1,68 @@
+"""
+measures the cost of authenticating a request (get_current_claims, then get_current_user) with each revocation store.
+with REVOCATION_BACKEND=sqlite or memory this runs on one box without a redis container, redis is included with BENCH_REDIS=1 and needs REDIS_URL to point at a server.
+the verified token cache is cleared before every call so each call decodes the token and asks the store, the way a first request does.
+
+run it from the root of the repo with: SECRET_KEY=... python -m benchmarks.bench_auth
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from fastapi import Request
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import jwt_utils
+from app.config import REDIS_URL
+from app.model import Base
+from app.revocation import MemoryRevocationStore, RedisRevocationStore, SqlRevocationStore
+
+ROUNDS = 2000
+
+
+async def authenticate(credentials):
+    # a bare request, nothing was verified by the rate limit middleware on its state
+    request = Request({"type": "http", "headers": []})
+    claims = await jwt_utils.get_current_claims(request, credentials)
+    return await jwt_utils.get_current_user(claims)
+
+
+async def bench(name, store):
+    jwt_utils.revocation_store = store
+    token = jwt_utils.create_jwt_token({"sub": "bench"})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    for cached in (False, True):
+        await authenticate(credentials)
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            if not cached:
+                jwt_utils.token_cache.clear()
+            await authenticate(credentials)
+        elapsed = time.perf_counter() - start
+        label = "cached" if cached else "uncached"
+        print(f"{name:<8} {label:<9} {elapsed / ROUNDS * 1e6:8.1f} us per request")
+
+
+async def main():
+    await bench("memory", MemoryRevocationStore())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await bench("sqlite", SqlRevocationStore(async_sessionmaker(engine, expire_on_commit=False)))
+        await engine.dispose()
+
+    if os.environ.get("BENCH_REDIS"):
+        store = RedisRevocationStore(REDIS_URL, "bench_revoked_tokens")
+        await store.start()
+        await store.wait_ready(5)
+        await bench("redis", store)
+        await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+"""
+measures how many tokens per second a worker can sign and verify with each algorithm the key ring supports.
+the keys are parsed once up front like the key ring does, so this is the cost per request and not of loading keys.
+python-jose uses the cryptography package when it is installed and much slower pure python code otherwise,
+so run this where the requirements are installed to get numbers that match production.
+
+run it from the root of the repo with: python -m benchmarks.bench_jwt_algorithms
+"""
+import time
+
+import ecdsa
+import rsa
+
+from app.keyring import KeyRing, load_key
+
+SECONDS = 1.0
+
+CLAIMS = {"sub": "bench", "uid": "UID01", "dept": 1, "appr": True, "cv": 0, "jti": "bench", "exp": 4102444800}
+
+
+def rate(fn):
+    # calls fn for about SECONDS and returns the calls per second
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < SECONDS:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    keys = [
+        load_key("hs256", "HS256", secret="bench secret of reasonable length, 32+ bytes"),
+        load_key("rs256", "RS256", private_key=rsa.newkeys(2048)[1].save_pkcs1().decode()),
+        load_key("es256", "ES256", private_key=ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).to_pem().decode()),
+    ]
+
+    print(f"{'alg':<8} {'sign/s':>10} {'verify/s':>10} {'token bytes':>12}")
+    for key in keys:
+        ring = KeyRing([key], active=key.kid)
+        token = ring.sign(CLAIMS)
+        signs = rate(lambda: ring.sign(CLAIMS))
+        verifies = rate(lambda: ring.decode(token))
+        print(f"{key.alg:<8} {signs:>10.0f} {verifies:>10.0f} {len(token):>12}")
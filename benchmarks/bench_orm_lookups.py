@@ -0,0 +1,61 @@
+"""
+measures the ORM overhead of the per request lookups in main.py.
+compares the old style db.query(...).filter(...).first(), which builds a new query object on every call,
+with the prebuilt statements in app/queries.py that are built once and only get new values for their bind parameters.
+
+run it from the root of the repo with: python -m benchmarks.bench_orm_lookups
+"""
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import queries
+from app.model import Base, Expense, StatusEnum, User
+
+ROUNDS = 5000
+
+
+def setup_session():
+    """
+    an in-memory db with one user and one expense to look up
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(user_id="UID01", username="bench", password="password",
+                     department_id=1, is_approver=True))
+    session.add(Expense(expense_id="EID00000001", title="Bench", description="Bench expense", amount=1.0,
+                        creator_id="UID01", approver_id="UID01", status=StatusEnum.draft))
+    session.commit()
+    return session
+
+
+def legacy_lookups(db):
+    db.query(User).filter(User.username == "bench").first()
+    db.query(Expense).filter(Expense.expense_id == "EID00000001",
+                             Expense.creator_id == "UID01").first()
+
+
+def prebuilt_lookups(db):
+    db.scalars(queries.USER_BY_USERNAME, {"username": "bench"}).first()
+    db.scalars(queries.EXPENSE_BY_ID_AND_CREATOR,
+               {"expense_id": "EID00000001", "user_id": "UID01"}).first()
+
+
+def bench(name, fn, db):
+    # one warm up call so both sides start with the compiled SQL already in the cache
+    fn(db)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(db)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed / ROUNDS * 1e6:8.1f} us per request (2 lookups)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    db = setup_session()
+    before = bench("legacy", legacy_lookups, db)
+    after = bench("prebuilt", prebuilt_lookups, db)
+    print(f"prebuilt statements take {after / before:.0%} of the legacy time")
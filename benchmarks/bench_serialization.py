@@ -0,0 +1,87 @@
+"""
+measures turning a page of expense rows into the json body of a list response, at 1k, 10k and 100k rows.
+compares the response_model path (every row validated into an ExpenseOut, made json friendly, encoded by the json module),
+a TypeAdapter built once that validates and dumps the whole list, and the rows encoded by orjson as they are (serialization.py).
+the query is run once up front, only the serialization is timed.
+
+run it from the root of the repo with: python -m benchmarks.bench_serialization
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+
+from app.baseModels import ExpenseOut
+from app.model import Base, Expense, StatusEnum
+from app.serialization import dump_rows
+
+SIZES = (1000, 10000, 100000)
+
+EXPENSE_LIST = TypeAdapter(List[ExpenseOut])
+
+
+def load_rows(count: int):
+    """
+    count expenses in an in-memory db, selected the way the list endpoints select them
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    created = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(Expense.__table__.insert(), [
+            {
+                "expense_id": f"EID{i:08d}",
+                "title": f"Expense {i}",
+                "description": "Train tickets and a hotel night for the quarterly review with the remote office",
+                "amount": 10.45 + i,
+                "creator_id": "UID01",
+                "approver_id": "UID02",
+                "status": StatusEnum.accepted if i % 2 else StatusEnum.submitted,
+                "created_at": created + timedelta(seconds=i, microseconds=i % 1000),
+                "approved_at": created + timedelta(days=1, seconds=i) if i % 2 else None,
+            }
+            for i in range(count)
+        ])
+    with engine.connect() as conn:
+        return conn.execute(select(*Expense.__table__.c)).all()
+
+
+def response_model_path(rows) -> bytes:
+    models = [ExpenseOut.model_validate(row, from_attributes=True) for row in rows]
+    return json.dumps(jsonable_encoder(models), separators=(",", ":")).encode()
+
+
+def type_adapter_path(rows) -> bytes:
+    return EXPENSE_LIST.dump_json(EXPENSE_LIST.validate_python(rows, from_attributes=True))
+
+
+def orjson_rows_path(rows) -> bytes:
+    return dump_rows(rows)
+
+
+def bench(name, fn, rows, rounds):
+    fn(rows)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = fn(rows)
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"  {name:<15} {elapsed * 1000:9.2f} ms per page  ({len(body) / 1024:,.0f} KiB)")
+    return elapsed
+
+
+if __name__ == "__main__":
+    for size in SIZES:
+        rows = load_rows(size)
+        # fewer rounds for the big pages so the whole run stays under a minute
+        rounds = max(1, 20000 // size)
+        print(f"{size:,} rows")
+        # the three paths have to produce the same document
+        assert json.loads(response_model_path(rows[:100])) == json.loads(orjson_rows_path(rows[:100]))
+        baseline = bench("response_model", response_model_path, rows, rounds)
+        bench("type_adapter", type_adapter_path, rows, rounds)
+        fast = bench("orjson rows", orjson_rows_path, rows, rounds)
+        print(f"  orjson rows take {fast / baseline:.0%} of the response_model time")
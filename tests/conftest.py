@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+# the suite runs on one machine without a redis server, so every store the app builds on import is the in-memory one.
+# the redis stores are tested on their own with the redis_url fixture below
+os.environ.setdefault("RATE_LIMIT_BACKEND", "MEMORY")
+os.environ.setdefault("REVOCATION_BACKEND", "MEMORY")
+os.environ.setdefault("EXPENSE_CACHE_BACKEND", "MEMORY")
+
+# the whole suite logs in and calls the api from the one test client ip far faster than any real client,
+# so the rate limits are raised before the app is imported. tests/test_rate_limit.py checks the limits themselves
+os.environ.setdefault("RATE_LIMIT_LOGIN_PER_MINUTE", "1000000")
+os.environ.setdefault("RATE_LIMIT_LOGIN_BURST", "1000000")
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "1000000")
+os.environ.setdefault("RATE_LIMIT_BURST", "1000000")
+
+
+@pytest.fixture
+def create_expense():
+    """
+    posts a test expense with the given auth header and returns its id.
+    the ids are handed out by the allocator, so tests look up an expense they created themselves
+    """
+    # imported here, the settings above have to be in place before the app is imported
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+
+    def create(header):
+        payload = {
+            "title": "Test Item",
+            "description": "This is a test item i created during a unit test",
+            "amount": 10.45
+        }
+        response = client.post("/expenses/", headers=header, json=payload)
+        assert response.status_code == 200
+        return response.json()["expense_id"]
+
+    return create
+
+
+@pytest.fixture
+def redis_url(monkeypatch):
+    """
+    the url for the tests of the redis stores: the server at REDIS_URL when one answers,
+    otherwise the same url served by an in-process fakeredis. the test is skipped when there is neither
+    """
+    import redis
+    import redis.asyncio as aioredis
+    from app.config import REDIS_URL
+
+    try:
+        with redis.Redis.from_url(REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2) as client:
+            client.ping()
+        return REDIS_URL
+    except (redis.RedisError, OSError):
+        pass
+
+    fakeredis = pytest.importorskip("fakeredis", reason="needs a redis server at REDIS_URL or the fakeredis package")
+    from fakeredis.aioredis import FakeAsyncRedisConnection
+
+    # every client the test builds (one per event loop, see app/redis_clients.py) talks to the same fake server
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        return aioredis.ConnectionPool(connection_class=FakeAsyncRedisConnection, server=server, **kwargs)
+
+    monkeypatch.setattr(aioredis.ConnectionPool, "from_url", from_url)
+    return REDIS_URL
@@ -62,7 +62,7 @@ def test_get_approvals():
     for item in data:
         is_valid_expense_syntax(item)
 
-def test_get_approvals_explicitly():
+def test_get_approvals_explicitly(create_expense):
     """
     Tests the GET /approvals/me to return a single expenses.
     It expects a 200 status code and a an expense in the response body.
@@ -72,8 +72,8 @@ def test_get_approvals_explicitly():
 
     header = {"Authorization":f"Bearer {token}"}
     
-
-    response = client.get("/expenses/approvals/me/EID07", headers=header)
+    expense_id = create_expense(header)
+    response = client.get(f"/expenses/approvals/me/{expense_id}", headers=header)
     assert response.status_code == 200
     
     data = response.json()
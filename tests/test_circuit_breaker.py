@@ -0,0 +1,132 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app import metrics
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from app.config import REDIS_URL
+from app.revocation import RedisRevocationStore, RevocationUnavailable
+
+
+async def ok():
+    return "ok"
+
+
+async def fail():
+    raise ConnectionError("down")
+
+
+async def slow():
+    await asyncio.sleep(0.05)
+    return "slow"
+
+
+async def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            await breaker.call(fail)
+
+
+def test_breaker_opens_and_recovers():
+    """
+    Tests that the breaker opens after repeated failures, rejects calls while open and closes after a good trial call.
+    """
+    async def run():
+        breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0.1)
+        assert await breaker.call(ok) == "ok"
+
+        await open_breaker(breaker)
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(ok)
+
+        await asyncio.sleep(0.15)
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        # the breaker already let one trial call through, the next caller is rejected until it is back
+        assert not breaker.allow()
+        breaker._trial_running = False
+
+        assert await breaker.call(ok) == "ok"
+        assert breaker.state == CLOSED
+        assert metrics.snapshot()["gauges"]["test_circuit_state"] == CLOSED
+
+    asyncio.run(run())
+
+
+def test_cancelled_trial_does_not_block_the_breaker():
+    """
+    Tests that a half-open trial call that is cancelled lets a later trial through, so the breaker can still close.
+    """
+    async def run():
+        breaker = CircuitBreaker("test_cancel", failure_threshold=2, reset_timeout=0.05, call_timeout=1)
+        await open_breaker(breaker)
+        await asyncio.sleep(0.06)
+
+        trial = asyncio.create_task(breaker.call(slow))
+        await asyncio.sleep(0.01)
+        assert breaker.state == HALF_OPEN
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        # the cancelled trial counts as failed
+        assert breaker.state == OPEN
+
+        await asyncio.sleep(0.06)
+        assert await breaker.call(ok) == "ok"
+        assert breaker.state == CLOSED
+
+        # a cancelled call of a closed breaker is not a failure
+        call = asyncio.create_task(breaker.call(slow))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert breaker.failures == 0
+
+    asyncio.run(run())
+
+
+def test_breaker_counts_timeouts_and_slow_calls():
+    """
+    Tests that calls over the time budget fail, and that slow calls count towards opening the breaker.
+    """
+    async def run():
+        breaker = CircuitBreaker("test_slow", failure_threshold=2, call_timeout=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call(slow)
+
+        breaker = CircuitBreaker("test_slow", failure_threshold=2, call_timeout=1, slow_call_threshold=0.01)
+        assert await breaker.call(slow) == "slow"
+        assert await breaker.call(slow) == "slow"
+        assert breaker.state == OPEN
+        assert metrics.snapshot()["timings"]["test_slow_call_ms"]["count"] >= 3
+
+    asyncio.run(run())
+
+
+def test_redis_store_degraded_policies():
+    """
+    Tests the redis store while its breaker is open: failing open answers from the local state,
+    failing closed and revoking raise RevocationUnavailable.
+    """
+    async def run():
+        known = str(uuid.uuid4())
+        for fail_open in (True, False):
+            breaker = CircuitBreaker("test_redis", failure_threshold=1, reset_timeout=60)
+            store = RedisRevocationStore(REDIS_URL, "test_revoked_tokens", mirror=False, breaker=breaker, fail_open=fail_open)
+            store._add(known, time.time() + 60)
+            await open_breaker(breaker)
+
+            if fail_open:
+                assert await store.is_revoked(known)
+                assert not await store.is_revoked(str(uuid.uuid4()))
+            else:
+                with pytest.raises(RevocationUnavailable):
+                    await store.is_revoked(known)
+            with pytest.raises(RevocationUnavailable):
+                await store.revoke(str(uuid.uuid4()), time.time() + 60)
+
+    asyncio.run(run())
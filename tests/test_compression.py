@@ -0,0 +1,105 @@
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.compression import CompressionMiddleware, choose_encoding
+
+# a small app with one large and one small response, so the sizes do not depend on what is in the db
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=1024, threadpool_size=16384)
+
+LARGE = b'[' + b','.join(b'{"description":"Train tickets and a hotel night for the quarterly review"}' for _ in range(500)) + b']'
+
+
+@app.get("/large")
+def large():
+    return Response(content=LARGE, media_type="application/json")
+
+
+@app.get("/medium")
+def medium():
+    return Response(content=LARGE[:4096], media_type="application/json")
+
+
+@app.get("/small")
+def small():
+    return {"message": "welcome to expense submission tool"}
+
+
+@app.get("/image")
+def image():
+    return Response(content=LARGE, media_type="image/png")
+
+
+client = TestClient(app)
+
+
+def test_choose_encoding():
+    """
+    Tests the negotiation of the Accept-Encoding header, with the q weights and the server's preference on ties.
+    """
+    available = {"zstd": None, "br": None, "gzip": None}
+    assert choose_encoding("gzip, deflate", available) == "gzip"
+    assert choose_encoding("gzip, br, zstd", available) == "zstd"
+    assert choose_encoding("gzip;q=1.0, zstd;q=0.5", available) == "gzip"
+    assert choose_encoding("*", available) == "zstd"
+    assert choose_encoding("*, zstd;q=0", available) == "br"
+    assert choose_encoding("gzip;q=0", available) is None
+    assert choose_encoding("identity", available) is None
+    assert choose_encoding("", available) is None
+    assert choose_encoding("br", {"gzip": None}) is None
+
+
+def test_large_response_compressed():
+    """
+    Tests that a large response is sent gzip compressed, with a matching Content-Length, and decompresses to the body.
+    """
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    compressed = response.num_bytes_downloaded
+    assert int(response.headers["Content-Length"]) == compressed
+    assert compressed < len(LARGE) / 10
+    # httpx decompresses on its own
+    assert response.content == LARGE
+
+
+def test_small_response_not_compressed():
+    """
+    Tests that a response below the size threshold is sent as is.
+    """
+    skipped = metrics.get_counter("compression_skipped_small")
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert response.json() == {"message": "welcome to expense submission tool"}
+    assert metrics.get_counter("compression_skipped_small") == skipped + 1
+
+
+def test_not_compressed_without_accept_encoding():
+    """
+    Tests that a client that does not accept gzip, or already compressed content, gets the body as is.
+    """
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.content == LARGE
+
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.content == LARGE
+
+
+def test_compression_measured_per_route():
+    """
+    Tests that the bytes before and after and the CPU time are recorded under the route,
+    both for a body compressed on the event loop (/medium) and one compressed in the thread pool (/large).
+    """
+    for path, size in (("/medium", 4096), ("/large", len(LARGE))):
+        bytes_in = metrics.get_counter(f"compression_bytes_in:{path}")
+        bytes_out = metrics.get_counter(f"compression_bytes_out:{path}")
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert metrics.get_counter(f"compression_bytes_in:{path}") == bytes_in + size
+        assert metrics.get_counter(f"compression_bytes_out:{path}") == bytes_out + response.num_bytes_downloaded
+        assert f"compression_cpu_ms:{path}" in metrics.snapshot()["timings"]
@@ -0,0 +1,92 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_list_not_modified_until_a_write(create_expense):
+    """
+    Tests GET /expenses/me with If-None-Match.
+    It expects a 304 with no body while nothing changed, and a 200 with a new ETag after an expense was created or deleted.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    response = client.get("/expenses/me", headers=header)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/expenses/me", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    e_id = create_expense(header)
+    response = client.get("/expenses/me", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    assert client.delete(f"/expenses/delete/{e_id}", headers=header).status_code == 200
+    response = client.get("/expenses/me", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_list_etag_depends_on_the_query():
+    """
+    Tests that another page or filter of the same list has its own ETag.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    etag = client.get("/expenses/me", headers=header).headers["ETag"]
+    response = client.get("/expenses/me?status=draft", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_approvals_list_bumped_by_transitions(create_expense):
+    """
+    Tests that submitting and approving an expense changes the approver's list ETag.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    e_id = create_expense(header)
+    etag = client.get("/expenses/approvals/me", headers=header).headers["ETag"]
+    assert client.get("/expenses/approvals/me", headers={**header, "If-None-Match": etag}).status_code == 304
+
+    assert client.post(f"/expenses/submit/{e_id}", headers=header).status_code == 200
+    response = client.get("/expenses/approvals/me", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    assert client.post(f"/expenses/approve/{e_id}", headers=header).status_code == 200
+    assert client.get("/expenses/approvals/me", headers={**header, "If-None-Match": etag}).status_code == 200
+
+
+def test_detail_not_modified(create_expense):
+    """
+    Tests GET /expenses/me/EID with If-None-Match before and after the expense is submitted.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    e_id = create_expense(header)
+    etag = client.get(f"/expenses/me/{e_id}", headers=header).headers["ETag"]
+    assert client.get(f"/expenses/me/{e_id}", headers={**header, "If-None-Match": etag}).status_code == 304
+    # W/ or not, and in a list of tags
+    response = client.get(f"/expenses/me/{e_id}", headers={**header, "If-None-Match": f'"other", {etag[2:]}'})
+    assert response.status_code == 304
+
+    assert client.post(f"/expenses/submit/{e_id}", headers=header).status_code == 200
+    response = client.get(f"/expenses/me/{e_id}", headers={**header, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["status"] == "submitted"
+
+
+def get_auth_token(username="patson"):
+
+    payload = {
+    "username": username,
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import config
+from app.database import configure_engine, engine_options
+
+# PRAGMA synchronous reads back as a number
+SYNCHRONOUS_LEVELS = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+
+# run in a fresh interpreter, since the settings are read once when app.config is imported
+READ_SETTINGS = """
+import json
+from app.database import engine
+with engine.connect() as conn:
+    pragmas = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in ("journal_mode", "busy_timeout", "synchronous")}
+print(json.dumps({**pragmas, "pool_size": engine.pool.size(), "max_overflow": engine.pool._max_overflow,
+                  "pool_timeout": engine.pool._timeout}))
+"""
+
+
+def read_pragmas(engine):
+    with engine.connect() as conn:
+        return {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in ("journal_mode", "busy_timeout", "synchronous", "cache_size")}
+
+
+def test_pragmas_applied_on_new_connections(tmp_path):
+    """
+    Tests that a fresh connection of an engine set up like the app's has the configured sqlite pragmas and pool size.
+    """
+    url = f"sqlite:///{tmp_path / 'pragmas.db'}"
+    engine = create_engine(url, **engine_options(url))
+    configure_engine(engine)
+
+    assert read_pragmas(engine) == {
+        "journal_mode": config.SQLITE_JOURNAL_MODE.lower(),
+        "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+        "synchronous": SYNCHRONOUS_LEVELS[config.SQLITE_SYNCHRONOUS],
+        "cache_size": config.SQLITE_CACHE_SIZE,
+    }
+    assert engine.pool.size() == config.DB_POOL_SIZE
+    engine.dispose()
+
+
+def test_in_memory_sqlite_has_no_pool_settings():
+    assert "pool_size" not in engine_options("sqlite://")
+    assert "pool_size" not in engine_options("sqlite:///:memory:")
+
+
+def test_environment_overrides(tmp_path):
+    """
+    Tests that the DB_* and SQLITE_* environment variables reach the engine the app creates.
+    """
+    env = {
+        **os.environ,
+        "DB_URL": f"sqlite:///{tmp_path / 'overrides.db'}",
+        "SQLITE_JOURNAL_MODE": "delete",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_BUSY_TIMEOUT_MS": "1234",
+        "DB_POOL_SIZE": "3",
+        "DB_MAX_OVERFLOW": "2",
+        "DB_POOL_TIMEOUT": "7",
+    }
+    env.pop("ASYNC_DB_URL", None)
+    result = subprocess.run([sys.executable, "-c", READ_SETTINGS], env=env, capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == {
+        "journal_mode": "delete",
+        "busy_timeout": 1234,
+        "synchronous": 2,
+        "pool_size": 3,
+        "max_overflow": 2,
+        "pool_timeout": 7,
+    }
+
+
+def test_invalid_settings_are_refused(monkeypatch):
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "sometimes")
+    with pytest.raises(ValueError):
+        config._get_choice("SQLITE_SYNCHRONOUS", "NORMAL", ("OFF", "NORMAL", "FULL", "EXTRA"))
+
+    monkeypatch.setenv("DB_POOL_SIZE", "five")
+    with pytest.raises(ValueError):
+        config._get_int("DB_POOL_SIZE", 5)
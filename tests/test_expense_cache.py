@@ -0,0 +1,202 @@
+import asyncio
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.expense_cache import ExpenseCache, LocalTier
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def entry(expense_id, status="draft"):
+    return {"expense_id": expense_id, "status": status, "creator_id": "UID01"}
+
+
+def test_local_tier_lru_and_expiry():
+    tier = LocalTier(max_size=2, max_age=60)
+    tier.put("a", entry("a"))
+    tier.put("b", entry("b"))
+    assert tier.get("a")["expense_id"] == "a"
+    tier.put("c", entry("c"))
+    # b was the least recently used one
+    assert tier.get("b") is None
+    assert tier.get("a") is not None
+
+    tier = LocalTier(max_size=2, max_age=0.01)
+    tier.put("a", entry("a"))
+    time.sleep(0.02)
+    assert tier.get("a") is None
+
+
+def test_memory_cache_put_and_invalidate():
+    async def run():
+        cache = ExpenseCache(local_size=10, local_max_age=60)
+        assert await cache.get("EID1") is None
+        await cache.put("EID1", entry("EID1"))
+        assert (await cache.get("EID1"))["status"] == "draft"
+        await cache.invalidate("EID1")
+        assert await cache.get("EID1") is None
+
+    asyncio.run(run())
+
+
+def test_fill_does_not_replace_a_newer_write():
+    """
+    Tests a miss that read the expense before a write and fills the cache after it:
+    the entry of the write stays in the local tier, and a fill without a write in between is cached.
+    """
+    async def run():
+        cache = ExpenseCache(local_size=10, local_max_age=60)
+        generation = cache.generation()
+        # the write lands while the miss is reading the db
+        await cache.put("EID1", entry("EID1", "accepted"))
+        await cache.fill("EID1", entry("EID1", "submitted"), generation)
+        assert (await cache.get("EID1"))["status"] == "accepted"
+
+        generation = cache.generation()
+        await cache.invalidate("EID1")
+        await cache.fill("EID1", entry("EID1", "submitted"), generation)
+        assert await cache.get("EID1") is None
+
+        generation = cache.generation()
+        await cache.fill("EID2", entry("EID2"), generation)
+        assert (await cache.get("EID2"))["status"] == "draft"
+
+    asyncio.run(run())
+
+
+def test_fill_after_a_forgotten_write():
+    """
+    Tests that a write is still seen by fill once the expense dropped out of the bounded record of writes.
+    """
+    async def run():
+        cache = ExpenseCache(local_size=2, local_max_age=60)
+        generation = cache.generation()
+        await cache.put("EID1", entry("EID1", "accepted"))
+        await cache.put("EID2", entry("EID2"))
+        await cache.put("EID3", entry("EID3"))
+        await cache.fill("EID1", entry("EID1", "submitted"), generation)
+        assert cache.local.get("EID1") is None
+
+    asyncio.run(run())
+
+
+def test_redis_tier_shared_and_invalidated_across_workers(redis_url):
+    """
+    Tests that an expense cached by one worker is found by another through redis,
+    and that a write on one worker drops the local copy of the other.
+    """
+    async def run():
+        channel = f"test_expense_cache_{uuid.uuid4().hex}"
+        first = ExpenseCache(10, 60, redis_url=redis_url, channel=channel)
+        second = ExpenseCache(10, 60, redis_url=redis_url, channel=channel)
+        await first.start()
+        await second.start()
+        try:
+            expense_id = f"EID-{uuid.uuid4().hex}"
+            deadline = time.time() + 5
+            while not (first.local_usable and second.local_usable) and time.time() < deadline:
+                await asyncio.sleep(0.01)
+
+            await first.put(expense_id, entry(expense_id))
+            redis_hits = metrics.get_counter("expense_cache_redis_hits")
+            assert (await second.get(expense_id))["status"] == "draft"
+            assert metrics.get_counter("expense_cache_redis_hits") == redis_hits + 1
+            # when the message about the put arrives while the get waits on redis, the entry is not kept that time
+            deadline = time.time() + 2
+            while second.local.get(expense_id) is None and time.time() < deadline:
+                await second.get(expense_id)
+            assert second.local.get(expense_id) is not None
+
+            await first.put(expense_id, entry(expense_id, "submitted"))
+            deadline = time.time() + 2
+            while second.local.get(expense_id) is not None and time.time() < deadline:
+                await asyncio.sleep(0.01)
+            assert (await second.get(expense_id))["status"] == "submitted"
+
+            await first.invalidate(expense_id)
+            deadline = time.time() + 2
+            while second.local.get(expense_id) is not None and time.time() < deadline:
+                await asyncio.sleep(0.01)
+            assert await second.get(expense_id) is None
+        finally:
+            await first.close()
+            await second.close()
+
+    asyncio.run(run())
+
+
+def test_fill_after_a_delete_does_not_bring_the_expense_back(redis_url):
+    """
+    Tests that a row read from the db before the expense was deleted, and filled in after the delete,
+    is not cached in redis for the other workers.
+    """
+    async def run():
+        channel = f"test_expense_cache_{uuid.uuid4().hex}"
+        reader = ExpenseCache(10, 60, redis_url=redis_url, channel=channel)
+        writer = ExpenseCache(10, 60, redis_url=redis_url, channel=channel)
+        other = ExpenseCache(10, 60, redis_url=redis_url, channel=channel)
+        try:
+            expense_id = f"EID-{uuid.uuid4().hex}"
+            await writer.put(expense_id, entry(expense_id))
+
+            # the reader missed and read the row, then the expense was deleted on another worker before the fill
+            generation = reader.generation()
+            await writer.invalidate(expense_id)
+            await reader.fill(expense_id, entry(expense_id), generation)
+
+            assert await other.get(expense_id) is None
+            assert await writer.get(expense_id) is None
+        finally:
+            await reader.close()
+            await writer.close()
+            await other.close()
+
+    asyncio.run(run())
+
+
+def test_detail_view_served_from_cache_and_updated_on_write():
+    """
+    Tests that a second GET /expenses/me/EID is a cache hit, and that approving the expense is seen on the next view.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    payload = {
+        "title": "Cached Item",
+        "description": "This is a test item i created during a unit test",
+        "amount": 12.5
+    }
+    e_id = client.post("/expenses/", headers=header, json=payload).json()["expense_id"]
+    client.post(f"/expenses/submit/{e_id}", headers=header)
+
+    misses = metrics.get_counter("expense_cache_misses")
+    first = client.get(f"/expenses/me/{e_id}", headers=header)
+    second = client.get(f"/expenses/me/{e_id}", headers=header)
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert first.json()["status"] == "submitted"
+    assert metrics.get_counter("expense_cache_misses") == misses
+
+    assert client.post(f"/expenses/approve/{e_id}", headers=header).status_code == 200
+    assert client.get(f"/expenses/me/{e_id}", headers=header).json()["status"] == "accepted"
+    assert client.get(f"/expenses/approvals/me/{e_id}?fields=status", headers=header).json() == {"status": "accepted"}
+
+    # another user does not get the cached expense
+    other = {"Authorization": f"Bearer {get_auth_token('jane_doe')}"}
+    assert client.get(f"/expenses/me/{e_id}", headers=other).status_code == 404
+
+
+def get_auth_token(username="patson"):
+
+    payload = {
+    "username": username,
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
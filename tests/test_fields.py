@@ -0,0 +1,99 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_list_with_fields():
+    """
+    Tests the GET /expenses/approvals/me endpoint with fields=expense_id,status,amount.
+    It expects every expense in the response to have exactly those keys.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/expenses/approvals/me", headers=header, params={"fields": "expense_id,status,amount"})
+    assert response.status_code == 200
+
+    data = response.json()
+    assert isinstance(data, list)
+    for item in data:
+        assert set(item) == {"expense_id", "status", "amount"}
+
+
+def test_paginated_list_with_fields():
+    """
+    Tests that the cursor still works when the sort key is not one of the requested fields.
+    It expects the pages to hold only the requested field and to not repeat.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    seen = []
+    params = {"limit": 1, "fields": "title", "sort": "-amount"}
+    while True:
+        response = client.get("/expenses/approvals/me", headers=header, params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert all(set(item) == {"title"} for item in data)
+        seen.extend(data)
+
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        params["cursor"] = next_cursor
+
+    response = client.get("/expenses/approvals/me", headers=header, params={"sort": "-amount", "limit": 1000})
+    assert len(seen) == len(response.json())
+
+
+def test_detail_with_fields():
+    """
+    Tests the GET /expenses/me/EID endpoint with fields=status.
+    It expects a single object with only the status.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    payload = {
+        "title": "Test Item",
+        "description": "This is a test item i created during a unit test",
+        "amount": 10.45
+    }
+    response = client.post("/expenses/", headers=header, json=payload)
+    assert response.status_code == 200
+    e_id = response.json()["expense_id"]
+
+    response = client.get(f"/expenses/me/{e_id}", headers=header, params={"fields": "status"})
+    assert response.status_code == 200
+    assert response.json() == {"status": "draft"}
+
+    client.delete(f"/expenses/delete/{e_id}", headers=header)
+
+
+def test_unknown_field():
+    """
+    Tests the GET /expenses/me endpoint with a field that does not exist.
+    It expects a 422 status code stating unprocessable content.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/expenses/me", headers=header, params={"fields": "expense_id,password"})
+    assert response.status_code == 422
+    assert "password" in response.json()["detail"]
+
+
+def get_auth_token():
+
+    payload = {
+    "username": "patson",
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
@@ -64,7 +64,7 @@ def test_get_expenses():
         is_valid_expense_syntax(item)
     
 
-def test_get_expenses_explicitly():
+def test_get_expenses_explicitly(create_expense):
     """
     Tests the GET /expenses/me to return a single expenses.
     It expects a 200 status code and a an expense in the response body.
@@ -74,8 +74,8 @@ def test_get_expenses_explicitly():
 
     header = {"Authorization":f"Bearer {token}"}
     
-
-    response = client.get("/expenses/me/EID07", headers=header)
+    expense_id = create_expense(header)
+    response = client.get(f"/expenses/me/{expense_id}", headers=header)
     assert response.status_code == 200
     
     data = response.json()
@@ -0,0 +1,77 @@
+import threading
+
+from sqlalchemy import create_engine
+
+from app.id_allocator import HiLoAllocator
+from app.model import Base, Expense
+
+
+def make_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ids.db'}")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def test_ids_start_after_existing_ids(tmp_path):
+    """
+    Tests that a new sequence is seeded from the highest expense id already in the table.
+    """
+    engine = make_engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(Expense.__table__.insert().values(
+            expense_id="EID41", title="t", description="d", amount=1.0,
+            creator_id="UID01", approver_id="UID01", status="draft"
+        ))
+
+    allocator = HiLoAllocator(engine, sequence="expense", prefix="EID", id_column=Expense.expense_id)
+    assert allocator.next_id() == "EID00000042"
+    assert allocator.next_id() == "EID00000043"
+
+
+def test_concurrent_allocators_never_collide(tmp_path):
+    """
+    Tests two allocators (as if in two workers) used from several threads at once.
+    It expects every id handed out to be unique.
+    """
+    engine = make_engine(tmp_path)
+    allocators = [
+        HiLoAllocator(engine, sequence="expense", prefix="EID", id_column=Expense.expense_id, block_size=5),
+        HiLoAllocator(engine, sequence="expense", prefix="EID", id_column=Expense.expense_id, block_size=7),
+    ]
+
+    ids = []
+    def worker(allocator):
+        for _ in range(200):
+            ids.append(allocator.next_id())
+
+    threads = [threading.Thread(target=worker, args=(allocator,)) for allocator in allocators * 3]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(ids) == 1200
+    assert len(set(ids)) == len(ids)
+
+
+def test_async_allocator_shares_the_sequence(tmp_path):
+    """
+    Tests next_id_async (used by the async endpoints) alongside next_id on the same sequence.
+    It expects the ids of both to be unique.
+    """
+    import asyncio
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = make_engine(tmp_path)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'ids.db'}")
+    allocator = HiLoAllocator(engine, sequence="expense", prefix="EID", id_column=Expense.expense_id,
+                              block_size=3, async_engine=async_engine)
+
+    async def allocate():
+        try:
+            return await asyncio.gather(*(allocator.next_id_async() for _ in range(50)))
+        finally:
+            await async_engine.dispose()
+
+    ids = asyncio.run(allocate()) + [allocator.next_id() for _ in range(10)]
+    assert len(set(ids)) == 60
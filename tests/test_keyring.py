@@ -0,0 +1,102 @@
+import hashlib
+import hmac
+import json
+
+import ecdsa
+import pytest
+import rsa
+from fastapi.testclient import TestClient
+from jose import JWTError, jwt
+from jose.utils import base64url_encode
+
+from app.keyring import KeyRing, load_key, load_keyring
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+RSA_PRIVATE_PEM = rsa.newkeys(1024)[1].save_pkcs1().decode()
+EC_PRIVATE_PEM = ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).to_pem().decode()
+
+CLAIMS = {"sub": "patson", "jti": "a"}
+
+
+@pytest.mark.parametrize("alg, material", [
+    ("HS256", {"secret": "old secret"}),
+    ("RS256", {"private_key": RSA_PRIVATE_PEM}),
+    ("ES256", {"private_key": EC_PRIVATE_PEM}),
+])
+def test_sign_and_decode(alg, material):
+    """
+    Tests that a token signed with a key of each algorithm names the key in its header and verifies.
+    """
+    ring = KeyRing([load_key("k1", alg, **material)], active="k1")
+    token = ring.sign(CLAIMS)
+    assert jwt.get_unverified_header(token) == {"alg": alg, "typ": "JWT", "kid": "k1"}
+    assert ring.decode(token) == CLAIMS
+
+
+def test_rotation_keeps_old_tokens_valid():
+    """
+    Tests that tokens of the previous key still verify after a new key became the active one,
+    and that tokens of an unknown key or without a kid and no default key are refused.
+    """
+    old = load_key("old", "HS256", secret="old secret")
+    old_token = KeyRing([old], active="old").sign(CLAIMS)
+
+    ring = KeyRing([old, load_key("new", "RS256", private_key=RSA_PRIVATE_PEM)], active="new")
+    assert ring.decode(old_token) == CLAIMS
+    assert jwt.get_unverified_header(ring.sign(CLAIMS))["kid"] == "new"
+
+    with pytest.raises(JWTError):
+        KeyRing([load_key("new", "RS256", private_key=RSA_PRIVATE_PEM)], active="new").decode(old_token)
+    with pytest.raises(JWTError):
+        ring.decode(jwt.encode(CLAIMS, "old secret", algorithm="HS256"))
+
+
+def test_algorithm_is_fixed_by_the_key():
+    """
+    Tests that a token can not use another algorithm than the one of the key it names.
+    """
+    ring = KeyRing([load_key("rsa", "RS256", private_key=RSA_PRIVATE_PEM)], active="rsa")
+    public_pem = ring.keys["rsa"].verifying_key.to_pem().decode()
+    # the classic confusion attack: HS256 with the public key as the secret, signed by hand since jose refuses to
+    header = base64url_encode(json.dumps({"alg": "HS256", "typ": "JWT", "kid": "rsa"}).encode())
+    payload = base64url_encode(json.dumps(CLAIMS).encode())
+    signature = base64url_encode(hmac.new(public_pem.encode(), header + b"." + payload, hashlib.sha256).digest())
+    forged = (header + b"." + payload + b"." + signature).decode()
+    with pytest.raises(JWTError):
+        ring.decode(forged)
+
+
+def test_load_keyring_file(tmp_path):
+    """
+    Tests loading a keyring file with key files next to it, and the published JWKS of its asymmetric keys.
+    """
+    (tmp_path / "signing.pem").write_text(RSA_PRIVATE_PEM)
+    (tmp_path / "keyring.json").write_text(json.dumps({
+        "active": "2025-10",
+        "keys": [
+            {"kid": "2025-10", "alg": "RS256", "private_key_file": "signing.pem"},
+            {"kid": "2025-04", "alg": "HS256", "secret": "older secret"},
+        ]
+    }))
+
+    ring = load_keyring(str(tmp_path / "keyring.json"), secret_key="legacy secret")
+    assert set(ring.keys) == {"default", "2025-10", "2025-04"}
+    assert ring.active == "2025-10"
+    assert ring.decode(jwt.encode(CLAIMS, "legacy secret", algorithm="HS256")) == CLAIMS
+
+    # only the public part of the RS256 key is published
+    assert [key["kid"] for key in ring.jwks["keys"]] == ["2025-10"]
+    assert "d" not in ring.jwks["keys"][0]
+
+
+def test_jwks_endpoint():
+    """
+    Tests the GET /.well-known/jwks.json endpoint.
+    It expects a 200 status code and a JWK set.
+    """
+    response = client.get("/.well-known/jwks.json")
+    assert response.status_code == 200
+    assert "keys" in response.json()
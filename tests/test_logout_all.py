@@ -0,0 +1,51 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_logout_all():
+    """
+    Tests the POST /logout/all endpoint with two sessions of the same user.
+    It expects both tokens to be refused with a 401 status code afterwards, and a new login to work.
+    """
+    first = {"Authorization": f"Bearer {get_auth_token()}"}
+    second = {"Authorization": f"Bearer {get_auth_token()}"}
+    assert client.get("/expenses/me", headers=first).status_code == 200
+    assert client.get("/expenses/me", headers=second).status_code == 200
+
+    response = client.post("/logout/all", headers=first)
+    assert response.status_code == 200
+    assert response.json()["message"] == "Successfully logged patson out of every session!"
+
+    assert client.get("/expenses/me", headers=first).status_code == 401
+    assert client.get("/expenses/me", headers=second).status_code == 401
+
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    assert client.get("/expenses/me", headers=header).status_code == 200
+
+
+def test_logout_all_other_user_unaffected():
+    """
+    Tests that logging one user out everywhere leaves the sessions of other users alone.
+    """
+    other = {"Authorization": f"Bearer {get_auth_token('jane_doe')}"}
+    assert client.get("/expenses/me", headers=other).status_code == 200
+
+    client.post("/logout/all", headers={"Authorization": f"Bearer {get_auth_token()}"})
+    assert client.get("/expenses/me", headers=other).status_code == 200
+
+
+def get_auth_token(username="patson"):
+
+    payload = {
+    "username": username,
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
@@ -0,0 +1,134 @@
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import MIGRATIONS, run_migrations
+from app.model import Base
+from app.passwords import is_hashed
+
+# the two tables as the first version of the app created them, before any migration existed
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE user (
+        user_id VARCHAR NOT NULL PRIMARY KEY,
+        username VARCHAR UNIQUE,
+        name VARCHAR,
+        password VARCHAR,
+        department_id INTEGER,
+        is_approver BOOLEAN
+    )
+    """,
+    """
+    CREATE TABLE expense (
+        expense_id VARCHAR NOT NULL PRIMARY KEY,
+        title VARCHAR,
+        description VARCHAR,
+        amount FLOAT,
+        creator_id VARCHAR NOT NULL REFERENCES user (user_id),
+        approver_id VARCHAR NOT NULL REFERENCES user (user_id),
+        status VARCHAR(9) NOT NULL,
+        created_at DATETIME NOT NULL,
+        approved_at DATETIME,
+        rejected_at DATETIME,
+        rejection_reason VARCHAR
+    )
+    """,
+    "INSERT INTO user VALUES ('UID01', 'patson', 'Patson', 'password', 1, 1)",
+    """
+    INSERT INTO expense (expense_id, title, description, amount, creator_id, approver_id, status, created_at)
+    VALUES ('EID01', 'Client Lunch', 'Lunch with the Acme Corp. team', 120.0, 'UID01', 'UID01', 'submitted', '2025-01-01 00:00:00')
+    """,
+]
+
+ALL_VERSIONS = sorted(version for version, _, _ in MIGRATIONS)
+
+
+def check_at_head(engine):
+    # the columns, indexes and tables every migration adds, and one schema_migrations row per migration
+    inspector = inspect(engine)
+    assert "claims_version" in {column["name"] for column in inspector.get_columns("user")}
+    assert {index["name"] for index in inspector.get_indexes("expense")} >= {
+        "ix_expense_creator_created", "ix_expense_creator_status_created",
+        "ix_expense_approver_created", "ix_expense_approver_status_created",
+    }
+    assert set(inspector.get_table_names()) >= {
+        "id_sequence", "revoked_token", "token_epoch", "list_version", "refresh_session",
+        "expense_fts", "expense_fts_map", "schema_migrations",
+    }
+    with engine.connect() as conn:
+        versions = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+    assert versions == ALL_VERSIONS
+
+
+def test_migrations_upgrade_a_baseline_db(tmp_path):
+    """
+    Tests that the migrations bring a db built by the first version of the app up to the current schema,
+    keep its rows (the existing expense is searchable, the plaintext password is hashed) and do nothing on a second run.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.exec_driver_sql(statement)
+
+    assert run_migrations(engine) == ALL_VERSIONS
+    check_at_head(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT claims_version FROM user")).scalar_one() == 0
+        assert is_hashed(conn.execute(text("SELECT password FROM user")).scalar_one())
+        matches = conn.execute(text("SELECT count(*) FROM expense_fts WHERE expense_fts MATCH 'acme'")).scalar_one()
+        assert matches == 1
+
+    assert run_migrations(engine) == []
+    check_at_head(engine)
+    engine.dispose()
+
+
+def test_migrations_on_a_db_at_head(tmp_path):
+    """
+    Tests that the migrations run cleanly on a db that create_all has just built from the current models,
+    which is what init_db does for a new db.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'head.db'}")
+    Base.metadata.create_all(engine)
+
+    assert run_migrations(engine) == ALL_VERSIONS
+    check_at_head(engine)
+    assert run_migrations(engine) == []
+    check_at_head(engine)
+    engine.dispose()
+
+
+def test_search_index_gets_the_owner_columns(tmp_path):
+    """
+    Tests that migration 11 rebuilds a search index made before the owner columns were added,
+    keeping the expenses that were already indexed and the triggers working.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.exec_driver_sql(statement)
+    run_migrations(engine)
+
+    # the index as it was before migration 11, with only title and description
+    with engine.begin() as conn:
+        for trigger in ("expense_fts_after_insert", "expense_fts_after_delete", "expense_fts_after_update"):
+            conn.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        conn.exec_driver_sql("DROP TABLE expense_fts")
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE expense_fts USING fts5(title, description, tokenize = 'porter unicode61')")
+        conn.exec_driver_sql("""
+            INSERT INTO expense_fts (rowid, title, description)
+            SELECT m.docid, e.title, e.description FROM expense_fts_map m JOIN expense e ON e.expense_id = m.expense_id
+        """)
+        conn.exec_driver_sql("DELETE FROM schema_migrations WHERE version = 11")
+
+    assert run_migrations(engine) == [11]
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""
+            INSERT INTO expense (expense_id, title, description, amount, creator_id, approver_id, status, created_at)
+            VALUES ('EID02', 'Acme visit', 'Train tickets', 12.0, 'UID01', 'UID01', 'draft', '2025-01-02 00:00:00')
+        """)
+        query = '{title description} : ("acme") AND {creator_id approver_id} : "UID01"'
+        matches = conn.execute(text("SELECT count(*) FROM expense_fts WHERE expense_fts MATCH :q"), {"q": query})
+        assert matches.scalar_one() == 2
+        query = '{title description} : ("acme") AND {creator_id approver_id} : "UID02"'
+        matches = conn.execute(text("SELECT count(*) FROM expense_fts WHERE expense_fts MATCH :q"), {"q": query})
+        assert matches.scalar_one() == 0
+    engine.dispose()
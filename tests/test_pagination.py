@@ -0,0 +1,144 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_expenses_pagination():
+    """
+    Tests the GET /expenses/me endpoint with a page size of 1.
+    It expects every page to hold at most 1 expense and the pages to never repeat an expense.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    seen = []
+    params = {"limit": 1}
+    while True:
+        response = client.get("/expenses/me", headers=header, params=params)
+        assert response.status_code == 200
+
+        data = response.json()
+        assert isinstance(data, list)
+        assert len(data) <= 1
+        seen.extend(item["expense_id"] for item in data)
+
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        params["cursor"] = next_cursor
+
+    assert len(seen) == len(set(seen)), "an expense was returned on more than one page"
+
+    # walking the pages should give the same expenses as a single big page
+    response = client.get("/expenses/me", headers=header, params={"limit": 1000})
+    assert response.status_code == 200
+    assert [item["expense_id"] for item in response.json()] == seen
+
+
+def test_invalid_cursor():
+    """
+    Tests the GET /expenses/me endpoint with a cursor that was not issued by the server.
+    It expects a 400 status code.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/expenses/me", headers=header, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid pagination cursor"
+
+
+def test_invalid_page_size():
+    """
+    Tests the GET /expenses/approvals/me endpoint with a page size out of range.
+    It expects a 422 status code stating unprocessable content.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/expenses/approvals/me", headers=header, params={"limit": 0})
+    assert response.status_code == 422
+
+
+def test_status_filter():
+    """
+    Tests the GET /expenses/approvals/me endpoint filtered on the submitted state.
+    It expects only submitted expenses in the response.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/expenses/approvals/me", headers=header, params={"status": "submitted"})
+    assert response.status_code == 200
+    assert all(item["status"] == "submitted" for item in response.json())
+
+    response = client.get("/expenses/approvals/me", headers=header, params={"status": ["draft", "rejected"]})
+    assert response.status_code == 200
+    assert all(item["status"] in ("draft", "rejected") for item in response.json())
+
+
+def test_amount_filter_and_sort():
+    """
+    Tests the GET /expenses/me endpoint with an amount range, sorted by amount and walked 1 expense per page.
+    It expects the amounts to be in range and in ascending order across pages.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    amounts = []
+    params = {"limit": 1, "sort": "amount", "min_amount": 1, "max_amount": 1000}
+    while True:
+        response = client.get("/expenses/me", headers=header, params=params)
+        assert response.status_code == 200
+        amounts.extend(item["amount"] for item in response.json())
+
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            break
+        params["cursor"] = next_cursor
+
+    assert all(1 <= amount <= 1000 for amount in amounts)
+    assert amounts == sorted(amounts)
+
+
+def test_cursor_from_other_sort():
+    """
+    Tests the GET /expenses/me endpoint with a cursor that was issued for another sort key.
+    It expects a 400 status code.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    # making sure there is a second page
+    created = []
+    for amount in (10.45, 20.45):
+        payload = {"title": "Test Item", "description": "This is a test item i created during a unit test", "amount": amount}
+        response = client.post("/expenses/", headers=header, json=payload)
+        assert response.status_code == 200
+        created.append(response.json()["expense_id"])
+
+    response = client.get("/expenses/me", headers=header, params={"limit": 1, "sort": "amount"})
+    next_cursor = response.headers.get("X-Next-Cursor")
+    assert next_cursor is not None
+
+    response = client.get("/expenses/me", headers=header, params={"limit": 1, "cursor": next_cursor})
+    assert response.status_code == 400
+
+    for e_id in created:
+        client.delete(f"/expenses/delete/{e_id}", headers=header)
+
+
+def get_auth_token():
+
+    payload = {
+    "username": "patson",
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
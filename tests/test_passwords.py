@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.main import app
+from app.model import User
+from app.passwords import PasswordHasher, PasswordHasherBusy, hash_password, is_hashed, verify_password
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_hash_and_verify():
+    """
+    Tests that a hashed password verifies, a wrong one does not, and two hashes of one password differ.
+    """
+    stored = hash_password("secret", n=1024)
+    assert is_hashed(stored)
+    assert stored != hash_password("secret", n=1024)
+    assert verify_password("secret", stored, n=1024) == (True, False)
+    assert verify_password("wrong", stored, n=1024) == (False, False)
+
+
+def test_needs_rehash():
+    """
+    Tests that plaintext passwords and hashes with old parameters are flagged for rehashing.
+    """
+    assert verify_password("secret", "secret") == (True, True)
+    assert verify_password("wrong", "secret") == (False, True)
+    assert verify_password("secret", hash_password("secret", n=1024), n=2048) == (True, True)
+
+
+def test_hasher_queue_limit():
+    """
+    Tests that the hasher turns calls away once its queue is full.
+    """
+    hasher = PasswordHasher(workers=1, queue_limit=0)
+    with pytest.raises(PasswordHasherBusy):
+        asyncio.run(hasher.verify("secret", "secret"))
+
+
+def test_login_rehashes_plaintext_password():
+    """
+    Tests the POST /login endpoint for a user whose password is still stored in plaintext.
+    It expects the login to work and the password to be stored hashed afterwards.
+    """
+    with SessionLocal() as db:
+        db.query(User).filter(User.username == "jane_doe").update({"password": "password"})
+        db.commit()
+
+    response = client.post("/login", json={"username": "jane_doe", "password": "password"})
+    assert response.status_code == 200
+
+    with SessionLocal() as db:
+        stored = db.query(User).filter(User.username == "jane_doe").first().password
+    assert is_hashed(stored)
+    assert verify_password("password", stored)[0]
+
+    response = client.post("/login", json={"username": "jane_doe", "password": "wrong"})
+    assert response.status_code == 401
@@ -0,0 +1,99 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.database import AsyncSessionLocal
+from app.jwt_utils import create_jwt_token
+from app.main import app
+from app.principal import bump_claims_version, change_role
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_token_has_identity_claims():
+    """
+    Tests that the token from POST /login carries the user's id, department, approver flag and claims version.
+    """
+    token = get_auth_token()
+    claims = jwt.get_unverified_claims(token)
+    assert claims["sub"] == "patson"
+    assert {"uid", "dept", "appr", "cv"} <= set(claims)
+    assert isinstance(claims["appr"], bool)
+
+
+def test_token_without_identity_claims():
+    """
+    Tests that a token with only the username, as issued before the identity claims, is still accepted.
+    It expects a 200 status code.
+    """
+    token = create_jwt_token({"sub": "patson"})
+    response = client.get("/expenses/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+
+def test_stale_claims_version():
+    """
+    Tests that a token issued before the user's claims version was bumped is refused.
+    It expects a 401 status code for the old token and a 200 status code with a new one.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+    assert client.get("/expenses/me", headers=header).status_code == 200
+
+    async def bump():
+        async with AsyncSessionLocal() as db:
+            await bump_claims_version(db, jwt.get_unverified_claims(token)["uid"])
+            await db.commit()
+
+    asyncio.run(bump())
+
+    response = client.get("/expenses/me", headers=header)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Your role or department has changed, please re-authenticate"
+
+    header = {"Authorization": f"Bearer {get_auth_token()}"}
+    assert client.get("/expenses/me", headers=header).status_code == 200
+
+
+def test_change_role_refuses_old_tokens():
+    """
+    Tests that making a user an approver through change_role refuses the token issued before,
+    and that a new token carries the new role.
+    """
+    token = get_auth_token("john_smith")
+    header = {"Authorization": f"Bearer {token}"}
+    assert client.get("/expenses/approvals/me", headers=header).status_code == 404
+
+    async def set_approver(is_approver, username="john_smith"):
+        async with AsyncSessionLocal() as db:
+            return await change_role(db, username, is_approver=is_approver)
+
+    assert asyncio.run(set_approver(True))
+    try:
+        assert client.get("/expenses/me", headers=header).status_code == 401
+
+        token = get_auth_token("john_smith")
+        assert jwt.get_unverified_claims(token)["appr"] is True
+        header = {"Authorization": f"Bearer {token}"}
+        assert client.get("/expenses/approvals/me", headers=header).status_code == 200
+    finally:
+        asyncio.run(set_approver(False))
+
+    assert client.get("/expenses/me", headers=header).status_code == 401
+    # no such user
+    assert not asyncio.run(set_approver(True, "nobody"))
+
+
+def get_auth_token(username="patson"):
+
+    payload = {
+    "username": username,
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
@@ -0,0 +1,139 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.jwt_utils import create_jwt_token
+from app.rate_limit import (ConcurrencyLimiter, Limit, MemoryRateLimiter, RateLimitMiddleware, RedisRateLimiter)
+
+
+def make_client(limiter, login_limit=Limit(1, 2), user_limit=Limit(1, 3), max_concurrent=8):
+    # a small app behind the middleware, so the limits can be tight without touching the real app
+    app = FastAPI()
+
+    @app.post("/login/")
+    def login():
+        return {"ok": True}
+
+    @app.get("/expenses/me")
+    def expenses():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, login_limit=login_limit, user_limit=user_limit,
+                       max_concurrent=max_concurrent)
+    return TestClient(app)
+
+
+def test_login_is_limited_per_ip():
+    """
+    Tests that logins past the burst are answered 429 with a Retry-After header.
+    """
+    client = make_client(MemoryRateLimiter())
+    assert client.post("/login/").status_code == 200
+    assert client.post("/login/").status_code == 200
+    response = client.post("/login/")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_users_have_their_own_buckets():
+    """
+    Tests that one user going over their rate does not limit another user.
+    """
+    client = make_client(MemoryRateLimiter())
+    greedy = {"Authorization": f"Bearer {create_jwt_token({'sub': 'patson'})}"}
+    other = {"Authorization": f"Bearer {create_jwt_token({'sub': 'jane_doe'})}"}
+
+    codes = [client.get("/expenses/me", headers=greedy).status_code for _ in range(5)]
+    assert codes.count(429) == 2
+    assert client.get("/expenses/me", headers=other).status_code == 200
+
+
+def test_invalid_token_counts_against_ip():
+    """
+    Tests that a token that does not verify can not be used to get a fresh bucket.
+    """
+    client = make_client(MemoryRateLimiter())
+    codes = [
+        client.get("/expenses/me", headers={"Authorization": f"Bearer forged-{i}"}).status_code
+        for i in range(5)
+    ]
+    assert codes.count(429) == 2
+
+
+def test_bucket_refills():
+    """
+    Tests that an empty bucket gives out a token again after 1 / rate seconds.
+    """
+    limiter = MemoryRateLimiter()
+    limit = Limit(rate=10, burst=1)
+    assert limiter.take("k", limit) == 0
+    wait = limiter.take("k", limit)
+    assert 0 < wait <= 0.1
+    asyncio.run(asyncio.sleep(wait))
+    assert limiter.take("k", limit) == 0
+
+
+def test_memory_limiter_drops_old_buckets():
+    limiter = MemoryRateLimiter(max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.take(key, Limit(1, 1))
+    assert list(limiter._buckets) == ["b", "c"]
+
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(2)
+    assert limiter.acquire("patson")
+    assert limiter.acquire("patson")
+    assert not limiter.acquire("patson")
+    assert limiter.acquire("jane_doe")
+    limiter.release("patson")
+    assert limiter.acquire("patson")
+
+
+def test_redis_unavailable_falls_back_to_local_buckets():
+    """
+    Tests that the redis limiter keeps limiting with this worker's buckets when redis can not answer.
+    """
+    limiter = RedisRateLimiter("redis://127.0.0.1:1/0", timeout=0.05)
+    before = metrics.snapshot()["counters"].get("rate_limit_fallbacks", 0)
+
+    async def run():
+        try:
+            return [await limiter.acquire("ip:test", Limit(1, 2)) for _ in range(3)]
+        finally:
+            await limiter.close()
+
+    waits = asyncio.run(run())
+    assert waits[:2] == [0, 0]
+    assert waits[2] > 0
+    assert metrics.snapshot()["counters"]["rate_limit_fallbacks"] == before + 3
+
+
+def test_new_token_is_verified_once(monkeypatch):
+    """
+    Tests that the signature of a token that is not cached yet is checked once per request,
+    by the middleware, and not again by the authentication of the endpoint.
+    """
+    from app.jwt_utils import keyring
+    from app.main import app
+
+    client = TestClient(app)
+    token = client.post("/login", json={"username": "patson", "password": "password"}).json()["access_token"]
+
+    decoded = []
+    decode = keyring.decode
+
+    def counting_decode(token):
+        decoded.append(token)
+        return decode(token)
+
+    monkeypatch.setattr(keyring, "decode", counting_decode)
+    response = client.get("/expenses/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert decoded == [token]
+
+    # from now on it comes from the verified token cache
+    assert client.get("/expenses/me", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert decoded == [token]
@@ -0,0 +1,90 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_login_returns_refresh_token():
+    """
+    Tests that POST /login returns a refresh token next to the access token.
+    """
+    tokens = login()
+    assert tokens["access_token"]
+    assert tokens["refresh_token"]
+    assert tokens["token_type"] == "bearer"
+
+
+def test_refresh_rotates_tokens():
+    """
+    Tests the POST /token/refresh endpoint.
+    It expects a new access token that works and a new refresh token that can be used in turn.
+    """
+    tokens = login()
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    assert refreshed["access_token"] != tokens["access_token"]
+
+    header = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    assert client.get("/expenses/me", headers=header).status_code == 200
+
+    response = client.post("/token/refresh", json={"refresh_token": refreshed["refresh_token"]})
+    assert response.status_code == 200
+
+
+def test_refresh_token_reuse_logs_out_the_session():
+    """
+    Tests that sending a spent refresh token again is refused with a 401 status code,
+    and that every token of that session stops working, including the ones from the refresh.
+    """
+    tokens = login()
+    refreshed = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+    header = {"Authorization": f"Bearer {refreshed['access_token']}"}
+    assert client.get("/expenses/me", headers=header).status_code == 401
+    response = client.post("/token/refresh", json={"refresh_token": refreshed["refresh_token"]})
+    assert response.status_code == 401
+
+    # other sessions of the same user are not affected
+    header = {"Authorization": f"Bearer {login()['access_token']}"}
+    assert client.get("/expenses/me", headers=header).status_code == 200
+
+
+def test_token_types_are_not_interchangeable():
+    """
+    Tests that an access token can not be used to refresh, and a refresh token can not be used to authenticate.
+    """
+    tokens = login()
+    response = client.post("/token/refresh", json={"refresh_token": tokens["access_token"]})
+    assert response.status_code == 401
+
+    header = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+    assert client.get("/expenses/me", headers=header).status_code == 401
+
+
+def test_logout_revokes_refresh_token():
+    """
+    Tests that after POST /logout the refresh token of the session is refused with a 401 status code.
+    """
+    tokens = login()
+    header = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.post("/logout", headers=header).status_code == 200
+
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+
+def login(username="patson"):
+
+    payload = {
+    "username": username,
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+    return response.json()
@@ -0,0 +1,130 @@
+import asyncio
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import metrics
+from app.main import app
+from app.model import Base
+from app.revocation import MemoryRevocationStore, RedisRevocationStore, SqlRevocationStore
+
+
+async def check_store(store):
+    # the shared checks for every backend
+    revoked = []
+    store.on_revoke = revoked.append
+    jti, other, expired = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+
+    await store.revoke(jti, time.time() + 60)
+    await store.revoke_many([(expired, time.time() - 1)])
+    assert await store.is_revoked(jti)
+    assert not await store.is_revoked(other)
+    assert not await store.is_revoked(expired)
+    assert await store.revoked_among([jti, other, expired]) == {jti}
+    assert jti in revoked
+
+    # spending a refresh token works only once, and is not a revocation
+    family, first, second, third = (str(uuid.uuid4()) for _ in range(4))
+    revoked.clear()
+    assert await store.rotate_refresh(family, first, second, time.time() + 60)
+    assert not await store.rotate_refresh(family, first, third, time.time() + 60)
+    assert await store.rotate_refresh(family, second, third, time.time() + 60)
+    assert not await store.rotate_refresh(family, second, str(uuid.uuid4()), time.time() + 60)
+    assert not await store.is_revoked(first)
+    assert revoked == []
+
+    # epochs, per user and for everyone
+    epochs = []
+    store.on_epoch = lambda subject, epoch: epochs.append(subject)
+    user = f"user-{uuid.uuid4()}"
+    assert await store.not_before(user) == 0
+    await store.set_epoch(user, 100.0)
+    assert await store.not_before(user) == 100.0
+    assert await store.get_epochs([user, "nobody"]) == {user: 100.0}
+    assert user in epochs
+
+
+def test_memory_store():
+    """
+    Tests revoking and looking up tokens in the in-process store.
+    """
+    asyncio.run(check_store(MemoryRevocationStore()))
+
+
+def test_sql_store(tmp_path):
+    """
+    Tests revoking and looking up tokens in the revoked_token table.
+    """
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'revoked.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            await check_store(SqlRevocationStore(async_sessionmaker(engine, expire_on_commit=False)))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_redis_store_without_mirror(redis_url):
+    """
+    Tests revoking and looking up tokens directly in redis.
+    """
+    async def run():
+        store = RedisRevocationStore(redis_url, "test_revoked_tokens", mirror=False)
+        try:
+            await check_store(store)
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_mirror_loads_and_follows_revocations(redis_url):
+    """
+    Tests that the mirror holds the jtis revoked before it started and picks up the ones another worker revokes,
+    without asking redis.
+    """
+    async def run():
+        before = str(uuid.uuid4())
+        publisher = RedisRevocationStore(redis_url, "test_revoked_tokens", mirror=False)
+        await publisher.revoke(before, time.time() + 60)
+
+        revoked = []
+        listener = RedisRevocationStore(redis_url, "test_revoked_tokens", on_revoke=revoked.append)
+        await listener.start()
+        try:
+            assert await listener.wait_ready(5)
+            fallbacks = metrics.get_counter("revocation_mirror_fallbacks")
+            assert await listener.is_revoked(before)
+
+            after = str(uuid.uuid4())
+            await publisher.revoke(after, time.time() + 60)
+            deadline = time.time() + 2
+            while not await listener.is_revoked(after) and time.time() < deadline:
+                await asyncio.sleep(0.01)
+            assert await listener.is_revoked(after)
+            assert after in revoked
+            assert metrics.get_counter("revocation_mirror_fallbacks") == fallbacks
+        finally:
+            await listener.close()
+            await publisher.close()
+
+    asyncio.run(run())
+
+
+def test_logout_with_store_started():
+    """
+    Tests logging out while the app runs with its revocation store started.
+    It expects the token to be rejected with a 401 status code right after logout.
+    """
+    with TestClient(app) as client:
+        response = client.post("/login", json={"username": "patson", "password": "password"})
+        header = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        assert client.get("/expenses/me", headers=header).status_code == 200
+        assert client.post("/logout/", headers=header).status_code == 200
+        assert client.get("/expenses/me", headers=header).status_code == 401
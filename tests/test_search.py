@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def test_search_expenses():
+    """
+    Tests the GET /expenses/search endpoint for an expense created in this test.
+    It expects the expense to be found by a word of its description and by the start of a word of its title,
+    and to not be visible to a user who is neither its creator nor its approver.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token('patson')}"}
+
+    payload = {
+        "title": "Quokkaland conference",
+        "description": "Train tickets for the marsupial research conference",
+        "amount": 99.99
+    }
+    response = client.post("/expenses/", headers=header, json=payload)
+    assert response.status_code == 200
+    e_id = response.json()["expense_id"]
+
+    response = client.get("/expenses/search", headers=header, params={"q": "marsupial"})
+    assert response.status_code == 200
+    assert e_id in [item["expense_id"] for item in response.json()]
+
+    response = client.get("/expenses/search", headers=header, params={"q": "quokka"})
+    assert response.status_code == 200
+    assert e_id in [item["expense_id"] for item in response.json()]
+
+    # jane_doe is in another department, so she is neither the creator nor the approver
+    other_header = {"Authorization": f"Bearer {get_auth_token('jane_doe')}"}
+    response = client.get("/expenses/search", headers=other_header, params={"q": "marsupial"})
+    assert response.status_code == 200
+    assert e_id not in [item["expense_id"] for item in response.json()]
+
+    # once deleted the expense is gone from the index as well
+    response = client.delete(f"/expenses/delete/{e_id}", headers=header)
+    assert response.status_code == 200
+    response = client.get("/expenses/search", headers=header, params={"q": "marsupial"})
+    assert e_id not in [item["expense_id"] for item in response.json()]
+
+
+def test_search_operators_are_literal():
+    """
+    Tests the GET /expenses/search endpoint with FTS5 syntax and punctuation only.
+    It expects a 200 status code and not a query syntax error.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token('patson')}"}
+
+    response = client.get("/expenses/search", headers=header, params={"q": 'travel" OR NEAR(('})
+    assert response.status_code == 200
+
+    response = client.get("/expenses/search", headers=header, params={"q": "!!!"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_search_missing_query():
+    """
+    Tests the GET /expenses/search endpoint without q.
+    It expects a 422 status code stating unprocessable content.
+    """
+    header = {"Authorization": f"Bearer {get_auth_token('patson')}"}
+
+    response = client.get("/expenses/search", headers=header)
+    assert response.status_code == 422
+
+
+def get_auth_token(username):
+
+    payload = {
+    "username": username,
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app import database, main, metrics
+from app.principal import claims_versions
+from app.single_flight import SingleFlight
+
+client = TestClient(main.app)
+
+
+def test_concurrent_calls_share_one_run():
+    """
+    Tests that calls with the same key made while the first one runs get its result without running again,
+    and that the coalescing ratio is published.
+    """
+    flight = SingleFlight("test_flight")
+    runs = []
+
+    async def load():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return {"rows": 3}
+
+    async def run():
+        results = await asyncio.gather(*(flight.run(("approvals", "UID01"), load) for _ in range(10)))
+        # a call made after the run finished starts a new one
+        await flight.run(("approvals", "UID01"), load)
+        return results
+
+    results = asyncio.run(run())
+    assert results == [{"rows": 3}] * 10
+    assert len(runs) == 2
+    assert metrics.get_counter("test_flight_coalesced") == 9
+    assert metrics.snapshot()["gauges"]["test_flight_coalescing_ratio"] == pytest.approx(9 / 11, abs=1e-3)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight("test_flight_keys")
+    runs = []
+
+    async def load(key):
+        runs.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    async def run():
+        return await asyncio.gather(flight.run("a", lambda: load("a")), flight.run("b", lambda: load("b")))
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert sorted(runs) == ["a", "b"]
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight("test_flight_errors")
+
+    async def load():
+        await asyncio.sleep(0.01)
+        raise ValueError("query failed")
+
+    async def run():
+        return await asyncio.gather(*(flight.run("k", load) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    """
+    Tests that the run goes on for the others when the request that started it goes away.
+    """
+    flight = SingleFlight("test_flight_cancel")
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        leader = asyncio.create_task(flight.run("k", load))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.run("k", load))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_forget_starts_a_new_run():
+    flight = SingleFlight("test_flight_forget")
+    runs = []
+
+    async def load():
+        runs.append(1)
+        run_number = len(runs)
+        await asyncio.sleep(0.02)
+        return run_number
+
+    async def run():
+        first = asyncio.create_task(flight.run("k", load))
+        await asyncio.sleep(0)
+        # a write happened, the read that is running is out of date
+        flight.forget("k")
+        second = await flight.run("k", load)
+        return await first, second
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_reads_with_a_single_connection(monkeypatch):
+    """
+    Tests the list and detail endpoints with a pool of one connection.
+    The request's own session has to give its connection back before the shared read takes one, otherwise they time out.
+    """
+    token = client.post("/login", json={"username": "patson", "password": "password"}).json()["access_token"]
+    header = {"Authorization": f"Bearer {token}"}
+
+    engine = create_async_engine(database.ASYNC_DB_URL, pool_size=1, max_overflow=0, pool_timeout=1)
+    database.configure_engine(engine.sync_engine)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def get_single_connection_db():
+        async with sessions() as db:
+            yield db
+
+    monkeypatch.setattr(main, "AsyncSessionLocal", sessions)
+    main.app.dependency_overrides[database.get_async_db] = get_single_connection_db
+    try:
+        # the claims version is read from the db as well
+        claims_versions.invalidate("UID01")
+        for path in ("/expenses/me", "/expenses/approvals/me", "/expenses/me/EID05"):
+            assert client.get(path, headers=header).status_code == 200
+    finally:
+        main.app.dependency_overrides.pop(database.get_async_db)
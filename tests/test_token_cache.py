@@ -0,0 +1,88 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.token_cache import TokenCache
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def claims(jti, exp=None):
+    return {"sub": "patson", "jti": jti, "exp": exp or time.time() + 60}
+
+
+def test_cache_hit_and_lru_eviction():
+    """
+    Tests that cached claims come back and that the least recently used token is evicted when the cache is full.
+    """
+    cache = TokenCache(max_size=2)
+    cache.put("token-a", claims("a"))
+    cache.put("token-b", claims("b"))
+    assert cache.get("token-a")["jti"] == "a"
+
+    # token-b is now the least recently used one
+    cache.put("token-c", claims("c"))
+    assert cache.get("token-b") is None
+    assert cache.get("token-a") is not None
+    assert cache.get("token-c") is not None
+
+
+def test_cache_entry_expires():
+    """
+    Tests that an entry is not returned after the token's exp or after max_age.
+    """
+    cache = TokenCache(max_size=10)
+    cache.put("expired", claims("a", exp=time.time() - 1))
+    assert cache.get("expired") is None
+
+    cache = TokenCache(max_size=10, max_age=1)
+    cache.put("token", claims("b"))
+    assert cache.get("token") is not None
+    time.sleep(1.1)
+    assert cache.get("token") is None
+
+
+def test_cache_revoke():
+    """
+    Tests that revoking a jti drops the cached token.
+    """
+    cache = TokenCache(max_size=10)
+    cache.put("token", claims("a"))
+    cache.revoke("a")
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_cache_revoke_issued_before():
+    """
+    Tests that an epoch drops the user's tokens issued before it and leaves the others.
+    """
+    cache = TokenCache(max_size=10)
+    cache.put("old", {**claims("a"), "iat": 10})
+    cache.put("new", {**claims("b"), "iat": 30})
+    cache.put("other", {**claims("c"), "sub": "someone", "iat": 10})
+
+    cache.revoke_issued_before("patson", 20)
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+    assert cache.get("other") is not None
+
+    cache.revoke_issued_before("*", 40)
+    assert len(cache) == 0
+
+
+def test_logged_out_token_is_not_served_from_cache():
+    """
+    Tests that a token used once (and so cached) is rejected right after logout.
+    It expects a 401 status code on the next request.
+    """
+    response = client.post("/login", json={"username": "patson", "password": "password"})
+    header = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    assert client.get("/expenses/me", headers=header).status_code == 200
+    assert client.get("/expenses/me", headers=header).status_code == 200
+
+    assert client.post("/logout/", headers=header).status_code == 200
+    assert client.get("/expenses/me", headers=header).status_code == 401
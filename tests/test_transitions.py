@@ -0,0 +1,83 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+
+# creating a test client instance, this allows for testing without making server live
+client = TestClient(app)
+
+
+def create_submitted_expense(header):
+    payload = {
+        "title": "Test Item",
+        "description": "This is a test item i created during a unit test",
+        "amount": 10.45
+    }
+    response = client.post("/expenses/", headers=header, json=payload)
+    assert response.status_code == 200
+    e_id = response.json()["expense_id"]
+
+    response = client.post(f"/expenses/submit/{e_id}", headers=header)
+    assert response.status_code == 200
+    return e_id
+
+
+def test_approve_twice():
+    """
+    Tests POST /expenses/approve/EID on an expense that was already approved.
+    It expects the second approval to fail with a 404 and leave the approval untouched.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+    e_id = create_submitted_expense(header)
+
+    response = client.post(f"/expenses/approve/{e_id}", headers=header)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "accepted"
+    assert data["approved_at"] is not None
+
+    response = client.post(f"/expenses/approve/{e_id}", headers=header)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Only submitted expenses can be approved!"
+
+    # an accepted expense can not be rejected or deleted any more
+    response = client.post(f"/expenses/reject/{e_id}", headers=header, json={"rejection_reason": "the reason is not good enough"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Only submitted expenses can be rejected!"
+
+    response = client.delete(f"/expenses/delete/{e_id}", headers=header)
+    assert response.status_code == 404
+
+
+def test_transition_on_missing_expense():
+    """
+    Tests the transitions on an expense id that does not exist.
+    It expects the not found errors of the lookup helpers.
+    """
+    token = get_auth_token()
+    header = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("/expenses/submit/EID-MISSING", headers=header)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Expense does not exist or youre not the creator"
+
+    response = client.post("/expenses/approve/EID-MISSING", headers=header)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Expense does not exist or youre not an approver"
+
+    response = client.delete("/expenses/delete/EID-MISSING", headers=header)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Expense does not exist or youre not the creator"
+
+
+def get_auth_token():
+
+    payload = {
+    "username": "patson",
+    "password": "password"
+    }
+    response = client.post("/login", json=payload)
+
+    response_data = response.json()
+    token = response_data.get("access_token")
+    return token